@@ -0,0 +1,175 @@
+"""
+Headless access to the engine and the conversation store, without the web
+server. Run from the backend directory:
+
+    python -m app.cli run "Should I use Postgres or MongoDB?"
+    python -m app.cli batch prompts.txt -o results.ndjson --workers 4 --concurrency 8
+    python -m app.cli export -o history.ndjson --since 2025-01-01
+    python -m app.cli export --format parquet --table responses -o responses.parquet
+    python -m app.cli import history.ndjson data/archive/conversations-2025-01.ndjson.gz
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import sys
+from app.config.settings import get_run_profile
+from app.engine import batch, bulk
+from app.utils.serialization import dumps, parse_fields, project
+
+# Read and write 1 MiB at a time so files of any size stream through
+CHUNK_SIZE = 1024 * 1024
+
+
+def _log_to_stderr():
+    """Engine loggers write to stdout, which carries exports and run output."""
+    for logger in logging.Logger.manager.loggerDict.values():
+        for handler in getattr(logger, "handlers", []):
+            if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+                handler.setStream(sys.stderr)
+
+
+def _profile_error(profile) -> bool:
+    try:
+        get_run_profile(profile)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return True
+    return False
+
+
+def run(args) -> int:
+    if _profile_error(args.profile):
+        return 2
+    # The engine prints progress; stdout carries only the result
+    with contextlib.redirect_stdout(sys.stderr):
+        state = asyncio.run(batch.AntigravityEngine().run(
+            args.prompt, model_count=max(1, min(4, args.model_count)), use_cache=not args.no_cache, profile=args.profile
+        ))
+    data = project(state.model_dump(mode="json"), parse_fields(args.fields))
+    sys.stdout.buffer.write(dumps(data) + b"\n")
+    return 0
+
+
+def batch_(args) -> int:
+    if _profile_error(args.profile):
+        return 2
+    options = {
+        "model_count": args.model_count,
+        "use_cache": not args.no_cache,
+        "profile": args.profile,
+        "fields": parse_fields(args.fields),
+    }
+    with open(args.prompts, encoding="utf-8") as f, contextlib.redirect_stdout(sys.stderr):
+        report = batch.run_batch(
+            batch.read_prompts(f), args.output, options,
+            workers=args.workers, concurrency=args.concurrency, resume=not args.restart
+        )
+    print(json.dumps(report, indent=2))
+    return 1 if report["failed"] else 0
+
+
+def _filters(args) -> dict:
+    return {"since": args.since, "until": args.until, "intent": args.intent, "model": args.model}
+
+
+def export(args) -> int:
+    if args.format == "parquet":
+        if args.table is None:
+            print("Parquet export needs --table", file=sys.stderr)
+            return 2
+        if not bulk.parquet_available():
+            print("Parquet export requires pyarrow (pip install pyarrow)", file=sys.stderr)
+            return 2
+        chunks = bulk.export_parquet(args.table, **_filters(args))
+    else:
+        chunks = bulk.export_ndjson(args.table, **_filters(args))
+
+    if args.output == "-":
+        if args.format == "parquet":
+            print("Parquet export needs an output file (-o)", file=sys.stderr)
+            return 2
+        out = sys.stdout.buffer
+        for chunk in chunks:
+            out.write(chunk)
+        out.flush()
+        return 0
+    with open(args.output, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    return 0
+
+
+def _read_chunks(f):
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_(args) -> int:
+    totals = {"imported": 0, "skipped": 0, "failed": 0, "errors": []}
+    for path in args.files:
+        if path == "-":
+            report = bulk.import_stream(_read_chunks(sys.stdin.buffer), overwrite=args.overwrite)
+        else:
+            with open(path, "rb") as f:
+                report = bulk.import_stream(_read_chunks(f), overwrite=args.overwrite)
+        for key in ("imported", "skipped", "failed"):
+            totals[key] += report[key]
+        totals["errors"].extend(f"{path}: {e}" for e in report["errors"])
+    print(json.dumps(totals, indent=2))
+    return 1 if totals["failed"] else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Run the consensus engine and move conversations in bulk.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def engine_options(command):
+        command.add_argument("--model-count", type=int, default=4, help="Council models per run (1-4)")
+        command.add_argument("--profile", help="Run profile, e.g. fast, balanced or thorough")
+        command.add_argument("--no-cache", action="store_true", help="Never answer from the semantic cache")
+        command.add_argument("--fields", help="Comma-separated state fields to output, e.g. consensus,model_responses")
+
+    runner = commands.add_parser("run", help="Run one prompt and print the resulting state as JSON")
+    runner.add_argument("prompt")
+    engine_options(runner)
+    runner.set_defaults(run=run)
+
+    batcher = commands.add_parser("batch", help="Run a file of prompts, appending NDJSON results as they finish")
+    batcher.add_argument("prompts", help="One prompt per line, or JSON lines with prompt, id, model_count, profile")
+    batcher.add_argument("-o", "--output", required=True, help="NDJSON results file; also the checkpoint a rerun resumes from")
+    batcher.add_argument("--workers", type=int, default=1, help="Worker processes, each with its own event loop")
+    batcher.add_argument("--concurrency", type=int, default=4, help="Runs in flight per worker")
+    batcher.add_argument("--restart", action="store_true", help="Discard earlier results instead of resuming")
+    engine_options(batcher)
+    batcher.set_defaults(run=batch_)
+
+    exporter = commands.add_parser("export", help="Stream saved conversations to NDJSON or Parquet")
+    exporter.add_argument("-o", "--output", default="-", help="Output file ('-' for stdout, the default)")
+    exporter.add_argument("--format", choices=["ndjson", "parquet"], default="ndjson")
+    exporter.add_argument("--table", choices=list(bulk.TABLES), help="Flat rows instead of whole conversations")
+    exporter.add_argument("--since", help="Only conversations saved at or after this ISO timestamp")
+    exporter.add_argument("--until", help="Only conversations saved before this ISO timestamp")
+    exporter.add_argument("--intent", help="Only conversations with this intent")
+    exporter.add_argument("--model", help="Only conversations (and rows) involving this model id")
+    exporter.set_defaults(run=export)
+
+    importer = commands.add_parser("import", help="Import NDJSON conversations (plain or gzipped)")
+    importer.add_argument("files", nargs="+", help="Files to import ('-' for stdin)")
+    importer.add_argument("--overwrite", action="store_true", help="Replace conversations that already exist")
+    importer.set_defaults(run=import_)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    _log_to_stderr()
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
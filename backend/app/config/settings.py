@@ -1,7 +1,15 @@
 from pydantic import BaseModel, field_validator
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Any
+from dotenv import load_dotenv
+import json
+import os
 import re
 
+load_dotenv()
+
+# Providers with a direct key and route of their own (besides OpenRouter and Groq)
+NATIVE_PROVIDERS = ["openai", "anthropic", "gemini"]
+
 class ApiKeys(BaseModel):
     """
     API key configuration supporting multiple LLM providers.
@@ -11,6 +19,10 @@ class ApiKeys(BaseModel):
     openrouter_api_key: Optional[str] = None
     groq_api_key: Optional[str] = None
     
+    # Additional keys per provider; requests are spread over the primary key and these
+    openrouter_extra_keys: List[str] = []
+    groq_extra_keys: List[str] = []
+    
     # Legacy/alternative keys (for backward compatibility)
     openai_api_key: Optional[str] = None
     anthropic_api_key: Optional[str] = None
@@ -50,9 +62,26 @@ class ApiKeys(BaseModel):
         """Check if Groq API key is configured."""
         return bool(self.groq_api_key and self.groq_api_key.strip())
     
+    def has_native(self, provider_id: str) -> bool:
+        """Check if a direct OpenAI, Anthropic or Gemini key is configured."""
+        key = {"openai": self.openai_api_key, "anthropic": self.anthropic_api_key, "gemini": self.gemini_api_key}.get(provider_id)
+        return bool(key and key.strip())
+    
+    def key_pool(self, provider_id: str) -> List[str]:
+        """All keys configured for a provider, primary key first, without duplicates."""
+        if provider_id == "openrouter" and self.has_openrouter():
+            keys = [self.openrouter_api_key] + self.openrouter_extra_keys
+        elif provider_id == "groq" and self.has_groq():
+            keys = [self.groq_api_key] + self.groq_extra_keys
+        elif self.has_native(provider_id):
+            keys = [getattr(self, f"{provider_id}_api_key")]
+        else:
+            return []
+        return list(dict.fromkeys(k.strip() for k in keys if k and k.strip()))
+    
     def has_any_key(self) -> bool:
         """Check if any API key is configured."""
-        return self.has_openrouter() or self.has_groq()
+        return self.has_openrouter() or self.has_groq() or any(self.has_native(p) for p in NATIVE_PROVIDERS)
     
     def get_available_providers(self) -> List[str]:
         """Get list of available providers based on configured keys."""
@@ -61,6 +90,7 @@ class ApiKeys(BaseModel):
             providers.append("openrouter")
         if self.has_groq():
             providers.append("groq")
+        providers.extend(p for p in NATIVE_PROVIDERS if self.has_native(p))
         return providers
     
     def get_status(self) -> Dict[str, any]:
@@ -68,11 +98,21 @@ class ApiKeys(BaseModel):
         return {
             "openrouter": {
                 "configured": self.has_openrouter(),
-                "key_prefix": self.openrouter_api_key[:12] + "..." if self.has_openrouter() else None
+                "key_prefix": self.openrouter_api_key[:12] + "..." if self.has_openrouter() else None,
+                "pool_size": len(self.key_pool("openrouter"))
             },
             "groq": {
                 "configured": self.has_groq(),
-                "key_prefix": self.groq_api_key[:8] + "..." if self.has_groq() else None
+                "key_prefix": self.groq_api_key[:8] + "..." if self.has_groq() else None,
+                "pool_size": len(self.key_pool("groq"))
+            },
+            **{
+                provider_id: {
+                    "configured": self.has_native(provider_id),
+                    "key_prefix": getattr(self, f"{provider_id}_api_key")[:8] + "..." if self.has_native(provider_id) else None,
+                    "pool_size": len(self.key_pool(provider_id))
+                }
+                for provider_id in NATIVE_PROVIDERS
             },
             "available_providers": self.get_available_providers()
         }
@@ -105,3 +145,241 @@ def update_keys(openrouter_key: Optional[str] = None, groq_key: Optional[str] =
         runtime_keys.groq_api_key = groq_key.strip() if groq_key.strip() else None
     
     return runtime_keys
+
+
+class RunProfile(BaseModel):
+    """
+    Execution profile selected per request: which optional layers run,
+    which models handle utility calls, and per-stage timeouts / max_tokens.
+    Stages: normalization, execution, claims, peer_review, synthesis.
+    """
+    name: str
+    # Layer 1 via LLM; False uses the local fallback normalization
+    llm_normalization: bool = True
+    # Layer 4 via LLM; False splits responses into sentence claims locally
+    llm_claims: bool = True
+    # Layer 4.5 on/off and how many council models review
+    peer_review: bool = True
+    max_reviewers: int = 2
+    # Utility model per provider id, e.g. {"groq": "llama-3.1-8b-instant"}
+    utility_models: Dict[str, str] = {}
+    # Per-stage request timeout in seconds
+    stage_timeouts: Dict[str, float] = {}
+    # Per-stage max_tokens; stages not listed use the provider's default
+    max_tokens: Dict[str, int] = {"execution": 2048}
+    # Size council max_tokens to the prompt's intent (see app.engine.budgets);
+    # max_tokens["execution"] is then only used for intents with no budget
+    intent_budgets: bool = True
+
+    def utility_model(self, provider_id: Optional[str]) -> Optional[str]:
+        """Model override for utility calls on this provider, if any."""
+        return self.utility_models.get(provider_id) if provider_id else None
+
+    def completion_kwargs(self, stage: str) -> Dict[str, Any]:
+        """Extra chat.completions.create arguments for a stage."""
+        kwargs: Dict[str, Any] = {}
+        if stage in self.max_tokens:
+            kwargs["max_tokens"] = self.max_tokens[stage]
+        if stage in self.stage_timeouts:
+            kwargs["timeout"] = self.stage_timeouts[stage]
+        return kwargs
+
+
+# Built-in profiles; "balanced" matches the original eight-layer pipeline
+DEFAULT_RUN_PROFILES: Dict[str, RunProfile] = {
+    "fast": RunProfile(
+        name="fast",
+        llm_normalization=False,
+        llm_claims=False,
+        peer_review=False,
+        utility_models={"openrouter": "openai/gpt-4o-mini", "groq": "llama-3.1-8b-instant"},
+        stage_timeouts={"execution": 4.0, "synthesis": 3.0},
+        max_tokens={"execution": 512, "synthesis": 512},
+        intent_budgets=False,
+    ),
+    "balanced": RunProfile(name="balanced"),
+    "thorough": RunProfile(
+        name="thorough",
+        max_reviewers=3,
+        stage_timeouts={"normalization": 30.0, "execution": 120.0, "claims": 60.0, "peer_review": 90.0, "synthesis": 120.0},
+        max_tokens={"execution": 4096, "claims": 1024, "peer_review": 1024, "synthesis": 4096},
+        intent_budgets=False,
+    ),
+}
+
+
+class EngineSettings(BaseModel):
+    """
+    Server-side tuning for the consensus engine.
+    Every field can be overridden with an environment variable of the same
+    name in upper case (e.g. COALESCE_REQUESTS=false).
+    """
+    # Single-flight: concurrent identical runs share one execution
+    coalesce_requests: bool = True
+    # Also coalesce on the raw prompt, before normalization has run
+    coalesce_raw_prompt: bool = True
+    # Semantic cache: reuse the consensus of a near-identical past prompt
+    semantic_cache_enabled: bool = False
+    # "return" answers from the cache, "offer" attaches the match without a consensus
+    semantic_cache_mode: str = "return"
+    semantic_cache_threshold: float = 0.92
+    # Partitions at least this large switch from brute force to an LSH index (0 disables)
+    semantic_cache_ann_min_size: int = 20000
+    # Checkpoint each layer's output so failed runs can resume where they stopped
+    checkpoints_enabled: bool = True
+    # Automatic retries of a layer that raised, before the run is marked failed
+    layer_retries: int = 1
+    # Cancel in-flight model calls when the client disconnects
+    cancel_on_disconnect: bool = True
+    # Seconds between client connection checks while a run is in flight
+    disconnect_poll_interval: float = 0.5
+    # Early exit: stop querying models once their claims agree
+    early_exit_enabled: bool = False
+    early_exit_agreement: float = 0.75
+    early_exit_min_responses: int = 2
+    # After an early exit, peer review is "skip"ped or "reduce"d to one reviewer
+    early_exit_peer_review: str = "skip"
+    # Speculative execution: query the council with the raw prompt while normalizing
+    speculative_execution: bool = False
+    # Keep speculative responses if the prompts are at least this similar
+    speculation_threshold: float = 0.9
+    # Race the chairman synthesis across providers and keep the first valid answer
+    chairman_race: bool = False
+    # "provider:model" candidates; only those whose provider has a key take part
+    chairman_candidates: List[str] = ["openrouter:openai/gpt-4o-mini", "groq:llama-3.3-70b-versatile"]
+    # Send cache_control breakpoints on the fixed prompt prefix where the route supports them
+    prompt_cache_hints: bool = True
+    # Split prompts longer than chunk_threshold_chars and map-reduce the council over the parts
+    chunked_mode: bool = True
+    chunk_threshold_chars: int = 24000
+    # Size of each part and how much of the previous part it repeats
+    chunk_chars: int = 12000
+    chunk_overlap_chars: int = 400
+    # Parts run through the council at the same time (also bounds parts held in memory)
+    chunk_parallelism: int = 3
+    # Partial answers merged per reduce call; more are reduced hierarchically
+    reduce_fanout: int = 8
+    # Head+tail of a large prompt used to normalize the task when none is given
+    chunk_preview_chars: int = 2000
+    # Council max_tokens per "intent" or "intent:domain", e.g. {"explain_concept": 768}
+    output_budgets: Dict[str, int] = {}
+    # Learn budgets from the answer lengths of stored conversations
+    learned_budgets: bool = True
+    # Learned budget = this percentile of observed answer tokens times the headroom
+    budget_percentile: float = 0.9
+    budget_headroom: float = 1.25
+    # Observed answers needed before a learned budget is used
+    budget_min_samples: int = 20
+    # Bounds for any intent budget
+    min_output_tokens: int = 256
+    max_output_tokens: int = 4096
+    # Local OpenAI-compatible server, e.g. "http://localhost:11434/v1" (Ollama); unset disables it
+    local_base_url: Optional[str] = None
+    local_model: str = "qwen2.5:1.5b-instruct"
+    # Provider per engine stage, e.g. {"normalization": "local", "claims": "local", "peer_review": "local"};
+    # stages fall back to the usual provider order when theirs is unavailable
+    stage_providers: Dict[str, str] = {}
+    # API base URL per provider id, e.g. {"anthropic": "http://localhost:9000/v1"} for a stub server
+    provider_base_urls: Dict[str, str] = {}
+    # How long a pooled key sits out after a 429 without Retry-After, and after a 401/403
+    key_bench_seconds: float = 30.0
+    key_auth_bench_seconds: float = 600.0
+    # Store conversations as compressed, sectioned .qcp packs instead of indented JSON
+    # (legacy .json files are always readable)
+    compact_storage: bool = True
+    # Store response texts and claim lists of at least blob_min_bytes once, in the
+    # content-addressed blob store (data/blobs.sqlite), and reference them from packs
+    blob_dedup: bool = True
+    blob_min_bytes: int = 256
+    # Storage maintenance, run in the background every compaction_interval_seconds (0 disables it)
+    compaction_interval_seconds: float = 3600.0
+    # Conversations older than this move from their own files into append-only segments
+    compact_after_days: float = 7.0
+    segment_max_bytes: int = 64 * 1024 * 1024
+    # Segments with less live data than this share of their size are rewritten
+    segment_min_live_ratio: float = 0.5
+    # Retention limits (unset means unlimited); the oldest conversations go first
+    retention_max_age_days: Optional[float] = None
+    retention_max_count: Optional[int] = None
+    # Total bytes of packs, referenced blobs and checkpoints
+    retention_max_bytes: Optional[int] = None
+    # Append expired conversations to data/archive/conversations-YYYY-MM.ndjson.gz before deleting them
+    archive_expired: bool = True
+    # Where CPU-heavy stages (clustering, scoring, packing for persistence) run: "thread" pool,
+    # "process" pool (parallel across cores) or "off" (inline on the event loop)
+    cpu_offload: str = "thread"
+    # Pool size; 0 uses the number of CPUs
+    cpu_pool_workers: int = 0
+    # Offloaded jobs allowed in the pool at once; further jobs wait (reported as queue_wait_ms)
+    cpu_pool_max_pending: int = 64
+    # Claim / cluster counts below this run inline, where a pool hop would cost more than it saves
+    cpu_offload_min_items: int = 40
+    # Target event-loop lag; while exceeded, even small jobs are offloaded
+    event_loop_lag_bound_ms: float = 50.0
+    # How often the event-loop lag is sampled (0 disables the probe)
+    event_loop_lag_probe_seconds: float = 0.5
+    # Provider HTTP transport: "live"; "record" (live, appending every exchange to
+    # provider_cassette); or "replay" (answered from provider_cassette, offline)
+    provider_transport: str = "live"
+    # Cassette file to record to or replay from (default data/cassettes/providers.ndjson)
+    provider_cassette: Optional[str] = None
+    # Replayed latencies are the recorded ones times this (0 answers at once)
+    replay_time_scale: float = 1.0
+    # Keep the SQLite full-text index behind /conversations/search up to date on every save
+    search_index_enabled: bool = True
+    # Update the per-model rollups behind /analytics/models on every save
+    model_analytics_enabled: bool = True
+    # Profile used when a request does not name one
+    default_profile: str = "balanced"
+    # Extra or overriding profiles, e.g. RUN_PROFILES='{"chat": {"peer_review": false}}'
+    run_profiles: Dict[str, Dict[str, Any]] = {}
+    # Serialize engine state directly (orjson / pydantic-core) instead of re-validating it
+    fast_json_responses: bool = True
+    # Compress JSON responses at least this many bytes long (-1 disables)
+    response_compression_min_size: int = 1024
+
+    @classmethod
+    def from_env(cls) -> "EngineSettings":
+        """Build settings from defaults overridden by environment variables."""
+        overrides = {}
+        for field_name in cls.model_fields:
+            value = os.getenv(field_name.upper())
+            if value is not None and value.strip():
+                value = value.strip()
+                # Structured settings are given as JSON
+                if value[0] in "{[":
+                    value = json.loads(value)
+                overrides[field_name] = value
+        return cls(**overrides)
+
+
+# Global engine settings, loaded once from the environment
+engine_settings = EngineSettings.from_env()
+
+def get_engine_settings() -> EngineSettings:
+    """Get the current engine settings."""
+    return engine_settings
+
+def set_engine_settings(settings: EngineSettings):
+    """Replace the engine settings (used by tests and admin tooling)."""
+    global engine_settings
+    engine_settings = settings
+
+def get_run_profile(name: Optional[str] = None) -> RunProfile:
+    """
+    Resolve a profile by name (default_profile if None).
+    Server-side run_profiles override or extend the built-in profiles.
+    Raises ValueError for unknown names.
+    """
+    settings = get_engine_settings()
+    name = name or settings.default_profile
+    if name in settings.run_profiles:
+        base = DEFAULT_RUN_PROFILES.get(name, RunProfile(name=name))
+        return RunProfile(**{**base.model_dump(), **settings.run_profiles[name], "name": name})
+    if name in DEFAULT_RUN_PROFILES:
+        return DEFAULT_RUN_PROFILES[name]
+    raise ValueError(f"Unknown run profile '{name}'")
+
+def list_run_profiles() -> List[str]:
+    """Names of all selectable profiles."""
+    return sorted(set(DEFAULT_RUN_PROFILES) | set(get_engine_settings().run_profiles))
@@ -0,0 +1,70 @@
+import re
+from typing import List, Optional
+import numpy as np
+from app.models import ModelResponse
+from app.engine.embeddings import embed_text
+
+# Claims are approximated by sentences, as in the claim-extraction fallback
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def split_claims(text: str, limit: int = 12) -> List[str]:
+    """Split a response into sentence-level claims, skipping short fragments."""
+    sentences = [s.strip(" -*#\t") for s in _SENTENCE_RE.split(text)]
+    claims = [s for s in sentences if len(s) > 20]
+    return claims[:limit] or [text.strip()[:500]]
+
+def is_usable(response: ModelResponse) -> bool:
+    """Failed calls carry an error string instead of an answer."""
+    return response.model_id != "system" and not response.response_text.startswith("Error")
+
+
+class AgreementTracker:
+    """
+    Incrementally compares the claims of council responses as they arrive.
+
+    Each response's claims are embedded once. Agreement between two responses
+    is the mean, over both directions, of how well each claim is matched by
+    the closest claim of the other response. Overall agreement is the weakest
+    pairwise agreement, so one dissenting model keeps the council going.
+    """
+    def __init__(self, threshold: float, min_responses: int = 2):
+        self.threshold = threshold
+        self.min_responses = max(2, min_responses)
+        self._claims: List[np.ndarray] = []
+        self.agreement: Optional[float] = None
+        self.stopped_early = False
+        self.responses_seen = 0
+        self.total = 0
+
+    @staticmethod
+    def _coverage(a: np.ndarray, b: np.ndarray) -> float:
+        similarities = a @ b.T
+        return float((similarities.max(axis=1).mean() + similarities.max(axis=0).mean()) / 2)
+
+    def add(self, response: ModelResponse) -> bool:
+        """Record a response; returns True once the agreement threshold is reached."""
+        self.responses_seen += 1
+        if not is_usable(response):
+            return False
+
+        claims = np.stack([embed_text(c) for c in split_claims(response.response_text)])
+        pairwise = [self._coverage(claims, other) for other in self._claims]
+        self._claims.append(claims)
+        if pairwise:
+            self.agreement = min(pairwise) if self.agreement is None else min(self.agreement, *pairwise)
+
+        return (
+            len(self._claims) >= self.min_responses
+            and self.agreement is not None
+            and self.agreement >= self.threshold
+        )
+
+    def trace_entry(self, peer_review_mode: str) -> dict:
+        """Reasoning-trace record of the early-exit decision."""
+        return {
+            "step": "early_exit",
+            "details": (
+                f"Stopped after {self.responses_seen}/{self.total} models at agreement "
+                f"{self.agreement:.2f} (threshold {self.threshold}); peer review {peer_review_mode}"
+            )
+        }
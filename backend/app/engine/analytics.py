@@ -0,0 +1,230 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.engine.search_index import INDEX_PATH
+from app.utils.logger import get_logger
+from app.utils.serialization import dumps, loads
+
+logger = get_logger(__name__)
+
+# Additive counters kept per (model, day, intent, domain); averages and rates are derived on read
+COUNTERS = (
+    "responses", "errors", "latency_ms_total", "latency_samples", "tokens",
+    "reviews", "review_score_total", "supporting", "conflicting",
+)
+
+# The last contribution of each conversation is kept so a re-save (e.g. a resume)
+# replaces it instead of counting the conversation twice
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS model_rollups (
+    model_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    {", ".join(f"{c} REAL NOT NULL DEFAULT 0" for c in COUNTERS)},
+    PRIMARY KEY (model_id, day, intent, domain)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS analytics_contributions (id TEXT PRIMARY KEY, rows TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS analytics_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+_UPSERT = (
+    f"INSERT INTO model_rollups (model_id, day, intent, domain, {', '.join(COUNTERS)}) "
+    f"VALUES (?, ?, ?, ?, {', '.join('?' * len(COUNTERS))}) "
+    f"ON CONFLICT (model_id, day, intent, domain) DO UPDATE SET "
+    + ", ".join(f"{c} = {c} + excluded.{c}" for c in COUNTERS)
+)
+
+GROUPS = ("day", "intent", "domain")
+
+def contribution(timestamp: str, state: Dict[str, Any]) -> List[List[Any]]:
+    """
+    Rollup rows a stored run adds: [model_id, day, intent, domain, *COUNTERS]
+    for every council model that answered.
+    """
+    normalized = state.get("normalized") or {}
+    key = ((timestamp or "")[:10], normalized.get("intent") or "", normalized.get("domain") or "")
+    counters: Dict[str, Dict[str, float]] = {}
+
+    def model(model_id: str) -> Dict[str, float]:
+        return counters.setdefault(model_id, dict.fromkeys(COUNTERS, 0))
+
+    for r in state.get("model_responses") or []:
+        model_id = r.get("model_id")
+        if not model_id or model_id == "system":
+            continue
+        c = model(model_id)
+        c["responses"] += 1
+        if str(r.get("response_text", "")).startswith("Error"):
+            c["errors"] += 1
+        else:
+            c["tokens"] += r.get("token_count") or 0
+        if r.get("latency_ms") is not None:
+            c["latency_ms_total"] += r["latency_ms"]
+            c["latency_samples"] += 1
+    for review in state.get("peer_reviews") or []:
+        if review.get("reviewed_model") in counters:
+            c = counters[review["reviewed_model"]]
+            c["reviews"] += 1
+            c["review_score_total"] += sum(
+                review.get(k) or 0 for k in ("accuracy_score", "insight_score", "constraint_adherence")
+            ) / 3
+    for cluster in state.get("scored_clusters") or state.get("agreement_clusters") or []:
+        for model_id in cluster.get("supporting_models") or []:
+            if model_id in counters:
+                counters[model_id]["supporting"] += 1
+        for model_id in cluster.get("conflicting_models") or []:
+            if model_id in counters:
+                counters[model_id]["conflicting"] += 1
+    return [[model_id, *key, *(c[name] for name in COUNTERS)] for model_id, c in counters.items()]
+
+def summarize(counters: Dict[str, float]) -> Dict[str, Any]:
+    """Derived per-model figures from summed counters."""
+    responses = counters["responses"]
+    answered = responses - counters["errors"]
+    placed = counters["supporting"] + counters["conflicting"]
+    return {
+        "responses": int(responses),
+        "errors": int(counters["errors"]),
+        "error_rate": round(counters["errors"] / responses, 3) if responses else 0.0,
+        "avg_latency_ms": round(counters["latency_ms_total"] / counters["latency_samples"], 1) if counters["latency_samples"] else None,
+        "tokens": int(counters["tokens"]),
+        "avg_tokens": round(counters["tokens"] / answered, 1) if answered else None,
+        "reviews": int(counters["reviews"]),
+        "avg_review_score": round(counters["review_score_total"] / counters["reviews"], 2) if counters["reviews"] else None,
+        "supporting": int(counters["supporting"]),
+        "conflicting": int(counters["conflicting"]),
+        "support_rate": round(counters["supporting"] / placed, 3) if placed else None,
+    }
+
+
+class ModelAnalytics:
+    """
+    Per-model performance rollups (latency, errors, tokens, peer-review score,
+    supporting vs conflicting claims) by day, intent and domain. Updated
+    incrementally by save_conversation, so reads cost the number of rollup
+    rows, not the number of conversations. Deleting or expiring a
+    conversation does not remove it from the rollups.
+    """
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _apply(self, db: sqlite3.Connection, conversation_id: str, timestamp: str, state: Dict[str, Any]):
+        previous = db.execute("SELECT rows FROM analytics_contributions WHERE id = ?", (conversation_id,)).fetchone()
+        if previous is not None:
+            for row in loads(previous[0]):
+                db.execute(_UPSERT, (*row[:4], *(-v for v in row[4:])))
+        rows = contribution(timestamp, state)
+        for row in rows:
+            db.execute(_UPSERT, row)
+        db.execute("REPLACE INTO analytics_contributions (id, rows) VALUES (?, ?)", (conversation_id, dumps(rows).decode()))
+
+    def record(self, conversation_id: str, timestamp: str, state: Dict[str, Any]):
+        """Add a saved conversation to the rollups, replacing its earlier contribution."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                self._apply(db, conversation_id, timestamp, state)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def ensure_built(self, conversations: Optional[Iterable[Dict[str, Any]]] = None):
+        """Backfill from the stored conversations once per database."""
+        with self._lock:
+            db = self._db()
+            if db.execute("SELECT value FROM analytics_meta WHERE key = 'backfilled'").fetchone():
+                return
+            if conversations is None:
+                from app.engine.persistence import iter_conversations
+                conversations = iter_conversations(
+                    ["normalized", "model_responses", "peer_reviews", "scored_clusters", "agreement_clusters"]
+                )
+            started = time.perf_counter()
+            count = 0
+            db.execute("BEGIN")
+            try:
+                for data in conversations:
+                    if data.get("id"):
+                        self._apply(db, data["id"], data.get("timestamp") or "", data.get("state") or {})
+                        count += 1
+                db.execute("INSERT OR REPLACE INTO analytics_meta (key, value) VALUES ('backfilled', '1')")
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            logger.info(f"Model analytics backfilled from {count} conversations in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def models(
+        self,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        intent: Optional[str] = None,
+        domain: Optional[str] = None,
+        model: Optional[str] = None,
+        group_by: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Per-model figures, optionally per day, intent or domain as well.
+        since / until: Days (YYYY-MM-DD, or ISO timestamps), inclusive.
+        """
+        if group_by is not None and group_by not in GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+        self.ensure_built()
+        where: List[str] = []
+        params: List[Any] = []
+        for clause, value in (
+            ("day >= ?", since[:10] if since else None),
+            ("day <= ?", until[:10] if until else None),
+            ("intent = ?", intent),
+            ("domain = ?", domain),
+            ("model_id = ?", model),
+        ):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        keys = ["model_id"] + ([group_by] if group_by else [])
+        sql = (
+            f"SELECT {', '.join(keys)}, {', '.join(f'SUM({c})' for c in COUNTERS)} FROM model_rollups"
+            + (f" WHERE {' AND '.join(where)}" if where else "")
+            + f" GROUP BY {', '.join(keys)} ORDER BY {', '.join(keys)}"
+        )
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+        results = []
+        for row in rows:
+            counters = dict(zip(COUNTERS, row[len(keys):]))
+            if not counters["responses"]:
+                continue
+            results.append({**dict(zip(keys, row[:len(keys)])), **summarize(counters)})
+        return results
+
+    def scores(self, intent: Optional[str] = None, domain: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """All-time figures by model id, for routing decisions."""
+        return {r["model_id"]: r for r in self.models(intent=intent, domain=domain)}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Global rollups shared by persistence, the API and routing
+model_analytics = ModelAnalytics()
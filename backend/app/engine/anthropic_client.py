@@ -0,0 +1,212 @@
+import json
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+import httpx
+from openai import APIStatusError
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from openai.types.completion_usage import PromptTokensDetails
+
+ANTHROPIC_BASE_URL = "https://api.anthropic.com/v1"
+ANTHROPIC_VERSION = "2023-06-01"
+# The Messages API requires max_tokens
+DEFAULT_MAX_TOKENS = 4096
+
+_JSON_INSTRUCTION = "Respond only with a single valid JSON object and nothing else."
+_FINISH_REASONS = {"end_turn": "stop", "stop_sequence": "stop", "max_tokens": "length", "tool_use": "tool_calls"}
+
+
+def _blocks(content: Union[str, List[Dict[str, Any]]]) -> Union[str, List[Dict[str, Any]]]:
+    """OpenAI content parts as Anthropic content blocks (text parts carry cache_control over)."""
+    if isinstance(content, str):
+        return content
+    blocks = []
+    for part in content:
+        if part.get("type") == "text":
+            block = {"type": "text", "text": part["text"]}
+            if "cache_control" in part:
+                block["cache_control"] = part["cache_control"]
+            blocks.append(block)
+    return blocks
+
+def to_anthropic_request(
+    model: str,
+    messages: List[Dict[str, Any]],
+    response_format: Optional[Dict[str, Any]] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    stream: bool = False
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Translate chat.completions arguments into a Messages API body.
+    JSON mode has no native switch, so it is asked for in the system prompt and
+    the assistant turn is prefilled with "{". Returns (body, prefill).
+    """
+    system: List[Dict[str, Any]] = []
+    turns = []
+    for message in messages:
+        if message["role"] == "system":
+            content = _blocks(message["content"])
+            system.extend([{"type": "text", "text": content}] if isinstance(content, str) else content)
+        else:
+            turns.append({"role": message["role"], "content": _blocks(message["content"])})
+
+    prefill = ""
+    if response_format and response_format.get("type") in ("json_object", "json_schema"):
+        system.append({"type": "text", "text": _JSON_INSTRUCTION})
+        prefill = "{"
+        turns.append({"role": "assistant", "content": prefill})
+
+    body: Dict[str, Any] = {"model": model, "messages": turns, "max_tokens": max_tokens or DEFAULT_MAX_TOKENS}
+    if system:
+        body["system"] = system
+    if temperature is not None:
+        body["temperature"] = temperature
+    if stream:
+        body["stream"] = True
+    return body, prefill
+
+def _usage(usage: Dict[str, Any]) -> CompletionUsage:
+    cached = usage.get("cache_read_input_tokens") or 0
+    prompt = (usage.get("input_tokens") or 0) + cached + (usage.get("cache_creation_input_tokens") or 0)
+    completion = usage.get("output_tokens") or 0
+    return CompletionUsage(
+        prompt_tokens=prompt,
+        completion_tokens=completion,
+        total_tokens=prompt + completion,
+        prompt_tokens_details=PromptTokensDetails(cached_tokens=cached)
+    )
+
+def to_chat_completion(data: Dict[str, Any], prefill: str = "") -> ChatCompletion:
+    """Translate a Messages API response into a ChatCompletion."""
+    text = "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+    return ChatCompletion(
+        id=data.get("id", f"msg_{uuid.uuid4().hex}"),
+        object="chat.completion",
+        created=int(time.time()),
+        model=data.get("model", ""),
+        choices=[{
+            "index": 0,
+            "finish_reason": _FINISH_REASONS.get(data.get("stop_reason"), "stop"),
+            "message": {"role": "assistant", "content": prefill + text}
+        }],
+        usage=_usage(data.get("usage") or {})
+    )
+
+
+class _Completions:
+    def __init__(self, client: "AnthropicClient"):
+        self._client = client
+
+    async def create(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        response_format: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        stream: bool = False,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> Union[ChatCompletion, AsyncIterator[ChatCompletionChunk]]:
+        """Same call shape as AsyncOpenAI's chat.completions.create."""
+        body, prefill = to_anthropic_request(model, messages, response_format, max_tokens, temperature, stream)
+        if stream:
+            return self._client._stream(body, prefill, timeout)
+        response = await self._client._post("/messages", body, timeout)
+        return to_chat_completion(response.json(), prefill)
+
+
+class _Models:
+    def __init__(self, client: "AnthropicClient"):
+        self._client = client
+
+    async def list(self) -> SimpleNamespace:
+        """Available models, newest first, as objects with an `id`."""
+        response = await self._client._request("GET", "/models", None, None)
+        return SimpleNamespace(data=[SimpleNamespace(id=m["id"]) for m in response.json().get("data", [])])
+
+
+class AnthropicClient:
+    """
+    Direct Anthropic Messages API client with the subset of the AsyncOpenAI
+    interface the engine uses: chat.completions.create (including JSON mode,
+    cache_control content parts, usage with cached tokens and stream=True)
+    and models.list.
+    http_client: Optional httpx client, e.g. one routing requests through the
+        key pool (which then sets x-api-key per request) or a stub server.
+    """
+    def __init__(self, api_key: str, base_url: str = ANTHROPIC_BASE_URL, http_client: Optional[httpx.AsyncClient] = None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self._http = http_client or httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=5.0))
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.models = _Models(self)
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-api-key": self.api_key, "anthropic-version": ANTHROPIC_VERSION, "content-type": "application/json"}
+
+    async def _request(self, method: str, path: str, body: Optional[Dict[str, Any]], timeout: Optional[float]) -> httpx.Response:
+        kwargs: Dict[str, Any] = {"headers": self._headers()}
+        if body is not None:
+            kwargs["json"] = body
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        response = await self._http.request(method, self.base_url + path, **kwargs)
+        _raise_for_status(response)
+        return response
+
+    async def _post(self, path: str, body: Dict[str, Any], timeout: Optional[float]) -> httpx.Response:
+        return await self._request("POST", path, body, timeout)
+
+    async def _stream(self, body: Dict[str, Any], prefill: str, timeout: Optional[float]) -> AsyncIterator[ChatCompletionChunk]:
+        """Server-sent Messages API events as ChatCompletionChunks."""
+        kwargs: Dict[str, Any] = {"headers": self._headers(), "json": body}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        async with self._http.stream("POST", self.base_url + "/messages", **kwargs) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                _raise_for_status(response)
+            message_id, model = f"msg_{uuid.uuid4().hex}", body["model"]
+            if prefill:
+                yield _chunk(message_id, model, prefill)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:].strip() or "{}")
+                kind = event.get("type")
+                if kind == "message_start":
+                    message_id = event["message"].get("id", message_id)
+                elif kind == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                    yield _chunk(message_id, model, event["delta"]["text"])
+                elif kind == "message_delta":
+                    reason = _FINISH_REASONS.get(event.get("delta", {}).get("stop_reason"), "stop")
+                    yield _chunk(message_id, model, None, reason)
+
+    async def close(self):
+        await self._http.aclose()
+
+
+def _chunk(message_id: str, model: str, text: Optional[str], finish_reason: Optional[str] = None) -> ChatCompletionChunk:
+    delta = {"content": text} if text is not None else {}
+    return ChatCompletionChunk(
+        id=message_id,
+        object="chat.completion.chunk",
+        created=int(time.time()),
+        model=model,
+        choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    )
+
+def _raise_for_status(response: httpx.Response):
+    """Raise the same error type the OpenAI SDK raises for API errors."""
+    if response.status_code < 400:
+        return
+    try:
+        body = response.json()
+        message = body.get("error", {}).get("message", response.text)
+    except ValueError:
+        body, message = None, response.text
+    raise APIStatusError(f"Anthropic API error {response.status_code}: {message}", response=response, body=body)
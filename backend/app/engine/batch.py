@@ -0,0 +1,244 @@
+import asyncio
+import contextlib
+import itertools
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Set
+from app.engine.graph import AntigravityEngine
+from app.utils.logger import get_logger
+from app.utils.serialization import dumps, loads, project
+
+logger = get_logger(__name__)
+
+# Put on the result queue by a worker process once it runs out of items
+_DONE = "__done__"
+
+
+def read_prompts(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Batch items from a prompt file: one plain-text prompt per line, or JSON
+    objects {"prompt", "id"?, "model_count"?, "profile"?}. Items without an id
+    are keyed by line number, so a resumed batch must use the same file.
+    """
+    for number, line in enumerate(lines, 1):
+        text = line.strip()
+        if not text:
+            continue
+        if text.startswith("{"):
+            item = loads(text)
+            item["key"] = str(item.get("id") or number)
+        else:
+            item = {"prompt": text, "key": str(number)}
+        yield item
+
+
+def completed_keys(path: str) -> Set[str]:
+    """
+    Keys already answered in an output file, which is the batch checkpoint.
+    A line torn by an interruption is cut off; failed items are left out so
+    they are retried.
+    """
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+    done = set()
+    for line in data.splitlines()[:None if data.endswith(b"\n") else -1]:
+        try:
+            record = loads(line)
+        except ValueError:
+            continue
+        if "error" not in record:
+            done.add(record["key"])
+    return done
+
+
+async def run_item(engine: AntigravityEngine, item: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """One prompt through the engine; failures become an error record instead of stopping the batch."""
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"key": item["key"], "prompt": item["prompt"]}
+    try:
+        state = await engine.run(
+            item["prompt"],
+            model_count=max(1, min(4, item.get("model_count") or options.get("model_count", 4))),
+            use_cache=options.get("use_cache", True),
+            profile=item.get("profile") or options.get("profile")
+        )
+    except Exception as e:
+        logger.error(f"Batch item {item['key']} failed: {e}")
+        return {**result, "error": str(e)}
+    data = state.model_dump(mode="json")
+    if options.get("fields"):
+        result["state"] = project(data, options["fields"])
+    else:
+        consensus = data.get("consensus") or {}
+        result.update({
+            "conversation_id": data.get("conversation_id"),
+            "final_answer": consensus.get("final_answer"),
+            "confidence": consensus.get("confidence"),
+            "errors": data.get("errors") or [],
+        })
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def run_items(
+    source: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+    emit: Callable[[Dict[str, Any]], None],
+    options: Dict[str, Any],
+    concurrency: int
+):
+    """Run items from source (None ends it) with `concurrency` runs in flight, emitting each result."""
+    engine = AntigravityEngine()
+
+    async def consume():
+        while True:
+            item = await source()
+            if item is None:
+                return
+            emit(await run_item(engine, item, options))
+
+    await asyncio.gather(*(consume() for _ in range(concurrency)))
+
+
+def _worker(tasks, results, options: Dict[str, Any], concurrency: int):
+    """Worker process: its own event loop, engine and connection pools."""
+    async def source():
+        return await asyncio.to_thread(tasks.get)
+    try:
+        # Engine progress goes to stderr; a worker's stdout is shared with the parent's
+        with contextlib.redirect_stdout(sys.stderr):
+            asyncio.run(run_items(source, results.put, options, concurrency))
+    finally:
+        results.put(_DONE)
+
+
+class _Writer:
+    """Appends result lines to the output as they arrive and keeps the batch counts."""
+    def __init__(self, path: str):
+        self.f = open(path, "ab")
+        self.completed = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def write(self, result: Dict[str, Any]):
+        self.f.write(dumps(result) + b"\n")
+        # Flushed per line so an interrupted batch resumes from here
+        self.f.flush()
+        if "error" in result:
+            self.failed += 1
+        else:
+            self.completed += 1
+        done = self.completed + self.failed
+        if done % 50 == 0:
+            rate = done / max(time.perf_counter() - self.started, 1e-9)
+            logger.info(f"Batch progress: {done} runs ({self.failed} failed), {rate:.2f}/s")
+
+    def close(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+
+def run_batch(
+    items: Iterable[Dict[str, Any]],
+    output: str,
+    options: Optional[Dict[str, Any]] = None,
+    workers: int = 1,
+    concurrency: int = 4,
+    resume: bool = True
+) -> Dict[str, Any]:
+    """
+    Run every item through the engine, appending one NDJSON result per item to
+    `output` as it finishes. Items already answered in `output` are skipped
+    when resuming. With workers > 1 the items are spread over that many
+    processes, each running `concurrency` engine runs at a time.
+    """
+    options = options or {}
+    done = completed_keys(output) if resume else set()
+    if not resume and os.path.exists(output):
+        os.remove(output)
+    skipped = 0
+
+    def pending() -> Iterator[Dict[str, Any]]:
+        nonlocal skipped
+        for item in items:
+            if item["key"] in done:
+                skipped += 1
+                continue
+            yield item
+
+    remaining = pending()
+    first = next(remaining, None)
+    writer = _Writer(output)
+    try:
+        if first is None:
+            pass
+        elif workers <= 1:
+            remaining = itertools.chain([first], remaining)
+
+            async def source():
+                return next(remaining, None)
+
+            asyncio.run(run_items(source, writer.write, options, concurrency))
+        else:
+            _run_processes(itertools.chain([first], remaining), writer, options, workers, concurrency)
+    finally:
+        writer.close()
+    report = {
+        "completed": writer.completed,
+        "failed": writer.failed,
+        "skipped": skipped,
+        "duration_s": round(time.perf_counter() - writer.started, 1),
+    }
+    logger.info(f"Batch finished: {report}")
+    return report
+
+
+def _run_processes(items: Iterator[Dict[str, Any]], writer: _Writer, options: Dict[str, Any], workers: int, concurrency: int):
+    context = multiprocessing.get_context("spawn")
+    # Bounded so a huge prompt file is read as the workers make progress
+    tasks = context.Queue(maxsize=workers * concurrency * 2)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(tasks, results, options, concurrency), daemon=True)
+        for _ in range(workers)
+    ]
+    for p in processes:
+        p.start()
+
+    def feed():
+        for item in items:
+            tasks.put(item)
+        # One end marker per consumer
+        for _ in range(workers * concurrency):
+            tasks.put(None)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    finished = 0
+    try:
+        while finished < workers:
+            try:
+                result = results.get(timeout=1.0)
+            except queue.Empty:
+                if not any(p.is_alive() for p in processes):
+                    logger.error("All batch workers exited unexpectedly")
+                    break
+                continue
+            if result == _DONE:
+                finished += 1
+            else:
+                writer.write(result)
+    finally:
+        for p in processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+                p.join()
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Blobs live in one SQLite file rather than a file each: most are a few KB
+# compressed, and a file per blob would cost a whole filesystem block.
+BLOB_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "blobs.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    data BLOB NOT NULL,
+    raw_size INTEGER NOT NULL,
+    refs INTEGER NOT NULL
+);
+"""
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    Content-addressed, reference-counted store for large values shared between
+    conversations (model response texts, claim lists). Identical content is
+    stored once; each conversation holding it adds a reference, and a blob is
+    deleted when its last reference is released.
+    """
+    def __init__(self, path: str = BLOB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            # Must be set before the first table is created to take effect
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def put_many(self, values: List[bytes], compress) -> List[str]:
+        """
+        Add one reference per value, storing content not seen before.
+        compress: Function of the raw bytes returning (codec, compressed bytes).
+        Returns the content hashes, in order.
+        """
+        hashes = [content_hash(v) for v in values]
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                for digest, value in zip(hashes, values):
+                    updated = db.execute("UPDATE blobs SET refs = refs + 1 WHERE hash = ?", (digest,)).rowcount
+                    if updated:
+                        metrics.increment("blob_store", "deduplicated")
+                        metrics.increment("blob_store", "bytes_saved", len(value))
+                        continue
+                    codec, data = compress(value)
+                    db.execute(
+                        "INSERT INTO blobs (hash, codec, data, raw_size, refs) VALUES (?, ?, ?, ?, 1)",
+                        (digest, codec, data, len(value))
+                    )
+                    metrics.increment("blob_store", "stored")
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return hashes
+
+    def get_many(self, hashes: Iterable[str], decompress) -> Dict[str, bytes]:
+        """
+        Raw content of the given blobs; missing ones are left out.
+        decompress: Function of (compressed bytes, codec) returning the raw bytes.
+        """
+        wanted = list(set(hashes))
+        if not wanted:
+            return {}
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            db = self._db()
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                rows = db.execute(
+                    f"SELECT hash, codec, data FROM blobs WHERE hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for digest, codec, data in rows:
+                    found[digest] = decompress(data, codec)
+        return found
+
+    def sizes(self, hashes: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """Stored (compressed) size and reference count of the given blobs; missing ones are left out."""
+        wanted = list(set(hashes))
+        found: Dict[str, Tuple[int, int]] = {}
+        with self._lock:
+            db = self._db()
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                rows = db.execute(
+                    f"SELECT hash, length(data), refs FROM blobs WHERE hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((digest, (size, refs)) for digest, size, refs in rows)
+        return found
+
+    def release(self, hashes: Iterable[str]) -> int:
+        """Drop one reference per hash; blobs left unreferenced are deleted. Returns how many were."""
+        counts = Counter(hashes)
+        if not counts:
+            return 0
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                deleted = 0
+                for digest, count in counts.items():
+                    db.execute("UPDATE blobs SET refs = refs - ? WHERE hash = ?", (count, digest))
+                    deleted += db.execute("DELETE FROM blobs WHERE hash = ? AND refs <= 0", (digest,)).rowcount
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        metrics.increment("blob_store", "collected", deleted)
+        return deleted
+
+    def gc(self, live: Iterable[str]) -> Dict[str, int]:
+        """
+        Full sweep: reset every reference count from the blob hashes of the
+        stored conversations (the source of truth), delete blobs nothing refers
+        to and return their pages to the filesystem. Repairs counts left behind
+        by a crash between writing a blob and its conversation.
+        """
+        counts = Counter(live)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                db.execute("UPDATE blobs SET refs = 0")
+                for digest, count in counts.items():
+                    db.execute("UPDATE blobs SET refs = ? WHERE hash = ?", (count, digest))
+                deleted = db.execute("DELETE FROM blobs WHERE refs <= 0").rowcount
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("PRAGMA incremental_vacuum")
+        metrics.increment("blob_store", "collected", deleted)
+        logger.info(f"Blob store GC removed {deleted} unreferenced blobs")
+        return {"deleted": deleted, "live": len(counts)}
+
+    def stats(self) -> Dict[str, Any]:
+        """Blob and reference counts; stored (compressed), raw, and raw-times-references bytes."""
+        with self._lock:
+            blobs, refs, stored, raw, referenced = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(refs), 0), COALESCE(SUM(LENGTH(data)), 0), "
+                "COALESCE(SUM(raw_size), 0), COALESCE(SUM(raw_size * refs), 0) FROM blobs"
+            ).fetchone()
+        return {
+            "blobs": blobs,
+            "references": refs,
+            "stored_bytes": stored,
+            "raw_bytes": raw,
+            "referenced_raw_bytes": referenced,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Global store shared by conversation persistence
+blob_store = BlobStore()
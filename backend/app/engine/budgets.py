@@ -0,0 +1,118 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+import numpy as np
+from app.models import ModelResponse, NormalizedPrompt
+from app.engine.agreement import is_usable
+from app.engine.persistence import iter_conversations
+from app.config.settings import get_engine_settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Starting points before enough conversations have been observed
+DEFAULT_INTENT_BUDGETS: Dict[str, int] = {
+    "general_query": 1024,
+    "explain_concept": 1024,
+    "compare_options": 1536,
+    "debug_code": 2048,
+    "generate_code": 3072,
+    "build_app": 3072,
+}
+
+# ModelResponse.token_count counts words; output tokens run about 4 per 3 words
+_TOKENS_PER_WORD = 4 / 3
+# Recent responses kept per intent / intent:domain key
+_WINDOW = 500
+
+def budget_keys(intent: str, domain: str):
+    """Most to least specific lookup keys for a prompt."""
+    return (f"{intent}:{domain}", intent)
+
+class OutputBudgets:
+    """
+    Council max_tokens sized to the prompt's intent and domain.
+
+    Budgets come, in order of precedence, from the OUTPUT_BUDGETS setting
+    ("intent:domain" or "intent" keys), from the observed length of past
+    council answers for the same intent (a high percentile plus headroom,
+    once enough samples exist), and from DEFAULT_INTENT_BUDGETS. Learned
+    budgets apply once ensure_loaded() has read the history, which the API
+    does in the background at startup.
+    """
+    def __init__(self):
+        self._samples: Dict[str, Deque[int]] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def ensure_loaded(self):
+        """Learn from stored conversations; a full history scan, so keep it off the event loop."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for data in iter_conversations(fields=["normalized", "consensus", "model_responses"]):
+                self.observe(data.get("state") or {})
+            self._loaded = True
+            logger.info(f"Output budgets learned from {sum(len(s) for s in self._samples.values()) // 2} responses")
+
+    def remember(self, state: dict):
+        """Learn from a freshly saved run; a no-op until the history has been loaded."""
+        if self._loaded:
+            self.observe(state)
+
+    def observe(self, state: dict):
+        """Record the answer lengths of a run's successful council responses."""
+        normalized = state.get("normalized") or {}
+        trace = (state.get("consensus") or {}).get("reasoning_trace") or []
+        # Map-reduce partial answers say nothing about single-prompt lengths
+        if not normalized.get("intent") or any(step.get("step") == "map_reduce" for step in trace):
+            return
+        keys = budget_keys(normalized["intent"], normalized.get("domain", ""))
+        for raw in state.get("model_responses") or []:
+            try:
+                response = ModelResponse(**raw)
+            except Exception:
+                continue
+            if not is_usable(response) or response.token_count <= 0:
+                continue
+            tokens = int(response.token_count * _TOKENS_PER_WORD)
+            for key in keys:
+                self._samples.setdefault(key, deque(maxlen=_WINDOW)).append(tokens)
+
+    def learned(self, key: str) -> Optional[int]:
+        """Budget learned for a key, or None without enough samples."""
+        settings = get_engine_settings()
+        samples = self._samples.get(key)
+        if not samples or len(samples) < settings.budget_min_samples:
+            return None
+        observed = float(np.percentile(list(samples), settings.budget_percentile * 100))
+        return int(observed * settings.budget_headroom)
+
+    def budget_for(self, normalized: NormalizedPrompt) -> Optional[int]:
+        """max_tokens for the council answer, or None if nothing is known about the intent."""
+        settings = get_engine_settings()
+        keys = budget_keys(normalized.intent, normalized.domain)
+        budget = next((settings.output_budgets[k] for k in keys if k in settings.output_budgets), None)
+        # Until the history is loaded, runs use the defaults rather than wait for the scan
+        if budget is None and settings.learned_budgets and self._loaded:
+            budget = next((b for b in map(self.learned, keys) if b is not None), None)
+        if budget is None:
+            budget = DEFAULT_INTENT_BUDGETS.get(normalized.intent)
+        if budget is None:
+            return None
+        return max(settings.min_output_tokens, min(budget, settings.max_output_tokens))
+
+    def stats(self) -> Dict[str, Dict[str, Optional[int]]]:
+        """Sample counts and learned budgets per key."""
+        self.ensure_loaded()
+        return {key: {"samples": len(samples), "budget": self.learned(key)} for key, samples in sorted(self._samples.items())}
+
+
+# Global budgets shared by the engine
+output_budgets = OutputBudgets()
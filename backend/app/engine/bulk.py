@@ -0,0 +1,293 @@
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from app.engine.persistence import iter_conversations, save_conversation, conversation_exists
+from app.utils.logger import get_logger
+from app.utils.serialization import dumps, loads
+
+logger = get_logger(__name__)
+
+# Parquet support is optional; NDJSON needs nothing beyond the standard library
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # pragma: no cover - depends on environment
+    pyarrow = None
+    parquet = None
+
+# Rows buffered per Parquet row group; bounds export memory regardless of history size
+ROW_GROUP_SIZE = 5000
+
+# Flat tables for analysis: column name -> pyarrow type name
+TABLES: Dict[str, Dict[str, str]] = {
+    "conversations": {
+        "conversation_id": "string", "timestamp": "string", "query": "string",
+        "intent": "string", "domain": "string", "models": "string",
+        "confidence": "float64", "final_answer": "string",
+    },
+    "responses": {
+        "conversation_id": "string", "timestamp": "string", "intent": "string", "domain": "string",
+        "model_id": "string", "token_count": "int64", "latency_ms": "float64", "response_text": "string",
+    },
+    "claims": {
+        "conversation_id": "string", "timestamp": "string", "intent": "string", "domain": "string",
+        "model_id": "string", "claim_id": "string", "text": "string",
+    },
+    "reviews": {
+        "conversation_id": "string", "timestamp": "string", "intent": "string", "domain": "string",
+        "reviewer_model": "string", "reviewed_model": "string", "accuracy_score": "int64",
+        "insight_score": "int64", "constraint_adherence": "int64", "feedback": "string",
+    },
+}
+
+# State keys each table reads, so packed conversations only inflate those sections
+_TABLE_FIELDS = {
+    "conversations": ["raw_input", "normalized", "model_responses", "consensus"],
+    "responses": ["normalized", "model_responses"],
+    "claims": ["normalized", "all_claims"],
+    "reviews": ["normalized", "peer_reviews"],
+}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def parquet_available() -> bool:
+    return pyarrow is not None
+
+
+def select_conversations(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    intent: Optional[str] = None,
+    model: Optional[str] = None,
+    fields: Optional[List[str]] = None
+) -> Iterator[dict]:
+    """
+    Stored conversations matching the filters, one at a time.
+    since / until: ISO timestamps bounding the save time (inclusive / exclusive).
+    model: Keep conversations this model answered in.
+    fields: As for iter_conversations; filter fields are added as needed.
+    """
+    if fields is not None:
+        fields = list(fields) + [f for f in ("normalized", "model_responses") if f not in fields]
+    for record in iter_conversations(fields):
+        timestamp = record.get("timestamp") or ""
+        if (since and timestamp < since) or (until and timestamp >= until):
+            continue
+        state = record.get("state") or {}
+        if intent and (state.get("normalized") or {}).get("intent") != intent:
+            continue
+        if model and not any(r.get("model_id") == model for r in state.get("model_responses") or []):
+            continue
+        yield record
+
+
+def rows(table: str, record: dict, model: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Flatten one stored conversation into rows of a table; model limits per-model rows."""
+    state = record.get("state") or {}
+    normalized = state.get("normalized") or {}
+    base = {
+        "conversation_id": record.get("id"),
+        "timestamp": record.get("timestamp"),
+        "intent": normalized.get("intent"),
+        "domain": normalized.get("domain"),
+    }
+    if table == "conversations":
+        consensus = state.get("consensus") or {}
+        yield {
+            **base,
+            "query": state.get("raw_input"),
+            "models": ",".join(r.get("model_id", "") for r in state.get("model_responses") or []),
+            "confidence": consensus.get("confidence"),
+            "final_answer": consensus.get("final_answer"),
+        }
+    elif table == "responses":
+        for r in state.get("model_responses") or []:
+            if model is None or r.get("model_id") == model:
+                yield {**base, "model_id": r.get("model_id"), "token_count": r.get("token_count"),
+                       "latency_ms": r.get("latency_ms"), "response_text": r.get("response_text")}
+    elif table == "claims":
+        for response in state.get("all_claims") or []:
+            if model is not None and response.get("model_id") != model:
+                continue
+            for claim in response.get("claims") or []:
+                yield {**base, "model_id": response.get("model_id"), "claim_id": claim.get("claim_id"),
+                       "text": claim.get("text")}
+    elif table == "reviews":
+        for review in state.get("peer_reviews") or []:
+            if model is not None and model not in (review.get("reviewer_model"), review.get("reviewed_model")):
+                continue
+            yield {**base, **{k: review.get(k) for k in (
+                "reviewer_model", "reviewed_model", "accuracy_score", "insight_score",
+                "constraint_adherence", "feedback"
+            )}}
+    else:
+        raise ValueError(f"Unknown table '{table}'. Available: {', '.join(TABLES)}")
+
+
+def _table_rows(table: str, filters: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for record in select_conversations(fields=_TABLE_FIELDS[table], **filters):
+        yield from rows(table, record, filters.get("model"))
+
+
+def export_ndjson(table: Optional[str] = None, **filters) -> Iterator[bytes]:
+    """
+    NDJSON lines: whole stored conversations (re-importable), or the rows of
+    a flat table when one is named.
+    """
+    if table is not None and table not in TABLES:
+        raise ValueError(f"Unknown table '{table}'. Available: {', '.join(TABLES)}")
+    records = select_conversations(**filters) if table is None else _table_rows(table, filters)
+    for record in records:
+        yield dumps(record) + b"\n"
+
+
+class _ChunkSink:
+    """Write-only file object collecting what the Parquet writer emits until it is drained."""
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self) -> bool:
+        return True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _schema(table: str):
+    return pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in TABLES[table].items()])
+
+
+def _batch(table: str, buffered: List[Dict[str, Any]]):
+    return pyarrow.RecordBatch.from_pylist(buffered, schema=_schema(table))
+
+
+def export_parquet(table: str, **filters) -> Iterator[bytes]:
+    """
+    A Parquet file of one flat table, yielded a row group at a time so only
+    ROW_GROUP_SIZE rows are ever held in memory.
+    """
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}'. Available: {', '.join(TABLES)}")
+    sink = _ChunkSink()
+    writer = parquet.ParquetWriter(sink, _schema(table), compression="zstd")
+    buffered: List[Dict[str, Any]] = []
+    for row in _table_rows(table, filters):
+        buffered.append(row)
+        if len(buffered) >= ROW_GROUP_SIZE:
+            writer.write_batch(_batch(table, buffered))
+            buffered = []
+            yield sink.drain()
+    if buffered:
+        writer.write_batch(_batch(table, buffered))
+    writer.close()
+    yield sink.drain()
+
+
+def write_parquet(path: str, table: str, **filters) -> int:
+    """Write a flat table to a Parquet file; returns the bytes written."""
+    written = 0
+    with open(path, "wb") as f:
+        for chunk in export_parquet(table, **filters):
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+class LineReader:
+    """
+    Split a byte stream arriving in arbitrary chunks into lines, gunzipping it
+    first when it starts with the gzip magic (concatenated members, as in the
+    retention archives, are followed across).
+    """
+    def __init__(self):
+        self._pending = b""
+        self._gzip: Optional[bool] = None
+        self._inflater = None
+
+    def _inflate(self, data: bytes) -> bytes:
+        out = []
+        while data:
+            if self._inflater is None:
+                self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            out.append(self._inflater.decompress(data))
+            data = self._inflater.unused_data
+            if self._inflater.eof:
+                self._inflater = None
+        return b"".join(out)
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        if self._gzip is None:
+            self._pending += chunk
+            if len(self._pending) < len(_GZIP_MAGIC):
+                return []
+            self._gzip = self._pending.startswith(_GZIP_MAGIC)
+            chunk, self._pending = self._pending, b""
+        data = self._pending + (self._inflate(chunk) if self._gzip else chunk)
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        return [line for line in lines if line.strip()]
+
+    def finish(self) -> List[bytes]:
+        if self._gzip is None and self._pending:
+            self._gzip = False
+        if self._gzip and self._inflater is not None:
+            self._pending += self._inflater.flush()
+        rest, self._pending = self._pending, b""
+        return [rest] if rest.strip() else []
+
+
+def import_lines(lines: Iterable[bytes], overwrite: bool = False, report: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Save each NDJSON conversation record ({"id", "timestamp", "state"}, as
+    exported or archived) under its original id and timestamp.
+    overwrite: Replace conversations that already exist instead of skipping them.
+    report: Counts to add to, so a stream can be imported batch by batch.
+    """
+    report = report if report is not None else {"imported": 0, "skipped": 0, "failed": 0, "errors": []}
+    for line in lines:
+        try:
+            record = loads(line)
+            conversation_id, state = record.get("id"), record.get("state")
+            if not isinstance(conversation_id, str) or not conversation_id or not isinstance(state, dict):
+                raise ValueError("expected an object with an id and a state")
+            if not overwrite and conversation_exists(conversation_id):
+                report["skipped"] += 1
+                continue
+            save_conversation(state, conversation_id, timestamp=record.get("timestamp"))
+            report["imported"] += 1
+        except Exception as e:
+            report["failed"] += 1
+            # Keep the first few so a bad file is diagnosable without echoing all of it
+            if len(report["errors"]) < 10:
+                report["errors"].append(str(e))
+    return report
+
+
+def import_stream(chunks: Iterable[bytes], overwrite: bool = False) -> Dict[str, Any]:
+    """Import NDJSON (optionally gzipped) from an iterable of byte chunks, e.g. a file."""
+    reader = LineReader()
+    report = None
+    for chunk in chunks:
+        report = import_lines(reader.feed(chunk), overwrite, report)
+    report = import_lines(reader.finish(), overwrite, report)
+    logger.info(f"Imported conversations: {report['imported']} new, {report['skipped']} skipped, {report['failed']} failed")
+    return report
@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Optional, Set
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Runs detached from a disconnected client; referenced here so they are not garbage-collected
+_background_runs: Set[asyncio.Task] = set()
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away before the run finished."""
+    pass
+
+async def run_until_disconnected(
+    work: Awaitable[Any],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    poll_interval: float = 0.5,
+    finish_in_background: bool = False
+) -> Any:
+    """
+    Await work while polling the client connection.
+
+    On disconnect the work is cancelled, which propagates through every
+    gathered model / extraction / review / synthesis call and closes their
+    HTTP requests. With finish_in_background=True the work is detached
+    instead and keeps running until it completes (and persists its result).
+    Raises ClientDisconnected in both cases.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await is_disconnected():
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    if finish_in_background:
+        _background_runs.add(task)
+        task.add_done_callback(_background_runs.discard)
+        metrics.increment("cancellation", "detached")
+        logger.info("Client disconnected; finishing run in the background")
+    else:
+        task.cancel()
+        metrics.increment("cancellation", "cancelled")
+        logger.info("Client disconnected; cancelled in-flight run")
+    raise ClientDisconnected()
+
+def background_run_count() -> int:
+    """Number of detached runs still executing."""
+    return len(_background_runs)
@@ -0,0 +1,272 @@
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from app.config.settings import get_engine_settings
+from app.engine.key_pool import sdk_httpx
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+from app.utils.serialization import dumps, loads
+
+logger = get_logger(__name__)
+
+DEFAULT_CASSETTE = os.path.join(os.path.dirname(__file__), "..", "..", "data", "cassettes", "providers.ndjson")
+
+# Never written to a cassette: connection handling and anything carrying credentials
+_SKIPPED_HEADERS = {"connection", "keep-alive", "transfer-encoding", "set-cookie", "authorization", "x-api-key"}
+
+
+def cassette_path() -> str:
+    return get_engine_settings().provider_cassette or DEFAULT_CASSETTE
+
+
+def _body_key(body: bytes) -> str:
+    """Hash of a request body, with JSON canonicalised so key order does not matter."""
+    try:
+        body = json.dumps(loads(body), sort_keys=True).encode()
+    except ValueError:
+        pass
+    return hashlib.sha256(body).hexdigest()
+
+
+def _model(body: bytes) -> Optional[str]:
+    try:
+        data = loads(body)
+    except ValueError:
+        return None
+    return data.get("model") if isinstance(data, dict) else None
+
+
+def _encode(body: bytes) -> Dict[str, str]:
+    try:
+        return {"body": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(body).decode("ascii")}
+
+
+def _decode(entry: Dict[str, Any]) -> bytes:
+    if "body_b64" in entry:
+        return base64.b64decode(entry["body_b64"])
+    return entry.get("body", "").encode("utf-8")
+
+
+class Cassette:
+    """
+    NDJSON file of provider exchanges, one per line: the request (method, URL,
+    body) and the raw response (status, headers, body) with how long its
+    headers and its whole body took to arrive. Credentials are never written.
+
+    Replay hands out each exchange once: an identical request (same provider,
+    method, path and body) gets its own recording; otherwise the next unused
+    recording of the same provider, path and model does, in the order the
+    requests were originally made, since prompts that embed generated ids
+    differ from run to run.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._used: set = set()
+        self._exact: Dict[Tuple, Deque[int]] = defaultdict(deque)
+        self._loose: Dict[Tuple, Deque[int]] = defaultdict(deque)
+
+    def next_sequence(self) -> int:
+        return next(self._sequence)
+
+    def append(self, entry: Dict[str, Any]):
+        line = dumps(entry) + b"\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # One write per line, so concurrent recorders (batch workers) do not interleave
+            with open(self.path, "ab") as f:
+                f.write(line)
+        metrics.increment("cassette", "recorded")
+
+    def _load(self):
+        entries = []
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        entries.append(loads(line))
+        entries.sort(key=lambda e: (e.get("recorded_at", ""), e.get("sequence", 0)))
+        for index, entry in enumerate(entries):
+            self._exact[(entry.get("provider"), entry["method"], entry["path"], entry["request_key"])].append(index)
+            self._loose[(entry.get("provider"), entry["method"], entry["path"], entry.get("model"))].append(index)
+        self._entries = entries
+        logger.info(f"Loaded {len(entries)} recorded exchanges from {self.path}")
+
+    def _take(self, queue: Deque[int]) -> Optional[int]:
+        while queue:
+            index = queue.popleft()
+            if index not in self._used:
+                self._used.add(index)
+                return index
+        return None
+
+    def match(self, provider: Optional[str], method: str, path: str, body: bytes) -> Optional[Dict[str, Any]]:
+        """The recorded exchange answering a request, or None once the cassette has none left for it."""
+        with self._lock:
+            if self._entries is None:
+                self._load()
+            index = self._take(self._exact[(provider, method, path, _body_key(body))])
+            if index is None:
+                index = self._take(self._loose[(provider, method, path, _model(body))])
+            return None if index is None else self._entries[index]
+
+
+# One cassette object per file, shared by every provider client in the process
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str) -> Cassette:
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def reset_cassettes():
+    """Forget loaded recordings, so the next replay starts from the top of each file."""
+    with _cassettes_lock:
+        _cassettes.clear()
+
+
+class _RecordingStream(sdk_httpx.AsyncByteStream):
+    """Passes a response body through unchanged while keeping a copy for the cassette."""
+    def __init__(self, inner: Any, on_close):
+        self.inner = inner
+        self.chunks: List[bytes] = []
+        self.on_close = on_close
+        self.closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            self.chunks.append(chunk)
+            yield chunk
+
+    async def aclose(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.inner.aclose()
+        finally:
+            self.on_close(b"".join(self.chunks))
+
+
+class _ReplayStream(sdk_httpx.AsyncByteStream):
+    """A recorded body, delivered after the recorded transfer time (scaled)."""
+    def __init__(self, body: bytes, delay: float):
+        self.body = body
+        self.delay = delay
+
+    async def __aiter__(self):
+        if self.delay > 0:
+            await asyncio.sleep(self.delay)
+        yield self.body
+
+
+class CassetteMiss(sdk_httpx.TransportError):
+    """Raised in replay mode for a request the cassette holds no recording for."""
+
+
+class RecordingTransport(sdk_httpx.AsyncBaseTransport):
+    """httpx transport that sends requests on through `inner` and appends every exchange to a cassette."""
+    def __init__(self, inner: Any, cassette: Cassette, provider_id: Optional[str] = None):
+        self.inner = inner
+        self.cassette = cassette
+        self.provider_id = provider_id
+
+    async def handle_async_request(self, request: Any) -> Any:
+        body = await request.aread()
+        sequence = self.cassette.next_sequence()
+        recorded_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        headers_ms = (time.perf_counter() - started) * 1000
+
+        def save(content: bytes):
+            self.cassette.append({
+                "recorded_at": recorded_at,
+                "sequence": sequence,
+                "provider": self.provider_id,
+                "method": request.method,
+                "url": str(request.url),
+                "path": request.url.path,
+                "model": _model(body),
+                "request_key": _body_key(body),
+                "request": body.decode("utf-8", errors="replace"),
+                "status": response.status_code,
+                "headers": [[k, v] for k, v in response.headers.multi_items() if k.lower() not in _SKIPPED_HEADERS],
+                **_encode(content),
+                "headers_ms": round(headers_ms, 1),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+
+        return sdk_httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, save),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class ReplayTransport(sdk_httpx.AsyncBaseTransport):
+    """
+    httpx transport that answers from a cassette without touching the
+    network. Recorded latencies are reproduced, multiplied by
+    replay_time_scale (0 answers at once).
+    """
+    def __init__(self, cassette: Cassette, provider_id: Optional[str] = None):
+        self.cassette = cassette
+        self.provider_id = provider_id
+
+    async def handle_async_request(self, request: Any) -> Any:
+        body = await request.aread()
+        entry = self.cassette.match(self.provider_id, request.method, request.url.path, body)
+        if entry is None:
+            metrics.increment("cassette", "misses")
+            raise CassetteMiss(
+                f"No recorded exchange left for {request.method} {request.url.path} "
+                f"(model {_model(body)}) in {self.cassette.path}",
+                request=request,
+            )
+        metrics.increment("cassette", "replayed")
+        scale = max(0.0, get_engine_settings().replay_time_scale)
+        headers_ms = entry.get("headers_ms", 0.0)
+        if headers_ms * scale > 0:
+            await asyncio.sleep(headers_ms * scale / 1000)
+        return sdk_httpx.Response(
+            entry["status"],
+            headers=entry.get("headers") or [],
+            stream=_ReplayStream(_decode(entry), (entry.get("elapsed_ms", 0.0) - headers_ms) * scale / 1000),
+            request=request,
+        )
+
+    async def aclose(self):
+        pass
+
+
+def provider_transport(provider_id: Optional[str] = None) -> Any:
+    """The transport provider clients send through, as selected by provider_transport."""
+    mode = get_engine_settings().provider_transport
+    if mode == "record":
+        return RecordingTransport(sdk_httpx.AsyncHTTPTransport(), get_cassette(cassette_path()), provider_id)
+    if mode == "replay":
+        return ReplayTransport(get_cassette(cassette_path()), provider_id)
+    if mode != "live":
+        logger.warning(f"Unknown provider_transport '{mode}', using live")
+    return sdk_httpx.AsyncHTTPTransport()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.engine.llm import get_provider_client
+from app.engine.metrics import metrics
+from app.engine.prompts import build_messages, record_usage
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_STATS_PREFIX = "chairman:"
+
+def available_chairmen(specs: List[str]) -> List[Tuple[str, Any, str]]:
+    """
+    Resolve "provider:model" specs to (label, client, model) for providers with a key.
+    The model part may itself contain colons (e.g. "openrouter:google/gemini-2.0-flash-exp:free").
+    """
+    chairmen = []
+    for spec in specs:
+        provider_id, _, model = spec.partition(":")
+        if not model:
+            logger.warning(f"Ignoring chairman spec without a model: {spec}")
+            continue
+        client, _ = get_provider_client(provider_id)
+        if client:
+            chairmen.append((spec, client, model))
+    return chairmen
+
+def parse_chairman_output(raw: Optional[str]) -> Optional[dict]:
+    """Return the parsed synthesis if it matches the expected schema, else None."""
+    if not raw:
+        return None
+    try:
+        result = json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(result, dict):
+        return None
+    answer = result.get("final_answer")
+    if not isinstance(answer, str) or not answer.strip():
+        return None
+    uncertain = result.get("uncertain_areas", [])
+    result["uncertain_areas"] = [str(u) for u in uncertain] if isinstance(uncertain, list) else []
+    return result
+
+async def race_chairmen(
+    chairmen: List[Tuple[str, Any, str]],
+    instructions: str,
+    request: str,
+    completion_kwargs: Dict[str, Any]
+) -> Tuple[Optional[dict], Optional[str], Optional[str]]:
+    """
+    Ask every chairman concurrently and keep the first schema-valid synthesis.
+    The losers are cancelled. Returns (result, winning label, first raw text seen);
+    result is None if no chairman produced a valid answer.
+    """
+    async def ask(label: str, client: Any, model: str) -> Tuple[str, Optional[str]]:
+        metrics.increment(_STATS_PREFIX + label, "calls")
+        started = time.perf_counter()
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=build_messages(instructions, request, label.partition(":")[0], model),
+                response_format={"type": "json_object"},
+                **completion_kwargs
+            )
+        except asyncio.CancelledError:
+            metrics.increment(_STATS_PREFIX + label, "cancelled")
+            raise
+        except Exception as e:
+            metrics.increment(_STATS_PREFIX + label, "errors")
+            logger.error(f"Chairman {label} failed: {e}")
+            return label, None
+        record_usage("synthesis", response)
+        metrics.increment(_STATS_PREFIX + label, "completed")
+        metrics.increment(_STATS_PREFIX + label, "latency_ms_total", (time.perf_counter() - started) * 1000)
+        return label, response.choices[0].message.content
+
+    tasks = [asyncio.ensure_future(ask(*c)) for c in chairmen]
+    first_raw = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            label, raw = await next_done
+            first_raw = first_raw or raw
+            result = parse_chairman_output(raw)
+            if result is not None:
+                metrics.increment(_STATS_PREFIX + label, "wins")
+                logger.info(f"Chairman race won by {label}")
+                return result, label, first_raw
+            if raw is not None:
+                metrics.increment(_STATS_PREFIX + label, "invalid")
+        return None, None, first_raw
+    finally:
+        losers = [task for task in tasks if not task.done()]
+        for task in losers:
+            task.cancel()
+        await asyncio.gather(*losers, return_exceptions=True)
+
+def chairman_stats() -> Dict[str, Dict[str, float]]:
+    """Win rate, failure counts and mean latency per chairman."""
+    stats = {}
+    for namespace, counters in metrics.snapshot().items():
+        if not namespace.startswith(_STATS_PREFIX):
+            continue
+        calls = counters.get("calls", 0)
+        completed = counters.get("completed", 0)
+        stats[namespace[len(_STATS_PREFIX):]] = {
+            "calls": calls,
+            "wins": counters.get("wins", 0),
+            "win_rate": round(counters.get("wins", 0) / calls, 3) if calls else 0.0,
+            "invalid": counters.get("invalid", 0),
+            "errors": counters.get("errors", 0),
+            "cancelled": counters.get("cancelled", 0),
+            "avg_latency_ms": round(counters.get("latency_ms_total", 0) / completed, 1) if completed else None,
+        }
+    return stats
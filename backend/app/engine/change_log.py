@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.engine.search_index import INDEX_PATH
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# One row per conversation: its latest change. Replacing a row gives it the next
+# sequence number (AUTOINCREMENT never reuses one), so "seq > cursor" is every
+# conversation saved or deleted after the cursor was handed out.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversation_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    timestamp TEXT,
+    query TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS conversation_changes_timestamp ON conversation_changes(timestamp);
+CREATE TABLE IF NOT EXISTS change_log_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class ChangeLog:
+    """
+    Monotonic log of conversation saves and deletions, kept by the persistence
+    layer. It backs the history list and its delta sync: a cursor is
+    "<epoch>:<seq>", where the epoch identifies this log so cursors from a
+    rebuilt log are recognised as stale instead of silently skipping changes.
+    """
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._epoch: Optional[str] = None
+        self._listing: Optional[Tuple[int, List[Dict[str, Any]]]] = None
+        self._lock = threading.RLock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            row = conn.execute("SELECT value FROM change_log_meta WHERE key = 'epoch'").fetchone()
+            if row is None:
+                self._epoch = uuid.uuid4().hex[:8]
+                conn.execute("INSERT INTO change_log_meta (key, value) VALUES ('epoch', ?)", (self._epoch,))
+            else:
+                self._epoch = row[0]
+            self._conn = conn
+        return self._conn
+
+    def record(self, conversation_id: str, timestamp: str, query: str):
+        """Log a save of a conversation."""
+        with self._lock:
+            self._db().execute(
+                "REPLACE INTO conversation_changes (id, timestamp, query, deleted) VALUES (?, ?, ?, 0)",
+                (conversation_id, timestamp, query[:100])
+            )
+
+    def record_delete(self, conversation_id: str):
+        """Log a deletion; it is reported to clients syncing from an earlier cursor."""
+        with self._lock:
+            self._db().execute(
+                "REPLACE INTO conversation_changes (id, timestamp, query, deleted) VALUES (?, NULL, '', 1)",
+                (conversation_id,)
+            )
+
+    def ensure_built(self, summaries: Optional[Iterable[Dict[str, Any]]] = None):
+        """Seed the log from the stored conversations once per log file."""
+        with self._lock:
+            db = self._db()
+            if db.execute("SELECT value FROM change_log_meta WHERE key = 'seeded'").fetchone():
+                return
+            if summaries is None:
+                from app.engine.persistence import list_conversations
+                # Oldest first, so sequence numbers follow save order
+                summaries = reversed(list_conversations())
+            db.execute("BEGIN")
+            try:
+                for s in summaries:
+                    if s.get("id"):
+                        db.execute(
+                            "INSERT OR IGNORE INTO conversation_changes (id, timestamp, query) VALUES (?, ?, ?)",
+                            (s["id"], s.get("timestamp") or "", s.get("query") or "")
+                        )
+                db.execute("INSERT INTO change_log_meta (key, value) VALUES ('seeded', '1')")
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def cursor(self) -> str:
+        """Cursor for the latest change."""
+        self.ensure_built()
+        with self._lock:
+            head = self._db().execute("SELECT COALESCE(MAX(seq), 0) FROM conversation_changes").fetchone()[0]
+            return f"{self._epoch}:{head}"
+
+    def parse_cursor(self, cursor: str) -> Optional[int]:
+        """Sequence number of a cursor from this log; None if it is malformed or from another epoch."""
+        self.ensure_built()
+        epoch, _, seq = (cursor or "").partition(":")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """All live conversation summaries, newest first (cached until the next change)."""
+        self.ensure_built()
+        with self._lock:
+            db = self._db()
+            head = db.execute("SELECT COALESCE(MAX(seq), 0) FROM conversation_changes").fetchone()[0]
+            if self._listing is None or self._listing[0] != head:
+                rows = db.execute(
+                    "SELECT id, timestamp, query FROM conversation_changes WHERE deleted = 0 ORDER BY timestamp DESC"
+                ).fetchall()
+                self._listing = (head, [{"id": r[0], "timestamp": r[1], "query": r[2]} for r in rows])
+            return self._listing[1]
+
+    def changes_since(self, seq: int) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Summaries saved and ids deleted after a sequence number, oldest change first."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id, timestamp, query, deleted FROM conversation_changes WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+        changed = [{"id": r[0], "timestamp": r[1], "query": r[2]} for r in rows if not r[3]]
+        return changed, [r[0] for r in rows if r[3]]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._listing = None
+
+
+# Global log shared by persistence and the API
+change_log = ChangeLog()
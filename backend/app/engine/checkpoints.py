@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+from app.utils.logger import get_logger
+from app.utils.serialization import dumps, loads
+
+logger = get_logger(__name__)
+
+# Graph layers in execution order
+LAYERS: List[str] = [
+    "normalization",
+    "constraints",
+    "execution",
+    "claims",
+    "peer_review",
+    "agreement",
+    "scoring",
+    "synthesis",
+]
+
+# Directory for per-conversation layer checkpoints
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "checkpoints")
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    return str(obj)
+
+def hash_inputs(inputs: Dict[str, Any]) -> str:
+    """Stable hash of a layer's inputs; a checkpoint is reused only if this matches."""
+    payload = json.dumps(inputs, sort_keys=True, default=_default)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def is_degraded(layer: str, output: Any) -> bool:
+    """
+    Outputs produced by a fallback path are not worth keeping:
+    resuming should retry them rather than replay the failure.
+    """
+    if layer == "execution":
+        return any(r.model_id == "system" or r.response_text.startswith("Error") for r in output)
+    if layer == "synthesis":
+        return any(
+            step.get("step") == "error" or str(step.get("details", "")).startswith("Fallback")
+            for step in output.reasoning_trace
+        )
+    return False
+
+
+class CheckpointStore:
+    """
+    Stores each layer's output for a run, keyed by a hash of the layer's inputs.
+    One JSON file per conversation holds the run parameters and all layer outputs.
+    """
+    def __init__(self, directory: str = CHECKPOINT_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, conversation_id: str) -> str:
+        return os.path.join(self.directory, f"{conversation_id}.json")
+
+    def _read(self, conversation_id: str) -> Optional[dict]:
+        path = self._path(conversation_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return loads(f.read())
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable checkpoint {conversation_id}: {e}")
+            return None
+
+    def _write(self, conversation_id: str, data: dict):
+        path = self._path(conversation_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dumps(data))
+        os.replace(tmp_path, path)
+
+    def start(self, conversation_id: str, params: Dict[str, Any], layers: Optional[Dict[str, Any]] = None):
+        """
+        Record the parameters needed to resume a run, keeping existing layers.
+        layers: Layer entries ({"input_hash", "output"}) held back until now.
+        """
+        with self._lock:
+            data = self._read(conversation_id) or {"layers": {}}
+            data["params"] = params
+            data["layers"].update(layers or {})
+            self._write(conversation_id, data)
+
+    def load_params(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Parameters the run was started with, or None if it was never checkpointed."""
+        data = self._read(conversation_id)
+        return data.get("params") if data else None
+
+    def get(self, conversation_id: str, layer: str, input_hash: str) -> Optional[Any]:
+        """Return the checkpointed output if the layer ran with identical inputs."""
+        data = self._read(conversation_id)
+        entry = (data or {}).get("layers", {}).get(layer)
+        if entry and entry.get("input_hash") == input_hash:
+            return entry.get("output")
+        return None
+
+    def put(self, conversation_id: str, layer: str, input_hash: str, output: Any):
+        """Checkpoint a layer's JSON-serializable output."""
+        with self._lock:
+            data = self._read(conversation_id) or {"layers": {}}
+            data["layers"][layer] = {"input_hash": input_hash, "output": output}
+            self._write(conversation_id, data)
+
+    def invalidate_from(self, conversation_id: str, layer: str):
+        """Drop the checkpoints of a layer and every layer after it."""
+        if layer not in LAYERS:
+            raise ValueError(f"Unknown layer '{layer}'. Expected one of: {', '.join(LAYERS)}")
+        with self._lock:
+            data = self._read(conversation_id)
+            if not data:
+                return
+            for name in LAYERS[LAYERS.index(layer):]:
+                data["layers"].pop(name, None)
+            self._write(conversation_id, data)
+
+    def size(self, conversation_id: str) -> int:
+        """Bytes taken by a run's checkpoints, 0 if it has none."""
+        try:
+            return os.path.getsize(self._path(conversation_id))
+        except OSError:
+            return 0
+
+    def delete(self, conversation_id: str):
+        """Remove all checkpoints of a run."""
+        with self._lock:
+            path = self._path(conversation_id)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# Global store used by the engine
+checkpoint_store = CheckpointStore()
@@ -0,0 +1,74 @@
+import codecs
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Union
+
+class TextChunker:
+    """
+    Incrementally splits text into chunks of at most chunk_chars characters.
+
+    Text is fed piece by piece, so only the current chunk is held in memory.
+    Cuts prefer a line break, then a space, in the last quarter of the window.
+    Each chunk starts with the last overlap_chars characters of the previous
+    one so statements spanning a cut are seen whole at least once.
+    """
+    def __init__(self, chunk_chars: int, overlap_chars: int = 0):
+        if chunk_chars <= 0:
+            raise ValueError("chunk_chars must be positive")
+        self.chunk_chars = chunk_chars
+        self.overlap_chars = max(0, min(overlap_chars, chunk_chars // 2))
+        self._buffer = ""
+        # Length of the overlap at the start of the buffer that was already sent
+        self._carried = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.total_chars = 0
+
+    def _cut(self) -> str:
+        window = self._buffer[:self.chunk_chars]
+        floor = self.chunk_chars * 3 // 4
+        end = window.rfind("\n", floor)
+        if end < 0:
+            end = window.rfind(" ", floor)
+        end = end + 1 if end > 0 else self.chunk_chars
+        chunk = self._buffer[:end]
+        start = max(end - self.overlap_chars, 1)
+        self._buffer = self._buffer[start:]
+        self._carried = end - start
+        return chunk
+
+    def feed(self, piece: Union[str, bytes]) -> List[str]:
+        """Add text (or UTF-8 bytes); returns the chunks completed by it."""
+        if isinstance(piece, bytes):
+            piece = self._decoder.decode(piece)
+        self.total_chars += len(piece)
+        self._buffer += piece
+        chunks = []
+        while len(self._buffer) > self.chunk_chars:
+            chunks.append(self._cut())
+        return chunks
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the input is exhausted."""
+        self._buffer += self._decoder.decode(b"", final=True)
+        rest, self._buffer = self._buffer, ""
+        return [rest] if rest[self._carried:].strip() else []
+
+
+def iter_chunks(pieces: Iterable[Union[str, bytes]], chunker: TextChunker) -> Iterator[str]:
+    """Chunk an iterable of text pieces lazily."""
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
+
+async def aiter_chunks(pieces: AsyncIterable[Union[str, bytes]], chunker: TextChunker) -> AsyncIterator[str]:
+    """Chunk an async stream (e.g. a request body) lazily."""
+    async for piece in pieces:
+        for chunk in chunker.feed(piece):
+            yield chunk
+    for chunk in chunker.flush():
+        yield chunk
+
+def preview(text: str, chars: int) -> str:
+    """Head and tail of a long text, which is where users usually state the task."""
+    if len(text) <= chars:
+        return text
+    half = chars // 2
+    return f"{text[:half]}\n\n[... {len(text) - 2 * half} characters omitted ...]\n\n{text[-half:]}"
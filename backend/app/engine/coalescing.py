@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+def coalescing_key(*parts: Any) -> str:
+    """Build a stable key from the parts that make two runs identical."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class _Flight:
+    """A running execution and the number of callers waiting on it."""
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent executions that share a key.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running attach to the same task and receive the same result. Nothing
+    is cached once the task finishes, so results are never stale.
+    If every waiter is cancelled, the shared task is cancelled too.
+    """
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+
+    def in_flight(self) -> int:
+        """Number of executions currently running."""
+        return len(self._flights)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Run factory() for key, or join the execution already running for it."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+            metrics.increment(self.name, "executions")
+        else:
+            metrics.increment(self.name, "coalesced")
+            logger.info(f"Coalesced request onto in-flight execution {key[:12]}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -0,0 +1,37 @@
+import re
+import zlib
+from typing import List
+import numpy as np
+
+# Dimensionality of the hashed embedding space
+EMBEDDING_DIMS = 512
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _features(text: str) -> List[str]:
+    """Word unigrams, word bigrams and character trigrams of the text."""
+    words = _TOKEN_RE.findall(text.lower())
+    features = list(words)
+    features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+def embed_text(text: str, dims: int = EMBEDDING_DIMS) -> np.ndarray:
+    """
+    Embed text into a fixed-size, L2-normalized vector using signed feature hashing.
+    Runs locally with no model download, so it is cheap enough for the request path.
+    """
+    vector = np.zeros(dims, dtype=np.float32)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode())
+        vector[h % dims] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+def cosine_similarity(a: str, b: str) -> float:
+    """Cosine similarity between the embeddings of two texts."""
+    return float(np.dot(embed_text(a), embed_text(b)))
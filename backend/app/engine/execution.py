@@ -1,26 +1,53 @@
 import asyncio
 import json
+import time
 import uuid
-from typing import List
+from typing import List, Optional, Awaitable
 from app.models import ModelResponse, LockedContext, ClaimsResponse, AtomicClaim, PeerReview
-from app.engine.llm import get_active_provider_context, get_unified_models, get_provider_client
+from app.engine.agreement import AgreementTracker
+from app.engine.metrics import metrics
+from app.engine.budgets import output_budgets
+from app.engine.prompts import CLAIMS_INSTRUCTIONS, PEER_REVIEW_INSTRUCTIONS, build_messages, record_usage
+from app.config.settings import RunProfile, get_run_profile
+from app.engine.llm import get_stage_provider_context, get_unified_models, get_provider_client, default_utility_model
 from app.engine.providers import PROVIDER_OPENROUTER, PROVIDER_GROQ
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-async def execute_parallel_models(context: LockedContext, model_count: int = 4) -> List[ModelResponse]:
+def build_council_prompt(context: LockedContext) -> str:
+    """The prompt every council model receives: normalized query plus locked constraints."""
+    prompt = context.normalized_prompt_data.normalized_prompt
+    constraints_context = f"\n\nConstraints: {json.dumps(context.locked_constraints)}"
+    return prompt + constraints_context
+
+async def execute_parallel_models(
+    context: LockedContext,
+    model_count: int = 4,
+    early_exit: Optional[AgreementTracker] = None,
+    profile: Optional[RunProfile] = None
+) -> List[ModelResponse]:
     """
     Query available models in parallel.
     model_count: Number of models to query (1-4). Models are selected in order of priority.
+    early_exit: If given, responses are compared as they arrive and the remaining
+        calls are cancelled once the tracker's agreement threshold is reached.
+    profile: Run profile supplying max_tokens and the timeout for council calls.
+        With intent budgets on, max_tokens follows the prompt's intent instead.
     """
+    profile = profile or get_run_profile()
+    completion_kwargs = {"max_tokens": 2048, **profile.completion_kwargs("execution")}
+    if profile.intent_budgets:
+        budget = output_budgets.budget_for(context.normalized_prompt_data)
+        if budget:
+            completion_kwargs["max_tokens"] = budget
+            metrics.increment("output_budgets", "budgeted_runs")
+            metrics.increment("output_budgets", "max_tokens_total", budget)
     
     # NEW: Get unified list of models from all providers
     available_models = get_unified_models()
     
-    prompt = context.normalized_prompt_data.normalized_prompt
-    constraints_context = f"\n\nConstraints: {json.dumps(context.locked_constraints)}"
-    full_prompt = prompt + constraints_context
+    full_prompt = build_council_prompt(context)
     
     if not available_models:
         return [ModelResponse(model_id="system", response_text="No API keys configured. Please configure keys in Settings.", token_count=0)]
@@ -32,6 +59,7 @@ async def execute_parallel_models(context: LockedContext, model_count: int = 4)
     
     async def call_model(model_config):
         """Call a model via its specific provider client."""
+        started = time.perf_counter()
         try:
             # Dynamically get client for this specific model
             m_client, _ = get_provider_client(model_config["provider"])
@@ -46,62 +74,95 @@ async def execute_parallel_models(context: LockedContext, model_count: int = 4)
             completion = await m_client.chat.completions.create(
                 model=model_config["id"],
                 messages=[{"role": "user", "content": full_prompt}],
-                max_tokens=2048
+                **completion_kwargs
             )
+            record_usage("execution", completion)
             text = completion.choices[0].message.content
             return ModelResponse(
                 model_id=model_config["name"], 
                 response_text=text, 
-                token_count=len(text.split())
+                token_count=len(text.split()),
+                latency_ms=round((time.perf_counter() - started) * 1000, 1)
             )
         except Exception as e:
             logger.error(f"Model call failed ({model_config['name']}): {e}")
             return ModelResponse(
                 model_id=model_config["name"], 
                 response_text=f"Error ({model_config['provider']}): {str(e)}", 
-                token_count=0
+                token_count=0,
+                latency_ms=round((time.perf_counter() - started) * 1000, 1)
             )
     
     tasks = [call_model(m) for m in selected_models]
+    if early_exit is not None:
+        return await _gather_until_agreement(tasks, early_exit)
     results = await asyncio.gather(*tasks)
     return [r for r in results if r is not None]
 
-async def extract_claims(responses: List[ModelResponse]) -> List[ClaimsResponse]:
-    """Use LLM to extract atomic claims from each model's response."""
-    client, _, provider_id = get_active_provider_context()
-    
-    system_prompt = """Extract atomic, testable claims from the following text.
-Each claim should be:
-- A single, standalone statement
-- Verifiable or falsifiable
-- Free of subjective language
-- Split compound statements (with 'and', 'but', 'because') into separate claims
+async def _gather_until_agreement(calls: List[Awaitable[ModelResponse]], tracker: AgreementTracker) -> List[ModelResponse]:
+    """Collect responses in completion order, cancelling the rest once the council agrees."""
+    tracker.total = len(calls)
+    tasks = [asyncio.ensure_future(c) for c in calls]
+    results = {}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            agreed = False
+            for task in done:
+                result = task.result()
+                results[tasks.index(task)] = result
+                agreed = tracker.add(result) or agreed
+            if agreed and pending:
+                tracker.stopped_early = True
+                metrics.increment("early_exit", "triggered")
+                metrics.increment("early_exit", "models_cancelled", len(pending))
+                logger.info(f"Council agreed at {tracker.agreement:.2f}; cancelling {len(pending)} pending model calls")
+                break
+    finally:
+        leftovers = [task for task in tasks if not task.done()]
+        for task in leftovers:
+            task.cancel()
+        if leftovers:
+            await asyncio.gather(*leftovers, return_exceptions=True)
+    # Keep the configured model priority order
+    return [results[i] for i in sorted(results) if results[i] is not None]
 
-Respond with a JSON array of strings:
-["claim 1", "claim 2", ...]"""
+def fallback_claims(response: ModelResponse) -> List[AtomicClaim]:
+    """Split a response into sentence claims without an LLM."""
+    sentences = response.response_text.split('. ')
+    return [AtomicClaim(claim_id=str(uuid.uuid4()), text=s.strip()) for s in sentences[:10] if len(s) > 20]
 
+async def extract_claims(responses: List[ModelResponse], profile: Optional[RunProfile] = None) -> List[ClaimsResponse]:
+    """Use LLM to extract atomic claims from each model's response."""
+    profile = profile or get_run_profile()
+    client, _, provider_id = get_stage_provider_context("claims")
+    
     async def extract_for_model(response: ModelResponse) -> ClaimsResponse:
         claims = []
         try:
-            if client:
+            if not profile.llm_claims:
+                claims = fallback_claims(response)
+            elif client:
                 model = "openai/gpt-4o-mini" if provider_id == PROVIDER_OPENROUTER else "gpt-3.5-turbo"
                 if provider_id == PROVIDER_GROQ: model = "llama3-70b-8192"
+                if profile.utility_model(provider_id): model = profile.utility_model(provider_id)
+                elif default_utility_model(provider_id): model = default_utility_model(provider_id)
                 
                 # Dynamic Model Selection for Extraction
                 target_model = model
-                if provider_id != PROVIDER_OPENROUTER and provider_id != PROVIDER_GROQ:
+                if provider_id != PROVIDER_OPENROUTER and provider_id != PROVIDER_GROQ and not profile.utility_model(provider_id) and not default_utility_model(provider_id):
                      try:
                         target_model = (await client.models.list()).data[0].id
                      except: pass
 
                 result = await client.chat.completions.create(
                     model=target_model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": response.response_text[:4000]}
-                    ],
-                    response_format={"type": "json_object"}
+                    messages=build_messages(CLAIMS_INSTRUCTIONS, response.response_text[:4000], provider_id, target_model),
+                    response_format={"type": "json_object"},
+                    **profile.completion_kwargs("claims")
                 )
+                record_usage("claims", result)
                 parsed = json.loads(result.choices[0].message.content)
                 if isinstance(parsed, dict) and "claims" in parsed:
                     claim_texts = parsed["claims"]
@@ -114,8 +175,7 @@ Respond with a JSON array of strings:
         except Exception as e:
             logger.error(f"Claim extraction error: {e}")
             # Fallback
-            sentences = response.response_text.split('. ')
-            claims = [AtomicClaim(claim_id=str(uuid.uuid4()), text=s.strip()) for s in sentences[:10] if len(s) > 20]
+            claims = fallback_claims(response)
         
         return ClaimsResponse(
             model_id=response.model_id, 
@@ -125,9 +185,15 @@ Respond with a JSON array of strings:
     tasks = [extract_for_model(r) for r in responses]
     return await asyncio.gather(*tasks)
 
-async def conduct_peer_review(responses: List[ModelResponse], context: LockedContext) -> List[PeerReview]:
+async def conduct_peer_review(
+    responses: List[ModelResponse],
+    context: LockedContext,
+    max_reviewers: int = 2,
+    profile: Optional[RunProfile] = None
+) -> List[PeerReview]:
     """Each model reviews and ranks the other models' responses anonymously."""
-    client, available_models, provider_id = get_active_provider_context()
+    profile = profile or get_run_profile()
+    client, available_models, provider_id = get_stage_provider_context("peer_review")
     reviews = []
     
     if not client:
@@ -141,32 +207,26 @@ async def conduct_peer_review(responses: List[ModelResponse], context: LockedCon
         model_map[anon_id] = r.model_id
         anonymized.append({"id": anon_id, "text": r.response_text[:2000]})
     
-    review_prompt = f"""You are reviewing responses to this query: "{context.normalized_prompt_data.normalized_prompt}"
+    # Per-run data only; the fixed review instructions are the cacheable prefix
+    review_request = f"""Query: "{context.normalized_prompt_data.normalized_prompt}"
 
 Constraints: {json.dumps(context.locked_constraints)}
 
 Anonymized responses:
-{json.dumps(anonymized, indent=2)}
-
-Provide:
-1. accuracy_score (1-10)
-2. insight_score (1-10)
-3. constraint_adherence (1-10)
-4. brief_feedback
-
-Respond with JSON:
-{{ "reviews": [ {{ "response_id": "Response_A", "accuracy": 8, "insight": 7, "constraint_adherence": 9, "feedback": "..." }} ] }}"""
+{json.dumps(anonymized, indent=2)}"""
     
-    # Use up to 2 models
-    review_models = [m["id"] for m in available_models[:2]]
+    # Use up to max_reviewers models (2 by default)
+    review_models = [m["id"] for m in available_models[:max_reviewers]]
     
     async def get_review_from_model(reviewer_model: str):
         try:
             result = await client.chat.completions.create(
                 model=reviewer_model,
-                messages=[{"role": "user", "content": review_prompt}],
-                response_format={"type": "json_object"}
+                messages=build_messages(PEER_REVIEW_INSTRUCTIONS, review_request, provider_id, reviewer_model),
+                response_format={"type": "json_object"},
+                **profile.completion_kwargs("peer_review")
             )
+            record_usage("peer_review", result)
             parsed = json.loads(result.choices[0].message.content)
             for r in parsed.get("reviews", []):
                 original_model = model_map.get(r["response_id"], r["response_id"])
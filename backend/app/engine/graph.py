@@ -1,11 +1,35 @@
-from app.models import GraphState
+from app.models import (
+    GraphState, SemanticMatch, NormalizedPrompt, LockedContext, ModelResponse,
+    ClaimsResponse, PeerReview, ClaimCluster, ScoredCluster, FinalConsensus
+)
 import asyncio
 import logging
+import uuid
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional, Union
+from pydantic import TypeAdapter
 
-from app.engine.normalization import normalize_prompt, lock_constraints
+from app.engine.normalization import normalize_prompt, lock_constraints, fallback_normalization
 from app.engine.execution import execute_parallel_models, extract_claims, conduct_peer_review
 from app.engine.synthesis import detect_agreement, score_clusters, synthesize_consensus
 from app.engine.persistence import save_conversation
+from app.engine.coalescing import SingleFlight, coalescing_key
+from app.engine.semantic_cache import semantic_cache
+from app.engine.budgets import output_budgets
+from app.engine.checkpoints import checkpoint_store, hash_inputs, is_degraded
+from app.engine.metrics import metrics
+from app.engine.offload import cpu_pool
+from app.engine.agreement import AgreementTracker
+from app.engine.speculation import Speculation
+from app.engine.chunking import TextChunker, aiter_chunks, preview
+from app.engine.map_reduce import map_chunks, reduce_partials
+from app.config.settings import get_engine_settings, get_run_profile, RunProfile
+
+DEFAULT_CHUNKED_TASK = "Analyze the following input and summarize the most important findings and issues."
+
+async def _once(text: str):
+    """An in-memory input as a one-piece stream."""
+    yield text
+
 
 class AntigravityEngine:
     """
@@ -14,70 +38,446 @@ class AntigravityEngine:
     def __init__(self):
         self.logger = logging.getLogger("AntigravityEngine")
         self.logger.setLevel(logging.INFO)
+        # Concurrent identical runs attach to a single execution
+        self._inflight = SingleFlight("coalescing")
 
-    async def run(self, raw_input: str, model_count: int = 4) -> GraphState:
+    async def run(
+        self,
+        raw_input: str,
+        model_count: int = 4,
+        use_cache: bool = True,
+        profile: Optional[str] = None
+    ) -> GraphState:
         """
         Executes the full graph flow with peer review.
         model_count: Number of models to query (1-4)
+        use_cache: Allow answering from the semantic cache when it is enabled
+        profile: Run profile name ("fast", "balanced", "thorough" or a server-defined one).
+            Raises ValueError for unknown profiles.
+        """
+        run_profile = get_run_profile(profile)
+        settings = get_engine_settings()
+        if settings.chunked_mode and len(raw_input) > settings.chunk_threshold_chars:
+            return await self.run_chunked(_once(raw_input), model_count=model_count, profile=profile, raw_input=raw_input)
+        if settings.coalesce_requests and settings.coalesce_raw_prompt:
+            key = coalescing_key("raw", raw_input, model_count, use_cache, run_profile.model_dump())
+            state = await self._inflight.do(key, lambda: self._execute(raw_input, model_count, run_profile, use_cache))
+            # Each subscriber gets its own copy of the shared result
+            return state.model_copy(deep=True)
+        return await self._execute(raw_input, model_count, run_profile, use_cache)
+
+    async def run_chunked(
+        self,
+        pieces: AsyncIterable[Union[str, bytes]],
+        task: Optional[str] = None,
+        model_count: int = 4,
+        profile: Optional[str] = None,
+        raw_input: Optional[str] = None
+    ) -> GraphState:
+        """
+        Map-reduce council for inputs too large for one prompt.
+
+        The task is normalized once (from `task`, or a head/tail preview of
+        raw_input), the input is chunked as it streams in, each chunk gets its
+        own council consensus (without peer review) and the partial answers are
+        reduced into the final synthesis. Chunked runs are not checkpointed,
+        coalesced or served from the semantic cache.
+        pieces: The input as an async stream of text or UTF-8 bytes.
+        raw_input: The full input when it is already in memory; stored on the state.
+        """
+        run_profile = get_run_profile(profile)
+        settings = get_engine_settings()
+        if task is None:
+            task = preview(raw_input, settings.chunk_preview_chars) if raw_input else DEFAULT_CHUNKED_TASK
+        state = GraphState(
+            raw_input=raw_input if raw_input is not None else task,
+            conversation_id=str(uuid.uuid4()),
+            profile=run_profile.name
+        )
+        try:
+            print("--- Chunked run: Normalization ---")
+            state.normalized = await normalize_prompt(task, profile=run_profile)
+            state.locked_context = await lock_constraints(state.normalized)
+
+            print(f"--- Chunked run: Map ({settings.chunk_parallelism} parts at a time) ---")
+            chunker = TextChunker(settings.chunk_chars, settings.chunk_overlap_chars)
+            state.model_responses = await map_chunks(
+                aiter_chunks(pieces, chunker), state.locked_context, model_count, run_profile, settings.chunk_parallelism
+            )
+            if not state.model_responses:
+                raise ValueError("The input is empty")
+            print(f"    Mapped {len(state.model_responses)} parts ({chunker.total_chars} characters)")
+
+            print("--- Chunked run: Reduce ---")
+            state.consensus, state.scored_clusters, levels = await reduce_partials(
+                state.model_responses, state.locked_context, run_profile, settings.reduce_fanout
+            )
+            state.consensus.reasoning_trace.append({
+                "step": "map_reduce",
+                "details": (
+                    f"Input of {chunker.total_chars} characters split into {len(state.model_responses)} parts, "
+                    f"reduced in {levels} level(s)"
+                )
+            })
+            if raw_input is None:
+                state.raw_input = f"{task}\n\n[Streamed input: {chunker.total_chars} characters in {len(state.model_responses)} parts]"
+            metrics.increment("map_reduce", "runs")
+
+            await cpu_pool.run_thread(save_conversation, state.model_dump(), state.conversation_id)
+            print(f"    Saved as: {state.conversation_id}")
+            return state
+        except Exception as e:
+            self.logger.error(f"Chunked execution failed: {e}")
+            state.errors.append(str(e))
+            return state
+
+    async def resume(self, conversation_id: str, from_layer: Optional[str] = None) -> Optional[GraphState]:
+        """
+        Re-runs a checkpointed run. Layers whose inputs are unchanged are restored
+        from their checkpoints, so execution restarts at the first layer that failed.
+        from_layer: Discard checkpoints from this layer onward to force it (and all
+        downstream layers) to run again, e.g. "scoring".
+        Returns None if the run has no checkpoints.
         """
-        state = GraphState(raw_input=raw_input)
-        
+        params = checkpoint_store.load_params(conversation_id)
+        if params is None:
+            return None
+        if from_layer:
+            checkpoint_store.invalidate_from(conversation_id, from_layer)
+        print(f"--- Resuming {conversation_id} ---")
+        return await self._execute(
+            params["raw_input"],
+            params["model_count"],
+            get_run_profile(params.get("profile")),
+            use_cache=False,
+            conversation_id=conversation_id
+        )
+
+    async def _execute(
+        self,
+        raw_input: str,
+        model_count: int,
+        profile: RunProfile,
+        use_cache: bool = True,
+        conversation_id: Optional[str] = None
+    ) -> GraphState:
+        """Runs normalization, then the council layers (coalesced when enabled)."""
+        state = GraphState(
+            raw_input=raw_input,
+            conversation_id=conversation_id or str(uuid.uuid4()),
+            profile=profile.name
+        )
+        settings = get_engine_settings()
+        # Layers before the cache and coalescing decision are held back, so runs
+        # answered from the cache or by another run leave no checkpoint behind
+        pending: Dict[str, Any] = {}
+        started = False
+
+        async def start_checkpoint():
+            nonlocal started
+            if settings.checkpoints_enabled and not started:
+                started = True
+                await cpu_pool.run_thread(
+                    checkpoint_store.start,
+                    state.conversation_id,
+                    {"raw_input": raw_input, "model_count": model_count, "profile": profile.name},
+                    pending
+                )
+
+        speculation = None
+        # Resumed runs restore execution from checkpoints, so there is nothing to speculate on
+        if settings.speculative_execution and profile.llm_normalization and conversation_id is None:
+            speculation = await self._speculate(raw_input, model_count, profile)
+
         try:
             # Layer 1: Normalization (LLM-powered)
             print("--- Layer 1: Normalization ---")
-            state.normalized = await normalize_prompt(state.raw_input)
+            state.normalized = await self._layer(
+                state, "normalization", NormalizedPrompt,
+                {"raw_input": state.raw_input, "profile": profile},
+                lambda: normalize_prompt(state.raw_input, profile=profile),
+                pending
+            )
             print(f"    Intent: {state.normalized.intent}, Domain: {state.normalized.domain}")
-            
+
             # Layer 2: Constraints
             print("--- Layer 2: Locking Constraints ---")
-            state.locked_context = await lock_constraints(state.normalized)
+            state.locked_context = await self._layer(
+                state, "constraints", LockedContext,
+                {"normalized": state.normalized},
+                lambda: lock_constraints(state.normalized),
+                pending
+            )
             print(f"    Hash: {state.locked_context.constraint_hash}")
-            
+
+            if speculation is not None and not speculation.matches(state.locked_context, settings.speculation_threshold):
+                speculation.cancel()
+                speculation = None
+
+            if use_cache and settings.semantic_cache_enabled:
+                # The first lookup may still be building the index from history
+                match = await cpu_pool.run_thread(
+                    semantic_cache.lookup,
+                    state.normalized.normalized_prompt,
+                    state.locked_context.constraint_hash,
+                    settings.semantic_cache_threshold
+                )
+                if match:
+                    print(f"    Semantic cache hit: {match.conversation_id} ({match.similarity})")
+                    return await self._answer_from_cache(state, match, settings.semantic_cache_mode)
+
+            # A resumed run must finish its own conversation, not attach to someone else's
+            if settings.coalesce_requests and conversation_id is None:
+                key = coalescing_key(
+                    "council",
+                    state.normalized.normalized_prompt,
+                    state.locked_context.constraint_hash,
+                    model_count,
+                    profile.model_dump()
+                )
+                # Once the council task owns the speculation, only that task may cancel it
+                handed_off, speculation = speculation, None
+                owned = []
+                async def lead():
+                    await start_checkpoint()
+                    return await self._run_council(state, model_count, profile, handed_off)
+                def start_council():
+                    owned.append(True)
+                    return lead()
+                try:
+                    shared = await self._inflight.do(key, start_council)
+                finally:
+                    if handed_off is not None and not owned:
+                        handed_off.cancel()
+                # Joiners keep their own prompt but share the leader's conversation_id:
+                # that is the conversation the answer was saved under
+                joined = shared.model_copy(deep=True)
+                joined.raw_input = raw_input
+                return joined
+            await start_checkpoint()
+            return await self._run_council(state, model_count, profile, speculation)
+
+        except Exception as e:
+            self.logger.error(f"Graph execution failed: {e}")
+            import traceback
+            traceback.print_exc()
+            state.errors.append(str(e))
+            # Keep what succeeded so the run can be resumed
+            await start_checkpoint()
+            return state
+        finally:
+            # Unused speculation (cache hit, coalesced onto another run, failure) is abandoned
+            if speculation is not None:
+                speculation.cancel()
+
+    async def _speculate(self, raw_input: str, model_count: int, profile: RunProfile) -> Speculation:
+        """Start council calls on the raw prompt with fallback constraints."""
+        settings = get_engine_settings()
+        context = await lock_constraints(fallback_normalization(raw_input))
+        tracker = None
+        if settings.early_exit_enabled:
+            tracker = AgreementTracker(settings.early_exit_agreement, settings.early_exit_min_responses)
+        task = asyncio.ensure_future(
+            execute_parallel_models(context, model_count=model_count, early_exit=tracker, profile=profile)
+        )
+        return Speculation(context, task, tracker)
+
+    async def _layer(
+        self,
+        state: GraphState,
+        layer: str,
+        output_type: Any,
+        inputs: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        pending: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """
+        Runs one layer with checkpointing. A checkpoint is reused when the layer's
+        inputs hash to the same value; otherwise the layer runs (retrying up to
+        layer_retries times) and its output is checkpointed unless it is degraded.
+        pending: Collect the checkpoint here instead of writing it (see _execute).
+        """
+        settings = get_engine_settings()
+        if not settings.checkpoints_enabled:
+            return await compute()
+
+        adapter = TypeAdapter(output_type)
+        input_hash = hash_inputs(inputs)
+        # Checkpoint files are read and rewritten whole, so keep that off the event loop
+        cached = await cpu_pool.run_thread(checkpoint_store.get, state.conversation_id, layer, input_hash)
+        if cached is not None:
+            print(f"    Restored {layer} from checkpoint")
+            metrics.increment("checkpoints", "restored")
+            return adapter.validate_python(cached)
+
+        attempts = max(1, settings.layer_retries + 1)
+        for attempt in range(attempts):
+            try:
+                output = await compute()
+                break
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                metrics.increment("checkpoints", "retries")
+                self.logger.warning(f"Layer {layer} failed ({e}), retrying ({attempt + 1}/{attempts - 1})")
+
+        if is_degraded(layer, output):
+            return output
+        dumped = adapter.dump_python(output, mode="json")
+        if pending is not None:
+            pending[layer] = {"input_hash": input_hash, "output": dumped}
+        else:
+            await cpu_pool.run_thread(checkpoint_store.put, state.conversation_id, layer, input_hash, dumped)
+        return output
+
+    async def _answer_from_cache(self, state: GraphState, match: SemanticMatch, mode: str) -> GraphState:
+        """
+        "return" mode reuses the matched consensus as this run's answer.
+        "offer" mode only attaches the match; the client can re-run with use_cache=False.
+        """
+        state.semantic_match = match
+        if mode == "offer":
+            return state
+
+        state.consensus = match.consensus.model_copy(deep=True)
+        state.consensus.reasoning_trace.append({
+            "step": "semantic_cache",
+            "details": f"Reused consensus of {match.conversation_id} (similarity {match.similarity})"
+        })
+        await cpu_pool.run_thread(save_conversation, state.model_dump(), state.conversation_id)
+        return state
+
+    async def _run_council(
+        self,
+        state: GraphState,
+        model_count: int,
+        profile: RunProfile,
+        speculation: Optional[Speculation] = None
+    ) -> GraphState:
+        """Layers 3-7 and persistence, starting from a locked context."""
+        settings = get_engine_settings()
+        try:
             # Layer 3: Parallel Execution (with dynamic model count)
             print(f"--- Layer 3: Parallel Execution ({model_count} models) ---")
-            state.model_responses = await execute_parallel_models(state.locked_context, model_count=model_count)
+            tracker = None
+            execution_inputs = {"locked_context": state.locked_context, "model_count": model_count, "profile": profile}
+            if settings.early_exit_enabled:
+                tracker = AgreementTracker(settings.early_exit_agreement, settings.early_exit_min_responses)
+                execution_inputs["early_exit"] = [settings.early_exit_agreement, settings.early_exit_min_responses]
+            if speculation is not None:
+                # Responses were requested during normalization; just wait for them
+                tracker = speculation.tracker
+                compute = speculation.result
+            else:
+                compute = lambda: execute_parallel_models(
+                    state.locked_context, model_count=model_count, early_exit=tracker, profile=profile
+                )
+            state.model_responses = await self._layer(
+                state, "execution", List[ModelResponse],
+                execution_inputs,
+                compute
+            )
             print(f"    Got {len(state.model_responses)} responses")
-            
+            early_exit = tracker is not None and tracker.stopped_early
+            if early_exit:
+                print(f"    Early exit: agreement {tracker.agreement:.2f} after {tracker.responses_seen}/{tracker.total} models")
+
             # Layer 4: Claim Extraction (LLM-powered)
             print("--- Layer 4: Claim Extraction ---")
-            state.all_claims = await extract_claims(state.model_responses)
+            state.all_claims = await self._layer(
+                state, "claims", List[ClaimsResponse],
+                {"model_responses": state.model_responses, "profile": profile},
+                lambda: extract_claims(state.model_responses, profile=profile)
+            )
             total_claims = sum(len(c.claims) for c in state.all_claims)
             print(f"    Extracted {total_claims} total claims")
-            
+
             # Layer 4.5: Peer Review (NEW!)
             print("--- Layer 4.5: Peer Review ---")
-            state.peer_reviews = await conduct_peer_review(state.model_responses, state.locked_context)
-            print(f"    Got {len(state.peer_reviews)} peer reviews")
-            
+            review_mode = "kept"
+            if not profile.peer_review:
+                state.peer_reviews = []
+                print(f"    Skipped by profile '{profile.name}'")
+            elif early_exit and settings.early_exit_peer_review == "skip":
+                review_mode = "skipped"
+                state.peer_reviews = []
+                print("    Skipped: council agreed early")
+            else:
+                reviewers = profile.max_reviewers
+                if early_exit:
+                    review_mode = "reduced to 1 reviewer"
+                    reviewers = 1
+                state.peer_reviews = await self._layer(
+                    state, "peer_review", List[PeerReview],
+                    {
+                        "model_responses": state.model_responses,
+                        "locked_context": state.locked_context,
+                        "max_reviewers": reviewers,
+                        "profile": profile
+                    },
+                    lambda: conduct_peer_review(
+                        state.model_responses, state.locked_context, max_reviewers=reviewers, profile=profile
+                    )
+                )
+                print(f"    Got {len(state.peer_reviews)} peer reviews")
+
             # Layer 5: Agreement Detection
             print("--- Layer 5: Agreement Detection ---")
-            state.agreement_clusters = await detect_agreement(state.all_claims, state.peer_reviews)
+            state.agreement_clusters = await self._layer(
+                state, "agreement", List[ClaimCluster],
+                {"all_claims": state.all_claims, "peer_reviews": state.peer_reviews},
+                lambda: detect_agreement(state.all_claims, state.peer_reviews)
+            )
             print(f"    Found {len(state.agreement_clusters)} claim clusters")
-            
+
             # Layer 6: Confidence Scoring
             print("--- Layer 6: Confidence Scoring ---")
-            state.scored_clusters = await score_clusters(
-                state.agreement_clusters, 
-                state.locked_context, 
-                state.peer_reviews
+            state.scored_clusters = await self._layer(
+                state, "scoring", List[ScoredCluster],
+                {
+                    "agreement_clusters": state.agreement_clusters,
+                    "locked_context": state.locked_context,
+                    "peer_reviews": state.peer_reviews
+                },
+                lambda: score_clusters(state.agreement_clusters, state.locked_context, state.peer_reviews)
             )
             high_conf = len([s for s in state.scored_clusters if s.confidence_score >= 0.6])
             print(f"    High confidence: {high_conf}, Low: {len(state.scored_clusters) - high_conf}")
-            
+
             # Layer 7: Consensus Synthesis (Chairman LLM)
             print("--- Layer 7: Final Synthesis ---")
-            state.consensus = await synthesize_consensus(
-                state.scored_clusters, 
-                state.locked_context,
-                state.model_responses
+            state.consensus = await self._layer(
+                state, "synthesis", FinalConsensus,
+                {
+                    "scored_clusters": state.scored_clusters,
+                    "locked_context": state.locked_context,
+                    "model_responses": state.model_responses,
+                    "profile": profile
+                },
+                lambda: synthesize_consensus(
+                    state.scored_clusters, state.locked_context, state.model_responses, profile=profile
+                )
             )
+            if speculation is not None:
+                state.consensus.reasoning_trace.append(speculation.trace_entry())
+            if early_exit:
+                state.consensus.reasoning_trace.append(tracker.trace_entry(review_mode))
             print(f"    Confidence: {state.consensus.confidence}")
-            
+
             # Save conversation
             print("--- Saving Conversation ---")
-            state.conversation_id = save_conversation(state.model_dump())
+            # Packing, compression and index updates run on a pool thread, off the event loop
+            dumped = state.model_dump()
+            await cpu_pool.run_thread(save_conversation, dumped, state.conversation_id)
+            semantic_cache.remember(state.conversation_id, dumped)
+            output_budgets.remember(dumped)
             print(f"    Saved as: {state.conversation_id}")
-            
+            # A clean run has nothing left to resume; failed or fallback layers keep theirs for /resume
+            if settings.checkpoints_enabled and not (
+                is_degraded("execution", state.model_responses) or is_degraded("synthesis", state.consensus)
+            ):
+                await cpu_pool.run_thread(checkpoint_store.delete, state.conversation_id)
+
             return state
 
         except Exception as e:
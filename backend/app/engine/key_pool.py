@@ -0,0 +1,274 @@
+import asyncio
+import importlib
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from app.config.settings import get_engine_settings
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# The HTTP library the OpenAI SDK is built on (httpx, or httpx2 in newer SDK
+# releases). Transports plugged into its clients must come from the same one.
+sdk_httpx = importlib.import_module(DefaultAsyncHttpxClient.__mro__[1].__module__.split(".")[0])
+
+# Remaining-quota headers, in the order they are checked
+_REMAINING_HEADERS = ("x-ratelimit-remaining-requests", "x-ratelimit-remaining")
+
+def mask_key(provider_id: str, key: str) -> str:
+    """Key prefix as shown by /settings/keys/status."""
+    return key[:12 if provider_id == "openrouter" else 8] + "..."
+
+def _retry_after(response: Any) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class KeyState:
+    """Load, quota and health of one API key."""
+    def __init__(self, provider_id: str, key: str):
+        self.provider_id = provider_id
+        self.key = key
+        self.in_flight = 0
+        self.calls = 0
+        self.rate_limited = 0
+        self.auth_failures = 0
+        self.errors = 0
+        self.remaining: Optional[int] = None
+        self.benched_until = 0.0
+        self.last_used = 0.0
+
+    def benched(self, now: float) -> bool:
+        return self.benched_until > now
+
+    def status(self, now: float) -> Dict[str, Any]:
+        return {
+            "key_prefix": mask_key(self.provider_id, self.key),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "rate_limited": self.rate_limited,
+            "auth_failures": self.auth_failures,
+            "errors": self.errors,
+            "remaining_requests": self.remaining,
+            "benched_for_s": round(max(0.0, self.benched_until - now), 1),
+        }
+
+
+class KeyPool:
+    """
+    Spreads a provider's HTTP requests over all of its configured keys.
+
+    Each request goes to the key with the fewest requests in flight; ties go
+    to the key with the most remaining quota (from rate-limit headers), then
+    to the least recently used one. A key answering 429 is benched for its
+    Retry-After time (or key_bench_seconds), and one answering 401/403 for
+    key_auth_bench_seconds. When every key is benched, the one that comes
+    back first is used rather than failing outright.
+    """
+    def __init__(self):
+        self._states: Dict[Tuple[str, str], KeyState] = {}
+        self._clients: Dict[Tuple[str, Tuple[str, ...]], AsyncOpenAI] = {}
+        self._transport_config: Optional[Tuple[str, str]] = None
+        self._transports: Dict[Tuple[str, Tuple[str, ...]], "KeyPoolTransport"] = {}
+        # Keeps the retire() tasks of replaced transports alive until they finish
+        self._closing: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    def _state(self, provider_id: str, key: str) -> KeyState:
+        state = self._states.get((provider_id, key))
+        if state is None:
+            state = self._states[(provider_id, key)] = KeyState(provider_id, key)
+        return state
+
+    def acquire(self, provider_id: str, keys: List[str]) -> KeyState:
+        """Pick the key for the next request and mark it in flight."""
+        now = time.monotonic()
+        with self._lock:
+            states = [self._state(provider_id, k) for k in keys]
+            ready = [s for s in states if not s.benched(now)]
+            if ready:
+                state = min(ready, key=lambda s: (
+                    s.in_flight,
+                    -(s.remaining if s.remaining is not None else float("inf")),
+                    s.last_used
+                ))
+            else:
+                state = min(states, key=lambda s: s.benched_until)
+                metrics.increment("key_pool", "all_benched")
+            state.in_flight += 1
+            state.calls += 1
+            state.last_used = now
+        return state
+
+    def release(self, state: KeyState, response: Optional[Any] = None):
+        """Record the outcome of a request made with a key."""
+        settings = get_engine_settings()
+        with self._lock:
+            state.in_flight -= 1
+            if response is None:
+                state.errors += 1
+                return
+            for header in _REMAINING_HEADERS:
+                if header in response.headers:
+                    try:
+                        state.remaining = int(float(response.headers[header]))
+                    except ValueError:
+                        pass
+                    break
+            if response.status_code == 429:
+                state.rate_limited += 1
+                bench = _retry_after(response) or settings.key_bench_seconds
+            elif response.status_code in (401, 403):
+                state.auth_failures += 1
+                bench = settings.key_auth_bench_seconds
+            else:
+                return
+            state.benched_until = time.monotonic() + bench
+        metrics.increment("key_pool", "benched")
+        logger.warning(
+            f"Benching {state.provider_id} key {mask_key(state.provider_id, state.key)} "
+            f"for {bench:.0f}s after HTTP {response.status_code}"
+        )
+
+    def client(self, provider_id: str, adapter: Any, keys: List[str]) -> AsyncOpenAI:
+        """
+        A cached client for the provider whose requests are spread over `keys`.
+        A new client is built when the pool's keys or the provider transport
+        (live, record or replay) change.
+        """
+        # Imported here: the cassette transports are built on this module's sdk_httpx
+        from app.engine.cassette import cassette_path, provider_transport
+
+        settings = get_engine_settings()
+        transport_config = (settings.provider_transport, cassette_path())
+        stale: List[KeyPoolTransport] = []
+        if transport_config != self._transport_config:
+            with self._lock:
+                stale.extend(self._transports.values())
+                self._clients.clear()
+                self._transports.clear()
+                self._transport_config = transport_config
+        pool_id = (provider_id, tuple(keys))
+        client = self._clients.get(pool_id)
+        if client is None:
+            transport = KeyPoolTransport(self, provider_id, list(keys), provider_transport(provider_id), adapter.auth_headers)
+            client = adapter.get_client(keys[0], http_client=DefaultAsyncHttpxClient(transport=transport))
+            with self._lock:
+                # Replace clients of an outdated key set for this provider
+                for outdated in [p for p in self._clients if p[0] == provider_id]:
+                    del self._clients[outdated]
+                    stale.append(self._transports.pop(outdated))
+                self._clients[pool_id] = client
+                self._transports[pool_id] = transport
+        self._retire(stale)
+        return client
+
+    def _retire(self, transports: List["KeyPoolTransport"]):
+        """Close the connection pools of replaced clients, after the responses they are still reading."""
+        if not transports:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No loop to close on now; each pool closes after its last open response instead
+            for transport in transports:
+                transport.retired = True
+            return
+        for transport in transports:
+            task = loop.create_task(transport.retire())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Per-key usage for every provider, with keys masked."""
+        now = time.monotonic()
+        stats: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for provider_id, keys in self._clients:
+                stats[provider_id] = [self._state(provider_id, k).status(now) for k in keys]
+        return stats
+
+
+class KeyPoolTransport(sdk_httpx.AsyncBaseTransport):
+    """
+    httpx transport that sends every request with a key chosen by the pool.
+    auth_headers: Builds the provider's authentication headers for a key
+        (Bearer token by default).
+    """
+    def __init__(
+        self,
+        pool: KeyPool,
+        provider_id: str,
+        keys: List[str],
+        inner: Any,
+        auth_headers: Optional[Callable[[str], Dict[str, str]]] = None
+    ):
+        self.pool = pool
+        self.provider_id = provider_id
+        self.keys = keys
+        self.inner = inner
+        self.auth_headers = auth_headers or (lambda key: {"Authorization": f"Bearer {key}"})
+        # Responses whose body is still being read; a retired transport closes when none are left
+        self.open_responses = 0
+        self.retired = False
+
+    async def handle_async_request(self, request: Any) -> Any:
+        state = self.pool.acquire(self.provider_id, self.keys)
+        request.headers.update(self.auth_headers(state.key))
+        response = None
+        try:
+            response = await self.inner.handle_async_request(request)
+        finally:
+            self.pool.release(state, response)
+        self.open_responses += 1
+        return sdk_httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, self._response_closed),
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def _response_closed(self):
+        self.open_responses -= 1
+        if self.retired and self.open_responses == 0:
+            await self.inner.aclose()
+
+    async def retire(self):
+        """Stop serving new clients; the connection pool closes once open responses are read."""
+        self.retired = True
+        if self.open_responses == 0:
+            await self.inner.aclose()
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class _TrackedStream(sdk_httpx.AsyncByteStream):
+    """Response body that reports when it has been closed."""
+    def __init__(self, inner: Any, on_close: Callable[[], Awaitable[None]]):
+        self.inner = inner
+        self.on_close = on_close
+        self.closed = False
+
+    async def __aiter__(self):
+        async for chunk in self.inner:
+            yield chunk
+
+    async def aclose(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await self.inner.aclose()
+        finally:
+            await self.on_close()
+
+
+# Global pool shared by every provider client
+key_pool = KeyPool()
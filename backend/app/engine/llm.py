@@ -1,18 +1,26 @@
 import os
 from dotenv import load_dotenv
 from typing import Tuple, List, Dict, Optional, Any
-from app.config.settings import get_keys
+from app.config.settings import get_keys, get_engine_settings, NATIVE_PROVIDERS
 from app.engine.providers import (
     ProviderFactory, 
     PROVIDER_OPENROUTER, 
     PROVIDER_GROQ,
     PROVIDER_OPENAI,
+    PROVIDER_ANTHROPIC,
+    PROVIDER_GEMINI,
+    PROVIDER_LOCAL,
     LLMProvider
 )
+from app.engine.key_pool import key_pool
 from openai import AsyncOpenAI
 
 load_dotenv()
 
+def _pooled_client(provider_id: str, keys: List[str]) -> Any:
+    """Client for a provider whose requests are spread over its key pool."""
+    return key_pool.client(provider_id, ProviderFactory.get_adapter(provider_id), keys)
+
 def get_active_provider_context(preferred_provider: Optional[str] = None) -> Tuple[Optional[AsyncOpenAI], List[Dict[str, str]], Optional[str]]:
     """
     Determine the best available provider and return the client, models, and provider ID.
@@ -21,10 +29,11 @@ def get_active_provider_context(preferred_provider: Optional[str] = None) -> Tup
     1. If preferred_provider is specified and available, use it
     2. OpenRouter (most diverse model access)
     3. Groq (fast inference)
-    4. Environment variables as fallback
+    4. Direct OpenAI, Anthropic or Gemini keys
+    5. Environment variables as fallback
     
     Args:
-        preferred_provider: Optional provider ID to prefer ("openrouter" or "groq")
+        preferred_provider: Optional provider ID to prefer ("openrouter", "groq", a direct provider or "local")
     
     Returns:
         Tuple of (client, available_models, provider_id)
@@ -36,36 +45,50 @@ def get_active_provider_context(preferred_provider: Optional[str] = None) -> Tup
     if preferred_provider:
         if preferred_provider == PROVIDER_OPENROUTER and keys.has_openrouter():
             adapter = ProviderFactory.get_adapter(PROVIDER_OPENROUTER)
-            client = adapter.get_client(keys.openrouter_api_key)
+            client = _pooled_client(PROVIDER_OPENROUTER, keys.key_pool(PROVIDER_OPENROUTER))
             models = adapter.get_default_models()
             return client, models, PROVIDER_OPENROUTER
         
         if preferred_provider == PROVIDER_GROQ and keys.has_groq():
             adapter = ProviderFactory.get_adapter(PROVIDER_GROQ)
-            client = adapter.get_client(keys.groq_api_key)
+            client = _pooled_client(PROVIDER_GROQ, keys.key_pool(PROVIDER_GROQ))
             models = adapter.get_default_models()
             return client, models, PROVIDER_GROQ
+        
+        if preferred_provider == PROVIDER_LOCAL and get_engine_settings().local_base_url:
+            client, models = get_provider_client(PROVIDER_LOCAL)
+            return client, models, PROVIDER_LOCAL
+        
+        if preferred_provider in NATIVE_PROVIDERS and keys.has_native(preferred_provider):
+            client, models = get_provider_client(preferred_provider)
+            return client, models, preferred_provider
     
     # Priority 1: OpenRouter (access to multiple models including Claude, GPT-4, Gemini)
     if keys.has_openrouter():
         adapter = ProviderFactory.get_adapter(PROVIDER_OPENROUTER)
-        client = adapter.get_client(keys.openrouter_api_key)
+        client = _pooled_client(PROVIDER_OPENROUTER, keys.key_pool(PROVIDER_OPENROUTER))
         models = adapter.get_default_models()
         return client, models, PROVIDER_OPENROUTER
     
     # Priority 2: Groq (fast inference with Llama models)
     if keys.has_groq():
         adapter = ProviderFactory.get_adapter(PROVIDER_GROQ)
-        client = adapter.get_client(keys.groq_api_key)
+        client = _pooled_client(PROVIDER_GROQ, keys.key_pool(PROVIDER_GROQ))
         models = adapter.get_default_models()
         return client, models, PROVIDER_GROQ
     
+    # Priority 3: Direct provider keys (no proxy hop)
+    for provider_id in NATIVE_PROVIDERS:
+        if keys.has_native(provider_id):
+            client, models = get_provider_client(provider_id)
+            return client, models, provider_id
+    
     # Legacy: Check universal_key for backward compatibility
     if keys.universal_key:
         provider_id = keys.provider_id or ProviderFactory.detect_provider(keys.universal_key)
         adapter = ProviderFactory.get_adapter(provider_id)
         if adapter:
-            client = adapter.get_client(keys.universal_key)
+            client = _pooled_client(provider_id, [keys.universal_key])
             models = adapter.get_default_models()
             return client, models, provider_id
 
@@ -73,29 +96,41 @@ def get_active_provider_context(preferred_provider: Optional[str] = None) -> Tup
     env_openrouter = os.getenv("OPENROUTER_API_KEY")
     if env_openrouter:
         adapter = ProviderFactory.get_adapter(PROVIDER_OPENROUTER)
-        client = adapter.get_client(env_openrouter)
+        client = _pooled_client(PROVIDER_OPENROUTER, [env_openrouter])
         models = adapter.get_default_models()
         return client, models, PROVIDER_OPENROUTER
     
     env_groq = os.getenv("GROQ_API_KEY")
     if env_groq:
         adapter = ProviderFactory.get_adapter(PROVIDER_GROQ)
-        client = adapter.get_client(env_groq)
+        client = _pooled_client(PROVIDER_GROQ, [env_groq])
         models = adapter.get_default_models()
         return client, models, PROVIDER_GROQ
     
+    env_anthropic = os.getenv("ANTHROPIC_API_KEY")
+    if env_anthropic:
+        adapter = ProviderFactory.get_adapter(PROVIDER_ANTHROPIC)
+        client = _pooled_client(PROVIDER_ANTHROPIC, [env_anthropic])
+        return client, adapter.get_default_models(), PROVIDER_ANTHROPIC
+    
+    env_gemini = os.getenv("GEMINI_API_KEY")
+    if env_gemini:
+        adapter = ProviderFactory.get_adapter(PROVIDER_GEMINI)
+        client = _pooled_client(PROVIDER_GEMINI, [env_gemini])
+        return client, adapter.get_default_models(), PROVIDER_GEMINI
+    
     # Legacy: OPENAI_API_KEY treated as OpenRouter
     env_openai = os.getenv("OPENAI_API_KEY")
     if env_openai:
         # Check if it's actually an OpenRouter key
         if env_openai.startswith("sk-or-"):
             adapter = ProviderFactory.get_adapter(PROVIDER_OPENROUTER)
-            client = adapter.get_client(env_openai)
+            client = _pooled_client(PROVIDER_OPENROUTER, [env_openai])
             models = adapter.get_default_models()
             return client, models, PROVIDER_OPENROUTER
         else:
             adapter = ProviderFactory.get_adapter(PROVIDER_OPENAI)
-            client = adapter.get_client(env_openai)
+            client = _pooled_client(PROVIDER_OPENAI, [env_openai])
             models = adapter.get_default_models()
             return client, models, PROVIDER_OPENAI
     
@@ -132,6 +167,28 @@ def get_all_available_providers() -> List[Dict[str, Any]]:
         "capabilities": groq_adapter.get_capabilities()
     })
     
+    # Local server (utility stages)
+    local_adapter = ProviderFactory.get_adapter(PROVIDER_LOCAL)
+    local_available = bool(get_engine_settings().local_base_url)
+    providers.append({
+        "id": PROVIDER_LOCAL,
+        "name": local_adapter.name,
+        "available": local_available,
+        "models": local_adapter.get_default_models() if local_available else [],
+        "capabilities": local_adapter.get_capabilities()
+    })
+    
+    # Direct routes
+    for provider_id in NATIVE_PROVIDERS:
+        adapter = ProviderFactory.get_adapter(provider_id)
+        providers.append({
+            "id": provider_id,
+            "name": adapter.name,
+            "available": keys.has_native(provider_id),
+            "models": adapter.get_default_models() if keys.has_native(provider_id) else [],
+            "capabilities": adapter.get_capabilities()
+        })
+    
     return providers
 
 
@@ -140,7 +197,7 @@ def get_provider_client(provider_id: str) -> Tuple[Optional[AsyncOpenAI], List[D
     Get a client for a specific provider.
     
     Args:
-        provider_id: The provider ID ("openrouter" or "groq")
+        provider_id: The provider ID ("openrouter", "groq", "openai", "anthropic" or "gemini")
     
     Returns:
         Tuple of (client, models) or (None, []) if provider not available
@@ -149,16 +206,26 @@ def get_provider_client(provider_id: str) -> Tuple[Optional[AsyncOpenAI], List[D
     
     if provider_id == PROVIDER_OPENROUTER and keys.has_openrouter():
         adapter = ProviderFactory.get_adapter(PROVIDER_OPENROUTER)
-        client = adapter.get_client(keys.openrouter_api_key)
+        client = _pooled_client(PROVIDER_OPENROUTER, keys.key_pool(PROVIDER_OPENROUTER))
         models = adapter.get_default_models()
         return client, models
     
     if provider_id == PROVIDER_GROQ and keys.has_groq():
         adapter = ProviderFactory.get_adapter(PROVIDER_GROQ)
-        client = adapter.get_client(keys.groq_api_key)
+        client = _pooled_client(PROVIDER_GROQ, keys.key_pool(PROVIDER_GROQ))
         models = adapter.get_default_models()
         return client, models
     
+    if provider_id in NATIVE_PROVIDERS and keys.has_native(provider_id):
+        adapter = ProviderFactory.get_adapter(provider_id)
+        client = _pooled_client(provider_id, keys.key_pool(provider_id))
+        return client, adapter.get_default_models()
+    
+    if provider_id == PROVIDER_LOCAL and get_engine_settings().local_base_url:
+        # Local servers ignore the key, but the client requires one
+        client = _pooled_client(PROVIDER_LOCAL, ["local"])
+        return client, ProviderFactory.get_adapter(PROVIDER_LOCAL).get_default_models()
+    
     return None, []
 
 
@@ -186,6 +253,11 @@ def get_unified_models() -> List[Dict[str, str]]:
         except Exception:
             pass
             
+    # 3. Direct provider keys
+    for provider_id in NATIVE_PROVIDERS:
+        if keys.has_native(provider_id):
+            all_models.extend(ProviderFactory.get_adapter(provider_id).get_default_models())
+            
     # 3. Legacy / Fallbacks
     if not all_models and keys.universal_key:
         provider_id = keys.provider_id or ProviderFactory.detect_provider(keys.universal_key)
@@ -194,3 +266,18 @@ def get_unified_models() -> List[Dict[str, str]]:
             all_models.extend(adapter.get_default_models())
             
     return all_models
+
+
+def get_stage_provider_context(stage: str) -> Tuple[Optional[Any], List[Dict[str, str]], Optional[str]]:
+    """
+    Provider context for an engine stage, honouring STAGE_PROVIDERS routing
+    (e.g. utility stages on the local provider). Falls back to the usual order.
+    """
+    return get_active_provider_context(preferred_provider=get_engine_settings().stage_providers.get(stage))
+
+
+def default_utility_model(provider_id: Optional[str]) -> Optional[str]:
+    """Utility-stage model of a direct provider, None for OpenRouter/Groq (stages pick those)."""
+    if provider_id in (PROVIDER_OPENROUTER, PROVIDER_GROQ) or not provider_id:
+        return None
+    return ProviderFactory.get_adapter(provider_id).utility_model
@@ -0,0 +1,107 @@
+import asyncio
+from typing import AsyncIterable, List, Optional, Tuple
+from app.models import LockedContext, ModelResponse, ScoredCluster, FinalConsensus
+from app.engine.execution import execute_parallel_models, extract_claims
+from app.engine.synthesis import detect_agreement, score_clusters, synthesize_consensus
+from app.engine.metrics import metrics
+from app.config.settings import RunProfile
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Partial answers are short, so the reduce step can show each one in full
+_PARTIAL_ANSWER_CHARS = 4000
+
+def chunk_context(context: LockedContext, chunk: str, index: int) -> LockedContext:
+    """The locked context for one part of a large input."""
+    task = context.normalized_prompt_data.normalized_prompt
+    prompt = (
+        f"{task}\n\nThe input is too large to send at once. This is part {index + 1} of it. "
+        f"Answer using only this part and report everything in it that is relevant to the task.\n\n"
+        f"--- PART {index + 1} ---\n{chunk}"
+    )
+    data = context.normalized_prompt_data.model_copy(update={"normalized_prompt": prompt})
+    return context.model_copy(update={"normalized_prompt_data": data})
+
+async def consensus_for(
+    context: LockedContext,
+    responses: List[ModelResponse],
+    profile: RunProfile,
+    response_chars: int = 500
+) -> Tuple[FinalConsensus, List[ScoredCluster]]:
+    """Claims, agreement, scoring and synthesis over a set of responses (no peer review)."""
+    claims = await extract_claims(responses, profile=profile)
+    clusters = await detect_agreement(claims)
+    scored = await score_clusters(clusters, context)
+    consensus = await synthesize_consensus(scored, context, responses, profile=profile, response_chars=response_chars)
+    return consensus, scored
+
+async def map_chunks(
+    chunks: AsyncIterable[str],
+    context: LockedContext,
+    model_count: int,
+    profile: RunProfile,
+    parallelism: int
+) -> List[ModelResponse]:
+    """
+    Run the council on every chunk, at most `parallelism` chunks at a time.
+
+    The next chunk is only pulled from the stream once a slot is free, so no
+    more than `parallelism` chunks are held in memory. Each chunk's consensus
+    becomes one partial answer, in input order.
+    """
+    slots = asyncio.Semaphore(max(1, parallelism))
+    tasks: List[asyncio.Task] = []
+
+    async def map_one(index: int, chunk: str) -> ModelResponse:
+        try:
+            part_context = chunk_context(context, chunk, index)
+            responses = await execute_parallel_models(part_context, model_count=model_count, profile=profile)
+            consensus, _ = await consensus_for(part_context, responses, profile)
+            metrics.increment("map_reduce", "chunks")
+            return ModelResponse(
+                model_id=f"part-{index + 1}",
+                response_text=consensus.final_answer,
+                token_count=len(consensus.final_answer.split())
+            )
+        finally:
+            slots.release()
+
+    try:
+        index = 0
+        async for chunk in chunks:
+            await slots.acquire()
+            tasks.append(asyncio.ensure_future(map_one(index, chunk)))
+            index += 1
+        return list(await asyncio.gather(*tasks))
+    finally:
+        pending = [t for t in tasks if not t.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+async def reduce_partials(
+    partials: List[ModelResponse],
+    context: LockedContext,
+    profile: RunProfile,
+    fanout: int
+) -> Tuple[FinalConsensus, List[ScoredCluster], int]:
+    """
+    Synthesize partial answers into one consensus. More than `fanout` partials
+    are reduced in groups first, level by level. Returns (consensus, scored, levels).
+    """
+    fanout = max(2, fanout)
+    levels = 1
+    while len(partials) > fanout:
+        groups = [partials[i:i + fanout] for i in range(0, len(partials), fanout)]
+        merged = await asyncio.gather(*[
+            consensus_for(context, group, profile, response_chars=_PARTIAL_ANSWER_CHARS) for group in groups
+        ])
+        partials = [
+            ModelResponse(model_id=f"merge-{levels}-{i + 1}", response_text=c.final_answer, token_count=len(c.final_answer.split()))
+            for i, (c, _) in enumerate(merged)
+        ]
+        levels += 1
+    consensus, scored = await consensus_for(context, partials, profile, response_chars=_PARTIAL_ANSWER_CHARS)
+    return consensus, scored, levels
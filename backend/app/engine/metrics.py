@@ -0,0 +1,36 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Any
+
+class MetricsRegistry:
+    """
+    In-process counters for engine behaviour (coalescing, caching, etc).
+    Counters are grouped by namespace so each feature reports under its own key.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def increment(self, namespace: str, name: str, value: float = 1):
+        """Add value to a counter."""
+        with self._lock:
+            self._counters[namespace][name] += value
+
+    def set(self, namespace: str, name: str, value: float):
+        """Set a gauge-style value."""
+        with self._lock:
+            self._counters[namespace][name] = value
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Return a copy of all counters."""
+        with self._lock:
+            return {ns: dict(values) for ns, values in self._counters.items()}
+
+    def reset(self):
+        """Clear all counters."""
+        with self._lock:
+            self._counters.clear()
+
+
+# Global registry shared by the engine and the API
+metrics = MetricsRegistry()
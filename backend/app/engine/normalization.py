@@ -1,22 +1,29 @@
 import json
 import hashlib
+from typing import Optional
 from app.models import NormalizedPrompt, LockedContext
-from app.engine.llm import get_active_provider_context
+from app.config.settings import RunProfile, get_run_profile
+from app.engine.llm import get_stage_provider_context, default_utility_model
 from app.engine.providers import PROVIDER_OPENROUTER
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-async def normalize_prompt(raw_input: str) -> NormalizedPrompt:
+async def normalize_prompt(raw_input: str, profile: Optional[RunProfile] = None) -> NormalizedPrompt:
     """Use LLM to detect intent and extract constraints from user input."""
-    client, _, provider_id = get_active_provider_context()
+    profile = profile or get_run_profile()
+    if not profile.llm_normalization:
+        return fallback_normalization(raw_input)
+    client, _, provider_id = get_stage_provider_context("normalization")
     
     system_prompt = """You are a prompt analyzer. Given a user query, extract:
 1. intent: The main goal (e.g., "build_app", "explain_concept", "compare_options", "debug_code", "generate_code")
 2. domain: The subject area (e.g., "web_dev", "machine_learning", "databases", "devops")
 3. explicit_constraints: Constraints explicitly stated by the user (as JSON object)
 4. inferred_constraints: Reasonable defaults to infer (as JSON object)
-5. normalized_prompt: A clean, unambiguous rewrite of the query
+5. normalized_prompt: A clean, unambiguous rewrite of the query, no longer than the original
+
+Keep constraint values short (a few words each) and add no commentary.
 
 Respond ONLY with valid JSON in this exact format:
 {
@@ -30,12 +37,16 @@ Respond ONLY with valid JSON in this exact format:
     try:
         if client:
             # Select appropriate model based on provider
-            if provider_id == PROVIDER_OPENROUTER:
+            if profile.utility_model(provider_id):
+                model = profile.utility_model(provider_id)
+            elif provider_id == PROVIDER_OPENROUTER:
                 model = "openai/gpt-4o-mini"
             elif provider_id == "groq":
                 model = "llama3-70b-8192"
+            elif default_utility_model(provider_id):
+                model = default_utility_model(provider_id)
             else:
-                # For OpenAI or unknown providers, use a safe default
+                # For unknown providers, use a safe default
                 model = "gpt-3.5-turbo"
                 # Try to get first available model, but don't fail if it doesn't work
                 try:
@@ -51,14 +62,18 @@ Respond ONLY with valid JSON in this exact format:
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": raw_input}
                 ],
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                **profile.completion_kwargs("normalization")
             )
             result = json.loads(response.choices[0].message.content)
             return NormalizedPrompt(**result)
     except Exception as e:
         logger.error(f"Normalization error: {e}")
     
-    # Fallback to basic normalization
+    return fallback_normalization(raw_input)
+
+def fallback_normalization(raw_input: str) -> NormalizedPrompt:
+    """Basic normalization used when no LLM is available or it is disabled."""
     return NormalizedPrompt(
         intent="general_query",
         domain="technology",
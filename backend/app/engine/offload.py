@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+from app.config.settings import get_engine_settings
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class CpuPool:
+    """
+    Runs CPU-heavy engine stages (clustering, scoring, packing conversations
+    for persistence) off the event loop, so one large council does not stall
+    every other request's I/O.
+
+    Pure functions go to the configured executor: threads, or processes for
+    real parallelism (arguments and results must then be picklable). Work
+    that touches in-process state always uses threads. Submissions beyond
+    cpu_pool_max_pending wait their turn, and the wait is reported. Inputs
+    below cpu_offload_min_items run inline, since handing them off costs
+    more than it saves, unless the event loop is already lagging past
+    event_loop_lag_bound_ms.
+    """
+    def __init__(self):
+        self.lag_ms = 0.0
+        self._config: Optional[Tuple[str, int]] = None
+        self._executor: Optional[Executor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore, int]] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _executors(self, settings) -> Tuple[Executor, ThreadPoolExecutor]:
+        workers = settings.cpu_pool_workers or os.cpu_count() or 1
+        with self._lock:
+            if self._config != (settings.cpu_offload, workers):
+                self._shutdown()
+                self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cpu-pool")
+                if settings.cpu_offload == "process":
+                    # spawn: forking a process that runs an event loop and sockets is unsafe
+                    self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+                else:
+                    self._executor = self._threads
+                self._config = (settings.cpu_offload, workers)
+                metrics.set("cpu_pool", "workers", workers)
+            return self._executor, self._threads
+
+    def _semaphore(self, limit: int) -> asyncio.Semaphore:
+        # Semaphores belong to one event loop; tests and the CLI run several
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots[0] is not loop or self._slots[2] != limit:
+            self._slots = (loop, asyncio.Semaphore(max(1, limit)), limit)
+        return self._slots[1]
+
+    def inline(self, size: Optional[int], settings=None) -> bool:
+        """Whether work of this size should run on the event loop itself."""
+        settings = settings or get_engine_settings()
+        if settings.cpu_offload == "off":
+            return True
+        return size is not None and size < settings.cpu_offload_min_items and self.lag_ms <= settings.event_loop_lag_bound_ms
+
+    async def run(self, fn: Callable[..., Any], *args, size: Optional[int] = None) -> Any:
+        """
+        Run a pure function on the configured executor.
+        size: Rough amount of work (e.g. claim count); small jobs run inline.
+        """
+        settings = get_engine_settings()
+        if self.inline(size, settings):
+            metrics.increment("cpu_pool", "inline")
+            return fn(*args)
+        executor, _ = self._executors(settings)
+        return await self._submit(executor, fn, args, settings)
+
+    async def run_thread(self, fn: Callable[..., Any], *args) -> Any:
+        """Run blocking work that needs this process's state (stores, caches) on a pool thread."""
+        settings = get_engine_settings()
+        if settings.cpu_offload == "off":
+            return fn(*args)
+        _, threads = self._executors(settings)
+        return await self._submit(threads, fn, args, settings)
+
+    async def _submit(self, executor: Executor, fn: Callable[..., Any], args, settings) -> Any:
+        slots = self._semaphore(settings.cpu_pool_max_pending)
+        queued = time.perf_counter()
+        with self._lock:
+            self._pending += 1
+            metrics.set("cpu_pool", "pending", self._pending)
+        try:
+            async with slots:
+                started = time.perf_counter()
+                metrics.increment("cpu_pool", "queue_wait_ms_total", (started - queued) * 1000)
+                metrics.increment("cpu_pool", "submitted")
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+                except Exception:
+                    metrics.increment("cpu_pool", "failed")
+                    raise
+                finally:
+                    metrics.increment("cpu_pool", "run_ms_total", (time.perf_counter() - started) * 1000)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                metrics.set("cpu_pool", "pending", self._pending)
+
+    def _shutdown(self):
+        for executor in {id(e): e for e in (self._executor, self._threads) if e is not None}.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._threads = None
+        self._config = None
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown()
+
+
+async def monitor_event_loop_lag():
+    """
+    Measure how late the event loop wakes from a short sleep. The latest lag
+    steers CpuPool.inline; the last and peak lag and how often it exceeded
+    event_loop_lag_bound_ms are reported under the event_loop metrics.
+    """
+    loop = asyncio.get_running_loop()
+    peak = 0.0
+    while True:
+        settings = get_engine_settings()
+        interval = settings.event_loop_lag_probe_seconds
+        if interval <= 0:
+            return
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, (loop.time() - started - interval) * 1000)
+        cpu_pool.lag_ms = lag
+        peak = max(peak, lag)
+        metrics.set("event_loop", "lag_ms", round(lag, 1))
+        metrics.set("event_loop", "lag_ms_max", round(peak, 1))
+        if lag > settings.event_loop_lag_bound_ms:
+            metrics.increment("event_loop", "over_bound")
+            logger.warning(f"Event loop lagged {lag:.0f}ms (bound {settings.event_loop_lag_bound_ms:.0f}ms)")
+
+
+# Global pool shared by the engine stages
+cpu_pool = CpuPool()
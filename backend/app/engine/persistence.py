@@ -1,9 +1,20 @@
+import io
 import os
 import json
+import threading
 import uuid
 from datetime import datetime
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Iterable, Iterator
+from app.config.settings import get_engine_settings
+from app.engine.analytics import model_analytics
+from app.engine.blob_store import blob_store
+from app.engine.change_log import change_log
+from app.engine.checkpoints import checkpoint_store
+from app.engine.search_index import search_index
+from app.engine.segments import segment_store
+from app.engine.storage import PACK_EXTENSION, pack, read_header, read_pack, sections_for
 from app.utils.logger import get_logger
+from app.utils.serialization import loads
 
 logger = get_logger(__name__)
 
@@ -11,60 +22,285 @@ logger = get_logger(__name__)
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "conversations")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def save_conversation(state: dict, conversation_id: str = None) -> str:
-    """Save conversation to JSON file."""
+# Serializes moves between loose files and segments with saves and deletes
+_store_lock = threading.RLock()
+
+def _pack_path(conversation_id: str) -> str:
+    return os.path.join(DATA_DIR, f"{conversation_id}{PACK_EXTENSION}")
+
+def _json_path(conversation_id: str) -> str:
+    return os.path.join(DATA_DIR, f"{conversation_id}.json")
+
+def _pack_blobs(filepath: str) -> List[str]:
+    """Blob hashes referenced by a pack, [] if there is none."""
+    try:
+        with open(filepath, "rb") as f:
+            return read_header(f)[0].get("blobs") or []
+    except FileNotFoundError:
+        return []
+
+def _payload_blobs(payload: Optional[bytes]) -> List[str]:
+    return read_header(io.BytesIO(payload))[0].get("blobs") or [] if payload else []
+
+def _write(conversation_id: str, data: dict, settings):
+    """Write the conversation's file and drop any earlier copy, in either format or in a segment."""
+    # References held by an earlier save of this conversation (e.g. before a resume)
+    previous = _pack_blobs(_pack_path(conversation_id))
+    if settings.compact_storage:
+        filepath = _pack_path(conversation_id)
+        payload = pack(
+            conversation_id, data["timestamp"], data["state"],
+            blobs=blob_store if settings.blob_dedup else None,
+            blob_min_bytes=settings.blob_min_bytes
+        )
+        try:
+            # Write then rename so readers never see a half-written pack
+            with open(filepath + ".tmp", "wb") as f:
+                f.write(payload)
+            os.replace(filepath + ".tmp", filepath)
+        except Exception:
+            blob_store.release(_payload_blobs(payload))
+            raise
+        stale = _json_path(conversation_id)
+    else:
+        with open(_json_path(conversation_id), "w") as f:
+            json.dump(data, f, indent=2, default=str)
+        stale = _pack_path(conversation_id)
+    # A resumed run may have been saved in the other format, or compacted, before
+    if os.path.exists(stale):
+        os.remove(stale)
+    previous += _payload_blobs(segment_store.remove(conversation_id))
+    blob_store.release(previous)
+
+def save_conversation(state: dict, conversation_id: str = None, timestamp: Optional[str] = None) -> str:
+    """
+    Save conversation as a packed file (or legacy JSON with compact_storage off).
+    timestamp: ISO save time to record instead of now (bulk import keeps the original).
+    """
     if not conversation_id:
         conversation_id = str(uuid.uuid4())
-    
-    filepath = os.path.join(DATA_DIR, f"{conversation_id}.json")
+    settings = get_engine_settings()
     
     data = {
         "id": conversation_id,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": timestamp or datetime.now().isoformat(),
         "state": state
     }
     
     try:
-        with open(filepath, "w") as f:
-            json.dump(data, f, indent=2, default=str)
+        with _store_lock:
+            _write(conversation_id, data, settings)
     except Exception as e:
         logger.error(f"Failed to save conversation {conversation_id}: {e}")
         raise e
+
+    # The file is the source of truth; a failed log or index update only affects history and search
+    try:
+        change_log.record(conversation_id, data["timestamp"], state.get("raw_input") or "")
+    except Exception as e:
+        logger.warning(f"Failed to log change of conversation {conversation_id}: {e}")
+
+    if settings.search_index_enabled:
+        try:
+            search_index.add(conversation_id, data["timestamp"], state)
+        except Exception as e:
+            logger.warning(f"Failed to index conversation {conversation_id}: {e}")
+
+    if settings.model_analytics_enabled:
+        try:
+            model_analytics.record(conversation_id, data["timestamp"], state)
+        except Exception as e:
+            logger.warning(f"Failed to update model analytics for {conversation_id}: {e}")
     
     return conversation_id
 
-def load_conversation(conversation_id: str) -> Optional[dict]:
-    """Load conversation from JSON file."""
-    filepath = os.path.join(DATA_DIR, f"{conversation_id}.json")
-    if os.path.exists(filepath):
+def _read(filepath: str, fields: Optional[Iterable[str]] = None) -> dict:
+    with open(filepath, "rb") as f:
+        if filepath.endswith(PACK_EXTENSION):
+            return read_pack(f, sections_for(fields), blobs=blob_store)
+        return loads(f.read())
+
+def load_conversation(conversation_id: str, fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+    """
+    Load a conversation from its packed or legacy JSON file, or from the segments once compacted.
+    fields: Optional top-level state keys (dotted paths allowed) that are needed; a pack
+        then only decompresses the sections holding them. Legacy files are read whole.
+    """
+    try:
+        for filepath in (_pack_path(conversation_id), _json_path(conversation_id)):
+            if os.path.exists(filepath):
+                return _read(filepath, fields)
+        payload = segment_store.read(conversation_id)
+        if payload is not None:
+            return read_pack(io.BytesIO(payload), sections_for(fields), blobs=blob_store)
+    except Exception as e:
+        logger.error(f"Failed to load conversation {conversation_id}: {e}")
+    return None
+
+def conversation_exists(conversation_id: str) -> bool:
+    """Whether a conversation is stored, as a file or compacted, without reading it."""
+    return (
+        os.path.exists(_pack_path(conversation_id))
+        or os.path.exists(_json_path(conversation_id))
+        or conversation_id in segment_store
+    )
+
+def _conversation_files() -> Iterator[str]:
+    for filename in os.listdir(DATA_DIR):
+        if filename.endswith(PACK_EXTENSION) or filename.endswith(".json"):
+            yield filename
+
+def iter_conversations(fields: Optional[Iterable[str]] = None) -> Iterator[dict]:
+    """
+    Yield every saved conversation, one at a time: loose files first, then compacted ones.
+    fields: As for load_conversation.
+    """
+    if not os.path.exists(DATA_DIR):
+        return
+        
+    for filename in _conversation_files():
         try:
-            with open(filepath, "r") as f:
-                return json.load(f)
+            data = _read(os.path.join(DATA_DIR, filename), fields)
+            if isinstance(data, dict):
+                yield data
+        except FileNotFoundError:
+            # Compacted or deleted while iterating
+            continue
         except Exception as e:
-            logger.error(f"Failed to load conversation {conversation_id}: {e}")
-            return None
-    return None
+            logger.warning(f"Skipping malformed conversation file {filename}: {e}")
 
-def list_conversations() -> List[dict]:
-    """List all saved conversations."""
+    sections = sections_for(fields)
+    for payload in segment_store.iter_packs():
+        try:
+            yield read_pack(io.BytesIO(payload), sections, blobs=blob_store)
+        except Exception as e:
+            logger.warning(f"Skipping unreadable compacted conversation: {e}")
+
+def stored_conversations(full_size: bool = False) -> List[dict]:
+    """
+    id, timestamp, query, stored size and location ("file" or "segment") of every conversation.
+    full_size: Count everything a conversation occupies, not just its pack: its
+        share of each blob it references (split between the conversations
+        sharing it) and its checkpoints. Reads the header of every compacted pack.
+    """
     conversations = []
+    blobs: Dict[str, List[str]] = {}
+    for filename in _conversation_files():
+        filepath = os.path.join(DATA_DIR, filename)
+        try:
+            size = os.path.getsize(filepath)
+            with open(filepath, "rb") as f:
+                if filename.endswith(PACK_EXTENSION):
+                    header, _ = read_header(f)
+                    blobs[header.get("id")] = header.get("blobs") or []
+                    conversations.append({
+                        "id": header.get("id"),
+                        "timestamp": header.get("timestamp"),
+                        "query": header.get("summary", {}).get("query", ""),
+                        "size": size,
+                        "location": "file"
+                    })
+                    continue
+                data = loads(f.read())
+                # Basic validation of data structure
+                if isinstance(data, dict):
+                    conversations.append({
+                        "id": data.get("id"),
+                        "timestamp": data.get("timestamp"),
+                        "query": data.get("state", {}).get("raw_input", "")[:100],
+                        "size": size,
+                        "location": "file"
+                    })
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            logger.warning(f"Skipping malformed conversation file {filename}: {e}")
+    loose = {c["id"] for c in conversations}
+    conversations.extend(
+        {**c, "location": "segment"} for c in segment_store.summaries() if c["id"] not in loose
+    )
+    if full_size:
+        for c in conversations:
+            if c["location"] == "segment":
+                blobs[c["id"]] = _payload_blobs(segment_store.read(c["id"]))
+        sizes = blob_store.sizes(h for hashes in blobs.values() for h in hashes)
+        for c in conversations:
+            shares = (sizes[h][0] / max(sizes[h][1], 1) for h in blobs.get(c["id"], ()) if h in sizes)
+            c["size"] += int(sum(shares)) + checkpoint_store.size(c["id"])
+    return conversations
+
+def list_conversations() -> List[dict]:
+    """List all saved conversations (packs are summarized from their headers, compacted ones from the segment index)."""
     if not os.path.exists(DATA_DIR):
         return []
-        
-    for filename in os.listdir(DATA_DIR):
-        if filename.endswith(".json"):
-            filepath = os.path.join(DATA_DIR, filename)
-            try:
-                with open(filepath, "r") as f:
-                    data = json.load(f)
-                    # Basic validation of data structure
-                    if isinstance(data, dict):
-                        conversations.append({
-                            "id": data.get("id"),
-                            "timestamp": data.get("timestamp"),
-                            "query": data.get("state", {}).get("raw_input", "")[:100]
-                        })
-            except Exception as e:
-                logger.warning(f"Skipping malformed conversation file {filename}: {e}")
-                
-    return sorted(conversations, key=lambda x: x.get("timestamp", ""), reverse=True)
+    conversations = [{"id": c["id"], "timestamp": c["timestamp"], "query": c["query"]} for c in stored_conversations()]
+    return sorted(conversations, key=lambda x: x.get("timestamp") or "", reverse=True)
+
+def delete_conversation(conversation_id: str) -> bool:
+    """Delete a conversation, its checkpoints and its blobs; False if it does not exist."""
+    checkpoint_store.delete(conversation_id)
+    with _store_lock:
+        found = False
+        blobs = _pack_blobs(_pack_path(conversation_id))
+        for filepath in (_pack_path(conversation_id), _json_path(conversation_id)):
+            if os.path.exists(filepath):
+                os.remove(filepath)
+                found = True
+        compacted = segment_store.remove(conversation_id)
+        if compacted is not None:
+            blobs += _payload_blobs(compacted)
+            found = True
+        if not found:
+            return False
+        collected = blob_store.release(blobs)
+    change_log.record_delete(conversation_id)
+    search_index.remove(conversation_id)
+    # Imported here: the semantic cache reads conversations through this module
+    from app.engine.semantic_cache import semantic_cache
+    semantic_cache.evict(conversation_id)
+    logger.info(f"Deleted conversation {conversation_id} ({collected} blobs collected)")
+    return True
+
+def compact_conversations(older_than: str, batch_size: int = 200) -> int:
+    """
+    Move conversations saved before the ISO timestamp `older_than` from their
+    own files into the append-only segments (legacy JSON is packed on the way).
+    Each batch is appended and indexed before its files are removed, so a crash
+    leaves at worst a duplicate, never a loss. Returns how many were moved.
+    """
+    settings = get_engine_settings()
+    candidates = [c["id"] for c in stored_conversations() if c["location"] == "file" and (c["timestamp"] or "") < older_than]
+    moved = 0
+    for start in range(0, len(candidates), batch_size):
+        with _store_lock:
+            batch = []
+            for conversation_id in candidates[start:start + batch_size]:
+                if os.path.exists(_pack_path(conversation_id)):
+                    with open(_pack_path(conversation_id), "rb") as f:
+                        batch.append((conversation_id, f.read()))
+                elif os.path.exists(_json_path(conversation_id)):
+                    with open(_json_path(conversation_id), "rb") as f:
+                        data = loads(f.read())
+                    batch.append((conversation_id, pack(
+                        conversation_id, data.get("timestamp") or "", data.get("state") or {},
+                        blobs=blob_store if settings.blob_dedup else None,
+                        blob_min_bytes=settings.blob_min_bytes
+                    )))
+            segment_store.append([payload for _, payload in batch])
+            for conversation_id, _ in batch:
+                for filepath in (_pack_path(conversation_id), _json_path(conversation_id)):
+                    if os.path.exists(filepath):
+                        os.remove(filepath)
+            moved += len(batch)
+    return moved
+
+def collect_garbage() -> Dict[str, int]:
+    """Recount blob references from every pack header and drop unreferenced blobs."""
+    live: List[str] = []
+    with _store_lock:
+        for filename in _conversation_files():
+            if filename.endswith(PACK_EXTENSION):
+                live.extend(_pack_blobs(os.path.join(DATA_DIR, filename)))
+        for payload in segment_store.iter_packs():
+            live.extend(_payload_blobs(payload))
+        return blob_store.gc(live)
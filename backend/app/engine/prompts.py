@@ -0,0 +1,84 @@
+from typing import Any, Dict, List, Optional
+from app.config.settings import get_engine_settings
+from app.engine.metrics import metrics
+from app.engine.providers import PROVIDER_OPENROUTER
+
+# Fixed instructions go first, in the system message, so every run shares the same
+# prompt prefix and provider-side prefix caches can hit. Per-request data
+# (query, constraints, responses) always goes in the user message after them.
+
+CLAIMS_INSTRUCTIONS = """Extract atomic, testable claims from the following text.
+Each claim should be:
+- A single, standalone statement
+- Verifiable or falsifiable
+- Free of subjective language
+- Split compound statements (with 'and', 'but', 'because') into separate claims
+- Under 25 words; return at most 20 claims and nothing else
+
+Respond with a JSON array of strings:
+["claim 1", "claim 2", ...]"""
+
+PEER_REVIEW_INSTRUCTIONS = """You are reviewing anonymized responses to a query. The query, its constraints and the responses follow in the user message.
+
+For each response provide:
+1. accuracy_score (1-10)
+2. insight_score (1-10)
+3. constraint_adherence (1-10)
+4. brief_feedback (one short sentence)
+
+Respond with JSON:
+{ "reviews": [ { "response_id": "Response_A", "accuracy": 8, "insight": 7, "constraint_adherence": 9, "feedback": "..." } ] }"""
+
+SYNTHESIS_INSTRUCTIONS = """You are the Chairman of an LLM Council. Your job is to synthesize a final, authoritative answer.
+The original query, its constraints, the scored topics and the council's responses follow in the user message.
+
+Synthesize a comprehensive answer that:
+1. Emphasizes high-confidence conclusions
+2. Acknowledges uncertainty
+3. Follows constraints
+4. Is actionable
+
+Respond with JSON:
+{
+  "final_answer": "...",
+  "key_recommendations": ["..."],
+  "uncertain_areas": ["..."]
+}"""
+
+# OpenRouter only honours explicit cache breakpoints for these model families;
+# OpenAI, Groq and DeepSeek routes cache prefixes automatically.
+_CACHE_CONTROL_MODEL_PREFIXES = ("anthropic/", "google/gemini")
+
+def supports_cache_control(provider_id: Optional[str], model: str) -> bool:
+    """Whether the route accepts explicit cache_control breakpoints."""
+    return provider_id == PROVIDER_OPENROUTER and model.startswith(_CACHE_CONTROL_MODEL_PREFIXES)
+
+def build_messages(instructions: str, request: str, provider_id: Optional[str], model: str) -> List[Dict[str, Any]]:
+    """
+    Chat messages with the stable instructions as a cacheable system prefix.
+    Where the route supports it, the prefix carries an ephemeral cache_control hint.
+    """
+    system: Any = instructions
+    if get_engine_settings().prompt_cache_hints and supports_cache_control(provider_id, model):
+        system = [{"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}}]
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": request}
+    ]
+
+def cached_prompt_tokens(usage: Any) -> int:
+    """Cached input tokens reported in a completion's usage, 0 if absent."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details is not None else None
+    if cached is None:
+        # Some routes pass the Anthropic field through unchanged
+        cached = (getattr(usage, "model_extra", None) or {}).get("cache_read_input_tokens")
+    return int(cached or 0)
+
+def record_usage(stage: str, completion: Any):
+    """Add a completion's prompt and cached-token counts to the prompt_cache metrics."""
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    metrics.increment("prompt_cache", f"{stage}_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    metrics.increment("prompt_cache", f"{stage}_cached_tokens", cached_prompt_tokens(usage))
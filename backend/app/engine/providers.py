@@ -2,7 +2,10 @@ import re
 import os
 from abc import ABC, abstractmethod
 from typing import List, Dict, Any, Optional
+import httpx
 from openai import AsyncOpenAI
+from app.config.settings import get_engine_settings
+from app.engine.anthropic_client import AnthropicClient, ANTHROPIC_BASE_URL
 
 # Provider Types
 PROVIDER_OPENAI = "openai"
@@ -10,10 +13,18 @@ PROVIDER_ANTHROPIC = "anthropic"
 PROVIDER_GROQ = "groq"
 PROVIDER_GEMINI = "gemini"
 PROVIDER_OPENROUTER = "openrouter"
+PROVIDER_LOCAL = "local"
+
+def _base_url(provider_id: str, default: Optional[str]) -> Optional[str]:
+    """API base URL for a provider, overridable with PROVIDER_BASE_URLS (e.g. for stub servers)."""
+    return get_engine_settings().provider_base_urls.get(provider_id, default)
 
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
     
+    # Model used for utility stages when the stage has no provider-specific default
+    utility_model: Optional[str] = None
+    
     @property
     @abstractmethod
     def provider_id(self) -> str:
@@ -27,8 +38,11 @@ class LLMProvider(ABC):
         pass
         
     @abstractmethod
-    def get_client(self, api_key: str) -> AsyncOpenAI:
-        """Return an initialized OpenAI-compatible AsyncClient."""
+    def get_client(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
+        """
+        Return an initialized OpenAI-compatible AsyncClient.
+        http_client: Optional HTTP client (e.g. routing requests through a key pool).
+        """
         pass
         
     @abstractmethod
@@ -40,6 +54,10 @@ class LLMProvider(ABC):
     def get_capabilities(self) -> List[str]:
         """Return list of capabilities (chat, json_mode, tools, etc)."""
         pass
+    
+    def auth_headers(self, api_key: str) -> Dict[str, str]:
+        """Headers authenticating a request with the given key."""
+        return {"Authorization": f"Bearer {api_key}"}
 
 class OpenAIProvider(LLMProvider):
     @property
@@ -48,8 +66,10 @@ class OpenAIProvider(LLMProvider):
     @property
     def name(self) -> str: return "OpenAI"
     
-    def get_client(self, api_key: str) -> AsyncOpenAI:
-        return AsyncOpenAI(api_key=api_key)
+    utility_model = "gpt-4o-mini"
+    
+    def get_client(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=api_key, base_url=_base_url(PROVIDER_OPENAI, None), http_client=http_client)
         
     def get_default_models(self) -> List[Dict[str, str]]:
         return [
@@ -68,10 +88,11 @@ class GroqProvider(LLMProvider):
     @property
     def name(self) -> str: return "Groq"
     
-    def get_client(self, api_key: str) -> AsyncOpenAI:
+    def get_client(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
         return AsyncOpenAI(
-            base_url="https://api.groq.com/openai/v1",
-            api_key=api_key
+            base_url=_base_url(PROVIDER_GROQ, "https://api.groq.com/openai/v1"),
+            api_key=api_key,
+            http_client=http_client
         )
         
     def get_default_models(self) -> List[Dict[str, str]]:
@@ -91,10 +112,11 @@ class OpenRouterProvider(LLMProvider):
     @property
     def name(self) -> str: return "OpenRouter"
     
-    def get_client(self, api_key: str) -> AsyncOpenAI:
+    def get_client(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
         return AsyncOpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=_base_url(PROVIDER_OPENROUTER, "https://openrouter.ai/api/v1"),
             api_key=api_key,
+            http_client=http_client,
             default_headers={
                 "HTTP-Referer": "http://localhost:8000",
                 "X-Title": "The Qubic Consensus Engine"
@@ -111,6 +133,86 @@ class OpenRouterProvider(LLMProvider):
     def get_capabilities(self) -> List[str]:
         return ["chat", "json_mode", "tools", "vision"]
 
+class AnthropicProvider(LLMProvider):
+    """Direct Messages API route for Anthropic keys (no OpenRouter hop)."""
+    @property
+    def provider_id(self) -> str: return PROVIDER_ANTHROPIC
+    
+    @property
+    def name(self) -> str: return "Anthropic"
+    
+    utility_model = "claude-3-5-haiku-latest"
+    
+    def get_client(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None) -> AnthropicClient:
+        return AnthropicClient(api_key, base_url=_base_url(PROVIDER_ANTHROPIC, ANTHROPIC_BASE_URL), http_client=http_client)
+    
+    def auth_headers(self, api_key: str) -> Dict[str, str]:
+        return {"x-api-key": api_key}
+        
+    def get_default_models(self) -> List[Dict[str, str]]:
+        return [
+            {"id": "claude-3-5-sonnet-latest", "name": "Claude 3.5 Sonnet", "provider": "anthropic"},
+            {"id": "claude-3-5-haiku-latest", "name": "Claude 3.5 Haiku", "provider": "anthropic"},
+        ]
+        
+    def get_capabilities(self) -> List[str]:
+        return ["chat", "json_mode", "streaming", "prompt_caching", "vision"]
+
+class GeminiProvider(LLMProvider):
+    """Google's own OpenAI-compatible endpoint for Gemini keys (no OpenRouter hop)."""
+    @property
+    def provider_id(self) -> str: return PROVIDER_GEMINI
+    
+    @property
+    def name(self) -> str: return "Google Gemini"
+    
+    utility_model = "gemini-2.0-flash"
+    
+    def get_client(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            base_url=_base_url(PROVIDER_GEMINI, "https://generativelanguage.googleapis.com/v1beta/openai/"),
+            api_key=api_key,
+            http_client=http_client
+        )
+        
+    def get_default_models(self) -> List[Dict[str, str]]:
+        return [
+            {"id": "gemini-2.0-flash", "name": "Gemini 2.0 Flash", "provider": "gemini"},
+            {"id": "gemini-1.5-pro", "name": "Gemini 1.5 Pro", "provider": "gemini"},
+        ]
+        
+    def get_capabilities(self) -> List[str]:
+        return ["chat", "json_mode", "streaming", "vision"]
+
+class LocalProvider(LLMProvider):
+    """
+    OpenAI-compatible server on this machine (Ollama, llama.cpp server, ...),
+    meant for the utility stages. Configured with LOCAL_BASE_URL and LOCAL_MODEL.
+    """
+    @property
+    def provider_id(self) -> str: return PROVIDER_LOCAL
+    
+    @property
+    def name(self) -> str: return "Local"
+    
+    @property
+    def utility_model(self) -> Optional[str]:
+        return get_engine_settings().local_model
+    
+    def get_client(self, api_key: str, http_client: Optional[httpx.AsyncClient] = None) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            base_url=_base_url(PROVIDER_LOCAL, get_engine_settings().local_base_url),
+            api_key=api_key,
+            http_client=http_client
+        )
+        
+    def get_default_models(self) -> List[Dict[str, str]]:
+        model = get_engine_settings().local_model
+        return [{"id": model, "name": f"{model} (local)", "provider": "local"}]
+        
+    def get_capabilities(self) -> List[str]:
+        return ["chat", "json_mode", "offline"]
+
 class ProviderFactory:
     """Factory to detect provider and return adapter."""
     
@@ -132,15 +234,8 @@ class ProviderFactory:
         elif re.match(cls.PATTERN_OPENAI, api_key):
             return PROVIDER_OPENAI
         elif re.match(cls.PATTERN_ANTHROPIC, api_key):
-            # For this MVP, we map Anthropic native keys to OpenRouter or similar if we haven't implemented native client
-            # But the requirement asks for detection. Let's return Anthropic.
-            # However, our system uses OpenAI SDK. 
-            # Anthropic native requires `anthropic` package. 
-            # For simplicty in this "Universal" layer which claims "Common OpenAI-compatible interface",
-            # we might flag this as "Native Anthropic not fully supported via OpenAI SDK adapter yet" 
-            # OR we implement an adapter that uses the Anthropic SDK but exposes the same interface.
-            # To keep it simple and safe for now, let's treat it as detected but maybe fallback or warn.
-            return PROVIDER_ANTHROPIC 
+            # Served directly by AnthropicProvider (Messages API)
+            return PROVIDER_ANTHROPIC
         elif re.match(cls.PATTERN_GEMINI, api_key):
             return PROVIDER_GEMINI
             
@@ -164,6 +259,12 @@ class ProviderFactory:
             return GroqProvider()
         elif provider_id == PROVIDER_OPENROUTER:
             return OpenRouterProvider()
+        elif provider_id == PROVIDER_ANTHROPIC:
+            return AnthropicProvider()
+        elif provider_id == PROVIDER_GEMINI:
+            return GeminiProvider()
+        elif provider_id == PROVIDER_LOCAL:
+            return LocalProvider()
         else:
             # Fallback to OpenRouter for unknown types as it supports most models
             return OpenRouterProvider()
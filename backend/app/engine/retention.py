@@ -0,0 +1,108 @@
+import asyncio
+import gzip
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from app.config.settings import get_engine_settings
+from app.engine.metrics import metrics
+from app.engine.persistence import stored_conversations, compact_conversations, delete_conversation, load_conversation
+from app.engine.segments import segment_store
+from app.utils.logger import get_logger
+from app.utils.serialization import dumps
+
+logger = get_logger(__name__)
+
+# Expired conversations are appended here before deletion
+ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "archive")
+
+_maintenance_lock = threading.Lock()
+
+def expired(conversations: List[Dict[str, Any]], now: datetime, settings) -> List[Dict[str, Any]]:
+    """
+    Conversations outside the retention policy, oldest first. A conversation
+    expires when it is older than retention_max_age_days, beyond the newest
+    retention_max_count, or would push the stored size past retention_max_bytes.
+    Sizes should include blobs and checkpoints (stored_conversations(full_size=True)).
+    """
+    newest_first = sorted(conversations, key=lambda c: c.get("timestamp") or "", reverse=True)
+    cutoff = (now - timedelta(days=settings.retention_max_age_days)).isoformat() if settings.retention_max_age_days else None
+    kept_bytes = 0
+    dropped = []
+    for rank, conversation in enumerate(newest_first):
+        kept_bytes += conversation.get("size", 0)
+        if (
+            (cutoff is not None and (conversation.get("timestamp") or "") < cutoff)
+            or (settings.retention_max_count is not None and rank >= settings.retention_max_count)
+            or (settings.retention_max_bytes is not None and kept_bytes > settings.retention_max_bytes)
+        ):
+            dropped.append(conversation)
+    return dropped[::-1]
+
+def archive(conversation_ids: List[str], now: Optional[datetime] = None) -> Optional[str]:
+    """
+    Append full conversations (blobs resolved) as NDJSON to this month's
+    gzip archive; returns its path. Each call adds a gzip member, which
+    gzip readers concatenate transparently.
+    """
+    if not conversation_ids:
+        return None
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"conversations-{(now or datetime.now()):%Y-%m}.ndjson.gz")
+    with gzip.open(path, "ab") as f:
+        for conversation_id in conversation_ids:
+            data = load_conversation(conversation_id)
+            if data is not None:
+                f.write(dumps(data) + b"\n")
+    return path
+
+def run_maintenance(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Apply retention (archiving first when enabled), compact conversations
+    older than compact_after_days into segments and rewrite segments that are
+    mostly dead space. Concurrent calls are skipped rather than queued.
+    """
+    if not _maintenance_lock.acquire(blocking=False):
+        return {"skipped": True}
+    try:
+        settings = get_engine_settings()
+        now = now or datetime.now()
+        started = time.perf_counter()
+
+        # Full sizes cost a pass over compacted packs, so only when a byte limit applies
+        conversations = stored_conversations(full_size=settings.retention_max_bytes is not None)
+        dropped = [c["id"] for c in expired(conversations, now, settings)]
+        archive_path = archive(dropped, now) if settings.archive_expired else None
+        deleted = sum(1 for conversation_id in dropped if delete_conversation(conversation_id))
+
+        compacted = compact_conversations((now - timedelta(days=settings.compact_after_days)).isoformat())
+        reclaimed = segment_store.rewrite_sparse(settings.segment_min_live_ratio)
+
+        report = {
+            "deleted": deleted,
+            "archive": archive_path,
+            "compacted": compacted,
+            "segment_bytes_reclaimed": reclaimed,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        metrics.increment("storage", "maintenance_runs")
+        metrics.increment("storage", "expired", deleted)
+        metrics.increment("storage", "compacted", compacted)
+        if deleted or compacted or reclaimed:
+            logger.info(f"Storage maintenance: {report}")
+        return report
+    finally:
+        _maintenance_lock.release()
+
+async def maintenance_loop():
+    """Run maintenance every compaction_interval_seconds in a worker thread, off the request path."""
+    while True:
+        interval = get_engine_settings().compaction_interval_seconds
+        if interval <= 0:
+            return
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_maintenance)
+        except Exception as e:
+            logger.error(f"Storage maintenance failed: {e}")
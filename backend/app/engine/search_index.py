@@ -0,0 +1,229 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Shared SQLite database for indexes derived from the conversation files
+INDEX_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "data", "index.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE NOT NULL,
+    timestamp TEXT,
+    query TEXT,
+    intent TEXT,
+    domain TEXT,
+    models TEXT,
+    confidence REAL
+);
+CREATE INDEX IF NOT EXISTS conversations_timestamp ON conversations(timestamp);
+CREATE INDEX IF NOT EXISTS conversations_intent ON conversations(intent, timestamp);
+CREATE INDEX IF NOT EXISTS conversations_domain ON conversations(domain, timestamp);
+CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+    prompt, answer, claims, intent, domain, models,
+    tokenize='porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# bm25 weights for prompt, answer, claims, intent, domain, models
+_WEIGHTS = "4.0, 2.0, 1.0, 1.0, 1.0, 0.5"
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Turn free text into a safe FTS5 query: every word must match, the last
+    one as a prefix so results appear while the user is still typing.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return None
+    quoted = [f'"{t}"' for t in tokens]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def document(state: Dict[str, Any]) -> Dict[str, str]:
+    """Searchable fields of a stored run."""
+    normalized = state.get("normalized") or {}
+    consensus = state.get("consensus") or {}
+    claims = [c.get("text", "") for cr in state.get("all_claims") or [] for c in cr.get("claims") or []]
+    models = sorted({r.get("model_id", "") for r in state.get("model_responses") or []} - {"", "system"})
+    return {
+        "prompt": " ".join(filter(None, [state.get("raw_input", ""), normalized.get("normalized_prompt", "")])),
+        "answer": consensus.get("final_answer", ""),
+        "claims": "\n".join(claims),
+        "intent": normalized.get("intent", ""),
+        "domain": normalized.get("domain", ""),
+        "models": " ".join(models),
+    }
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 index over stored conversations: prompts, final answers,
+    claims, intent/domain and model ids. Kept up to date by save_conversation,
+    so searches never read the JSON files. The first use on an existing data
+    directory backfills the index from the files once.
+    """
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _upsert(self, db: sqlite3.Connection, conversation_id: str, timestamp: str, state: Dict[str, Any]):
+        doc = document(state)
+        row = db.execute("SELECT rowid FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is not None:
+            db.execute("DELETE FROM conversations_fts WHERE rowid = ?", (row["rowid"],))
+            db.execute("DELETE FROM conversations WHERE rowid = ?", (row["rowid"],))
+        cursor = db.execute(
+            "INSERT INTO conversations (id, timestamp, query, intent, domain, models, confidence) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                conversation_id, timestamp, (state.get("raw_input") or "")[:100], doc["intent"], doc["domain"],
+                doc["models"], (state.get("consensus") or {}).get("confidence")
+            )
+        )
+        db.execute(
+            "INSERT INTO conversations_fts (rowid, prompt, answer, claims, intent, domain, models) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (cursor.lastrowid, doc["prompt"], doc["answer"], doc["claims"], doc["intent"], doc["domain"], doc["models"])
+        )
+
+    def add(self, conversation_id: str, timestamp: str, state: Dict[str, Any]):
+        """Index (or re-index) one conversation."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                self._upsert(db, conversation_id, timestamp, state)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def remove(self, conversation_id: str):
+        """Drop a conversation from the index."""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT rowid FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is not None:
+                db.execute("DELETE FROM conversations_fts WHERE rowid = ?", (row["rowid"],))
+                db.execute("DELETE FROM conversations WHERE rowid = ?", (row["rowid"],))
+
+    def ensure_built(self, conversations: Optional[Iterable[Dict[str, Any]]] = None):
+        """Backfill from the stored conversations once per index file."""
+        with self._lock:
+            db = self._db()
+            if db.execute("SELECT value FROM meta WHERE key = 'backfilled'").fetchone():
+                return
+            if conversations is None:
+                from app.engine.persistence import iter_conversations
+                conversations = iter_conversations()
+            started = time.perf_counter()
+            count = 0
+            db.execute("BEGIN")
+            try:
+                for data in conversations:
+                    if data.get("id"):
+                        self._upsert(db, data["id"], data.get("timestamp", ""), data.get("state") or {})
+                        count += 1
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', '1')")
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            logger.info(f"Search index backfilled with {count} conversations in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def search(
+        self,
+        q: str = "",
+        intent: Optional[str] = None,
+        domain: Optional[str] = None,
+        model: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Ranked conversations matching the text (bm25, prompt matches weighted
+        highest) and the structured filters. Without text, newest first.
+        Returns (total matches, page of results).
+        """
+        self.ensure_built()
+        started = time.perf_counter()
+        where, params = [], []
+        if intent:
+            where.append("c.intent = ?")
+            params.append(intent)
+        if domain:
+            where.append("c.domain = ?")
+            params.append(domain)
+        if model:
+            where.append("(' ' || c.models || ' ') LIKE ?")
+            params.append(f"% {model} %")
+
+        match = fts_query(q or "")
+        if match:
+            # Materialize the full-text hits first so SQLite never runs MATCH once per filtered row
+            prefix = (
+                "WITH hits AS MATERIALIZED ("
+                f"SELECT rowid, bm25(conversations_fts, {_WEIGHTS}) AS rank FROM conversations_fts WHERE conversations_fts MATCH ?"
+                ") "
+            )
+            params.insert(0, match)
+            source = "hits JOIN conversations c ON c.rowid = hits.rowid"
+            order, score = "hits.rank", "-hits.rank"
+        else:
+            prefix, source = "", "conversations c"
+            order, score = "c.timestamp DESC", "NULL"
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+
+        with self._lock:
+            db = self._db()
+            total = db.execute(f"{prefix}SELECT COUNT(*) FROM {source} {clause}", params).fetchone()[0]
+            rows = db.execute(
+                f"{prefix}SELECT c.id, c.timestamp, c.query, c.intent, c.domain, c.models, c.confidence, {score} AS score "
+                f"FROM {source} {clause} ORDER BY {order} LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        metrics.increment("search", "queries")
+        metrics.increment("search", "latency_ms_total", (time.perf_counter() - started) * 1000)
+        return total, [
+            {
+                "id": r["id"],
+                "timestamp": r["timestamp"],
+                "query": r["query"],
+                "intent": r["intent"],
+                "domain": r["domain"],
+                "models": r["models"].split() if r["models"] else [],
+                "confidence": r["confidence"],
+                "score": round(r["score"], 4) if r["score"] is not None else None,
+            }
+            for r in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Global index shared by persistence and the API
+search_index = SearchIndex()
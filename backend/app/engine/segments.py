@@ -0,0 +1,258 @@
+import io
+import os
+import re
+import sqlite3
+import struct
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.config.settings import get_engine_settings
+from app.engine.storage import read_header
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Compacted conversations: append-only segment files of framed packs
+SEGMENT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "segments")
+
+# Frame: kind (4 bytes) + payload length (uint32 LE) + payload. A CONV payload is a
+# conversation pack; a TOMB payload is the id of a conversation that left the segments.
+_FRAME = struct.Struct("<4sI")
+_CONV, _TOMB = b"CONV", b"TOMB"
+_SEGMENT_RE = re.compile(r"^(\d{6})\.seg$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    timestamp TEXT,
+    query TEXT
+);
+CREATE INDEX IF NOT EXISTS records_segment ON records(segment);
+CREATE INDEX IF NOT EXISTS records_timestamp ON records(timestamp);
+"""
+
+
+class SegmentStore:
+    """
+    Append-only segment files holding many packed conversations, with an
+    offset index (id -> segment, offset, length) for random access.
+
+    The segments are the source of truth: the index is rebuilt from them by
+    replaying frames in order when it is missing. Removing a conversation
+    appends a tombstone; the space it used is reclaimed when its segment is
+    rewritten.
+    """
+    def __init__(self, root: str = SEGMENT_DIR, max_bytes: int = 64 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.root, f"{segment:06d}.seg")
+
+    def _segments(self) -> List[int]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(m.group(1)) for m in map(_SEGMENT_RE.match, os.listdir(self.root)) if m)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.root, exist_ok=True)
+            path = os.path.join(self.root, "index.sqlite")
+            fresh = not os.path.exists(path)
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            if fresh and self._segments():
+                self.rebuild_index()
+        return self._conn
+
+    def _active(self) -> int:
+        segments = self._segments()
+        if not segments:
+            return 1
+        last = segments[-1]
+        return last + 1 if os.path.getsize(self._path(last)) >= self.max_bytes else last
+
+    def _append(self, frames: List[Tuple[bytes, bytes]]) -> List[Tuple[int, int]]:
+        """
+        Append frames, rolling over to a new segment once one reaches max_bytes,
+        and flush them to disk. Returns (segment, payload offset) per frame.
+        """
+        located: List[Tuple[int, int]] = []
+        while len(located) < len(frames):
+            segment = self._active()
+            with open(self._path(segment), "ab") as f:
+                position = f.tell()
+                while len(located) < len(frames) and position < self.max_bytes:
+                    kind, payload = frames[len(located)]
+                    located.append((segment, position + _FRAME.size))
+                    f.write(_FRAME.pack(kind, len(payload)))
+                    f.write(payload)
+                    position += _FRAME.size + len(payload)
+                f.flush()
+                os.fsync(f.fileno())
+        return located
+
+    def append(self, packs: List[bytes]):
+        """Add packed conversations; a newer copy of an id replaces the indexed one."""
+        if not packs:
+            return
+        with self._lock:
+            db = self._db()
+            located = self._append([(_CONV, p) for p in packs])
+            db.execute("BEGIN")
+            try:
+                for payload, (segment, offset) in zip(packs, located):
+                    header, _ = read_header(io.BytesIO(payload))
+                    db.execute(
+                        "REPLACE INTO records (id, segment, offset, length, timestamp, query) VALUES (?, ?, ?, ?, ?, ?)",
+                        (header["id"], segment, offset, len(payload), header.get("timestamp"),
+                         header.get("summary", {}).get("query", ""))
+                    )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def read(self, conversation_id: str) -> Optional[bytes]:
+        """The pack of a compacted conversation, None if it is not in the segments."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT segment, offset, length FROM records WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            segment, offset, length = row
+            with open(self._path(segment), "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+
+    def remove(self, conversation_id: str) -> Optional[bytes]:
+        """Drop a conversation from the segments; returns its pack (for releasing its blobs)."""
+        with self._lock:
+            payload = self.read(conversation_id)
+            if payload is None:
+                return None
+            self._append([(_TOMB, conversation_id.encode())])
+            self._db().execute("DELETE FROM records WHERE id = ?", (conversation_id,))
+            return payload
+
+    def __contains__(self, conversation_id: str) -> bool:
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM records WHERE id = ?", (conversation_id,)).fetchone() is not None
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """id, timestamp, query and size of every compacted conversation."""
+        with self._lock:
+            rows = self._db().execute("SELECT id, timestamp, query, length FROM records").fetchall()
+        return [{"id": r[0], "timestamp": r[1], "query": r[2], "size": r[3]} for r in rows]
+
+    def iter_packs(self) -> Iterator[bytes]:
+        """Every live pack, segment by segment."""
+        with self._lock:
+            rows = self._db().execute("SELECT id FROM records ORDER BY segment, offset").fetchall()
+        for (conversation_id,) in rows:
+            payload = self.read(conversation_id)
+            if payload is not None:
+                yield payload
+
+    def rewrite_sparse(self, min_live_ratio: float) -> int:
+        """
+        Copy the live records of segments that are mostly dead space into the
+        active segment and delete the old files. The active segment is left alone.
+        Returns the bytes reclaimed.
+        """
+        reclaimed = 0
+        with self._lock:
+            db = self._db()
+            active = self._active()
+            for segment in self._segments():
+                if segment == active:
+                    continue
+                size = os.path.getsize(self._path(segment))
+                live = db.execute(
+                    "SELECT id FROM records WHERE segment = ? ORDER BY offset", (segment,)
+                ).fetchall()
+                live_bytes = db.execute(
+                    "SELECT COALESCE(SUM(length), 0) FROM records WHERE segment = ?", (segment,)
+                ).fetchone()[0]
+                if size and live_bytes / size >= min_live_ratio:
+                    continue
+                self.append([self.read(conversation_id) for (conversation_id,) in live])
+                # Tombstones still hide older copies in earlier segments
+                tombstones = [
+                    (_TOMB, payload) for kind, _, payload in _frames(self._path(segment))
+                    if kind == _TOMB and payload.decode() not in self
+                ]
+                if tombstones:
+                    self._append(tombstones)
+                os.remove(self._path(segment))
+                reclaimed += size - live_bytes
+                logger.info(f"Rewrote segment {segment}: {len(live)} live records, {size - live_bytes} bytes reclaimed")
+        return reclaimed
+
+    def rebuild_index(self) -> int:
+        """Rebuild the offset index by replaying every segment in order; returns the live record count."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                db.execute("DELETE FROM records")
+                for segment in self._segments():
+                    for kind, offset, payload in _frames(self._path(segment)):
+                        if kind == _TOMB:
+                            db.execute("DELETE FROM records WHERE id = ?", (payload.decode(),))
+                            continue
+                        header, _ = read_header(io.BytesIO(payload))
+                        db.execute(
+                            "REPLACE INTO records (id, segment, offset, length, timestamp, query) VALUES (?, ?, ?, ?, ?, ?)",
+                            (header["id"], segment, offset, len(payload), header.get("timestamp"),
+                             header.get("summary", {}).get("query", ""))
+                        )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            count = db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        logger.info(f"Segment index rebuilt with {count} records")
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Segment count, file bytes and bytes still referenced by the index."""
+        with self._lock:
+            records, live = self._db().execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM records").fetchone()
+            segments = self._segments()
+            size = sum(os.path.getsize(self._path(s)) for s in segments)
+        return {"segments": len(segments), "records": records, "bytes": size, "live_bytes": live}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _frames(path: str) -> Iterator[Tuple[bytes, int, bytes]]:
+    """(kind, payload offset, payload) of each complete frame; a torn final frame is ignored."""
+    with open(path, "rb") as f:
+        while True:
+            head = f.read(_FRAME.size)
+            if len(head) < _FRAME.size:
+                return
+            kind, length = _FRAME.unpack(head)
+            offset = f.tell()
+            payload = f.read(length)
+            if len(payload) < length or kind not in (_CONV, _TOMB):
+                logger.warning(f"Ignoring torn frame at offset {offset} of {path}")
+                return
+            yield kind, offset, payload
+
+
+# Global store shared by persistence and the compactor
+segment_store = SegmentStore(max_bytes=get_engine_settings().segment_max_bytes)
@@ -0,0 +1,205 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import ValidationError
+from app.models import FinalConsensus, ModelResponse, SemanticMatch
+from app.engine.checkpoints import is_degraded
+from app.engine.embeddings import embed_text, EMBEDDING_DIMS
+from app.engine.persistence import iter_conversations, load_conversation
+from app.engine.metrics import metrics
+from app.config.settings import get_engine_settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# State fields the index is built from; claims, reviews and clusters stay packed
+CACHE_FIELDS = ["raw_input", "locked_context", "errors", "consensus", "model_responses"]
+
+def is_cacheable(state: dict) -> bool:
+    """
+    Only successful runs are reused: no errors, at least one model answer, and
+    neither a failed model call nor a fallback synthesis among the outputs.
+    """
+    if state.get("errors") or not state.get("consensus") or not state.get("locked_context"):
+        return False
+    try:
+        responses = [ModelResponse(**r) for r in state.get("model_responses") or []]
+        consensus = FinalConsensus(**state["consensus"])
+    except (TypeError, ValidationError):
+        return False
+    return bool(responses) and not is_degraded("execution", responses) and not is_degraded("synthesis", consensus)
+
+
+class _LSHIndex:
+    """
+    Random-hyperplane LSH over unit vectors. Candidates from all tables are
+    re-ranked exactly, so it trades a little recall for sub-linear lookups.
+    """
+    def __init__(self, dims: int, tables: int = 6, bits: int = 12, seed: int = 7):
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((tables, bits, dims)).astype(np.float32)
+        self.weights = 1 << np.arange(bits, dtype=np.int64)
+        self.buckets: List[Dict[int, List[int]]] = [{} for _ in range(tables)]
+
+    def _codes(self, vector: np.ndarray) -> np.ndarray:
+        return ((self.planes @ vector) > 0).astype(np.int64) @ self.weights
+
+    def add(self, row: int, vector: np.ndarray):
+        for table, code in enumerate(self._codes(vector)):
+            self.buckets[table].setdefault(int(code), []).append(row)
+
+    def candidates(self, vector: np.ndarray) -> np.ndarray:
+        rows = set()
+        for table, code in enumerate(self._codes(vector)):
+            rows.update(self.buckets[table].get(int(code), ()))
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+
+class _Partition:
+    """Embeddings of past prompts that share one constraint_hash."""
+    def __init__(self, dims: int):
+        self.vectors = np.zeros((16, dims), dtype=np.float32)
+        self.entries: List[Optional[Tuple[str, str]]] = []  # (conversation_id, query); None once evicted
+        self.lsh: Optional[_LSHIndex] = None
+
+    def add(self, vector: np.ndarray, conversation_id: str, query: str):
+        row = len(self.entries)
+        if row == len(self.vectors):
+            grown = np.zeros((row * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:row] = self.vectors
+            self.vectors = grown
+        self.vectors[row] = vector
+        self.entries.append((conversation_id, query))
+        if self.lsh is not None:
+            self.lsh.add(row, vector)
+
+    def remove(self, conversation_id: str) -> int:
+        """Evict a conversation's rows; their zeroed vectors never clear a threshold."""
+        removed = 0
+        for row, entry in enumerate(self.entries):
+            if entry is not None and entry[0] == conversation_id:
+                self.vectors[row] = 0
+                self.entries[row] = None
+                removed += 1
+        return removed
+
+    def build_lsh(self):
+        self.lsh = _LSHIndex(self.vectors.shape[1])
+        for row in range(len(self.entries)):
+            self.lsh.add(row, self.vectors[row])
+
+    def best(self, vector: np.ndarray) -> Tuple[int, float]:
+        if self.lsh is not None:
+            rows = self.lsh.candidates(vector)
+            if len(rows) == 0:
+                return -1, 0.0
+            scores = self.vectors[rows] @ vector
+            i = int(np.argmax(scores))
+            return int(rows[i]), float(scores[i])
+        scores = self.vectors[:len(self.entries)] @ vector
+        i = int(np.argmax(scores))
+        return i, float(scores[i])
+
+
+class SemanticCache:
+    """
+    Near-duplicate lookup of past consensus results.
+
+    Normalized prompts are embedded locally and kept in one matrix per
+    constraint_hash, so a lookup only compares against runs with identical
+    locked constraints. Brute-force search is used until a partition reaches
+    ann_min_size entries, after which an LSH index narrows the candidates.
+    """
+    def __init__(self, threshold: float = 0.92, ann_min_size: int = 20000, dims: int = EMBEDDING_DIMS):
+        self.threshold = threshold
+        self.ann_min_size = ann_min_size
+        self.dims = dims
+        self._partitions: Dict[str, _Partition] = {}
+        self._loaded = False
+        # Reentrant: building the index adds entries while holding it
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return sum(sum(1 for e in p.entries if e is not None) for p in self._partitions.values())
+
+    def ensure_loaded(self):
+        """Build the index from stored conversations (at startup, or else on first use)."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            started = time.perf_counter()
+            for data in iter_conversations(fields=CACHE_FIELDS):
+                self.add_state(data.get("id"), data.get("state") or {})
+            self._loaded = True
+            logger.info(f"Semantic cache built with {len(self)} entries in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def remember(self, conversation_id: Optional[str], state: dict):
+        """Index a freshly saved run; a no-op until the index has been built."""
+        if self._loaded:
+            self.add_state(conversation_id, state)
+
+    def add_state(self, conversation_id: Optional[str], state: dict):
+        """Index a saved run if it is eligible for reuse."""
+        if not conversation_id or not is_cacheable(state):
+            return
+        prompt = state["locked_context"]["normalized_prompt_data"]["normalized_prompt"]
+        self.add(conversation_id, prompt, state["locked_context"]["constraint_hash"], state.get("raw_input", ""))
+
+    def add(self, conversation_id: str, normalized_prompt: str, constraint_hash: str, query: str = ""):
+        """Index a single normalized prompt."""
+        vector = embed_text(normalized_prompt, self.dims)
+        with self._lock:
+            partition = self._partitions.get(constraint_hash)
+            if partition is None:
+                partition = self._partitions[constraint_hash] = _Partition(self.dims)
+            partition.add(vector, conversation_id, query[:100])
+            if partition.lsh is None and self.ann_min_size and len(partition.entries) >= self.ann_min_size:
+                partition.build_lsh()
+
+    def evict(self, conversation_id: str):
+        """Stop offering a deleted conversation."""
+        with self._lock:
+            removed = sum(p.remove(conversation_id) for p in self._partitions.values())
+        if removed:
+            metrics.increment("semantic_cache", "evicted", removed)
+
+    def lookup(self, normalized_prompt: str, constraint_hash: str, threshold: Optional[float] = None) -> Optional[SemanticMatch]:
+        """Return the closest past run above the threshold, with its consensus."""
+        self.ensure_loaded()
+        threshold = self.threshold if threshold is None else threshold
+        vector = embed_text(normalized_prompt, self.dims)
+        with self._lock:
+            partition = self._partitions.get(constraint_hash)
+            if partition is None or not partition.entries:
+                metrics.increment("semantic_cache", "misses")
+                return None
+            row, similarity = partition.best(vector)
+            entry = partition.entries[row] if row >= 0 else None
+        if entry is None or similarity < threshold:
+            metrics.increment("semantic_cache", "misses")
+            return None
+
+        conversation_id, query = entry
+        stored = load_conversation(conversation_id, fields=["consensus"])
+        consensus = ((stored or {}).get("state") or {}).get("consensus")
+        if not consensus:
+            metrics.increment("semantic_cache", "misses")
+            return None
+
+        metrics.increment("semantic_cache", "hits")
+        return SemanticMatch(
+            conversation_id=conversation_id,
+            similarity=round(similarity, 4),
+            query=query,
+            consensus=FinalConsensus(**consensus)
+        )
+
+
+# Global cache shared by the engine
+semantic_cache = SemanticCache(
+    threshold=get_engine_settings().semantic_cache_threshold,
+    ann_min_size=get_engine_settings().semantic_cache_ann_min_size
+)
@@ -0,0 +1,48 @@
+import asyncio
+from typing import List, Optional
+from app.models import LockedContext, ModelResponse
+from app.engine.agreement import AgreementTracker
+from app.engine.embeddings import cosine_similarity
+from app.engine.execution import build_council_prompt
+from app.engine.metrics import metrics
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+class Speculation:
+    """
+    Council calls started on the raw prompt while normalization is still running.
+
+    Once the real locked context is known, the speculative prompt is compared
+    with the one the council would have received. Above the threshold the
+    in-flight responses are kept; otherwise they are cancelled and reissued.
+    """
+    def __init__(self, context: LockedContext, task: asyncio.Task, tracker: Optional[AgreementTracker] = None):
+        self.context = context
+        self.task = task
+        self.tracker = tracker
+        self.similarity: Optional[float] = None
+
+    def matches(self, context: LockedContext, threshold: float) -> bool:
+        """Whether the speculative prompt is close enough to the normalized one."""
+        self.similarity = cosine_similarity(build_council_prompt(self.context), build_council_prompt(context))
+        kept = self.similarity >= threshold
+        metrics.increment("speculation", "kept" if kept else "reissued")
+        logger.info(f"Speculative council {'kept' if kept else 'reissued'} (similarity {self.similarity:.2f})")
+        return kept
+
+    async def result(self) -> List[ModelResponse]:
+        """Await the speculative council responses."""
+        return await self.task
+
+    def cancel(self):
+        """Cancel the speculative calls if they are still running."""
+        if not self.task.done():
+            self.task.cancel()
+
+    def trace_entry(self) -> dict:
+        """Reasoning-trace record of a kept speculation."""
+        return {
+            "step": "speculation",
+            "details": f"Council queried with the raw prompt during normalization (similarity {self.similarity:.2f})"
+        }
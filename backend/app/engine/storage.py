@@ -0,0 +1,197 @@
+import struct
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from app.utils.serialization import dumps, loads
+
+# Optional faster codec; packs record which codec wrote them
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depends on environment
+    zstandard = None
+
+# Packed conversation file: MAGIC, header length (uint32 LE), JSON header, section blobs.
+# The header holds id, timestamp, a short summary and each section's offset/length, so
+# listing history reads a few hundred bytes and a single section can be inflated alone.
+MAGIC = b"QCP1"
+PACK_EXTENSION = ".qcp"
+_HEADER_LEN = struct.Struct("<I")
+
+# Section name -> state keys stored in it; keys not listed here go to "meta"
+SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "meta": (
+        "raw_input", "conversation_id", "profile", "normalized", "locked_context", "semantic_match", "errors"
+    ),
+    "model_responses": ("model_responses",),
+    "claims": ("all_claims",),
+    "reviews": ("peer_reviews",),
+    "clusters": ("agreement_clusters", "scored_clusters"),
+    "consensus": ("consensus",),
+}
+_SECTION_OF = {key: name for name, keys in SECTIONS.items() for key in keys}
+_CLUSTER_FIELDS = ("cluster_id", "canonical_claim", "supporting_models", "conflicting_models")
+# Values moved to the blob store: (state key, field of each list item)
+BLOB_FIELDS = (("model_responses", "response_text"), ("all_claims", "claims"))
+# Section key listing the values moved out as [[key, index, field], hash]
+_BLOB_REFS = "$blobs"
+
+def sections_for(fields: Optional[Iterable[str]]) -> Optional[Set[str]]:
+    """Sections holding the given (optionally dotted) state fields; None means all."""
+    if not fields:
+        return None
+    return {_SECTION_OF.get(field.split(".", 1)[0], "meta") for field in fields}
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return zlib.compress(data, 6)
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("conversation pack is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+def _dedupe_clusters(section: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Agreement clusters repeat the id, claim and model lists of the scored cluster
+    built from them; store those as a reference to the scored cluster's id.
+    """
+    scored = {c.get("cluster_id"): c for c in section.get("scored_clusters") or [] if isinstance(c, dict)}
+    clusters = []
+    for cluster in section.get("agreement_clusters") or []:
+        match = scored.get(cluster.get("cluster_id")) if isinstance(cluster, dict) else None
+        if match is not None and set(cluster) == set(_CLUSTER_FIELDS) and all(cluster[f] == match.get(f) for f in _CLUSTER_FIELDS):
+            clusters.append({"ref": cluster["cluster_id"]})
+        else:
+            clusters.append(cluster)
+    if "agreement_clusters" in section:
+        section = {**section, "agreement_clusters": clusters}
+    return section
+
+def _restore_clusters(section: Dict[str, Any]) -> Dict[str, Any]:
+    scored = {c.get("cluster_id"): c for c in section.get("scored_clusters") or []}
+    if "agreement_clusters" in section:
+        section["agreement_clusters"] = [
+            {f: scored[c["ref"]][f] for f in _CLUSTER_FIELDS} if set(c) == {"ref"} else c
+            for c in section["agreement_clusters"]
+        ]
+    return section
+
+def _codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+def compress_blob(data: bytes) -> Tuple[str, bytes]:
+    """Compress a blob store value; returns (codec, compressed bytes)."""
+    codec = _codec()
+    return codec, _compress(data, codec)
+
+def _extract_blobs(grouped: Dict[str, Dict[str, Any]], blobs: Any, min_bytes: int) -> List[str]:
+    """
+    Move large response texts and claim lists into the blob store, leaving
+    references in their section. Returns the referenced hashes.
+    """
+    hashes: List[str] = []
+    for key, field in BLOB_FIELDS:
+        section = grouped.get(_SECTION_OF[key])
+        items = (section or {}).get(key)
+        if not isinstance(items, list):
+            continue
+        paths, values = [], []
+        for index, item in enumerate(items):
+            if isinstance(item, dict) and item.get(field) is not None:
+                value = dumps(item[field])
+                if len(value) >= min_bytes:
+                    paths.append([key, index, field])
+                    values.append(value)
+        if not values:
+            continue
+        refs = list(zip(paths, blobs.put_many(values, compress_blob)))
+        moved = {index for _, index, _ in paths}
+        section[key] = [
+            {k: v for k, v in item.items() if k != field} if index in moved else item
+            for index, item in enumerate(items)
+        ]
+        section.setdefault(_BLOB_REFS, []).extend([path, digest] for path, digest in refs)
+        hashes.extend(digest for _, digest in refs)
+    return hashes
+
+def _resolve_blobs(section: Dict[str, Any], blobs: Any):
+    refs = section.pop(_BLOB_REFS, None)
+    if not refs:
+        return
+    if blobs is None:
+        raise ValueError("conversation pack references blobs but no blob store was given")
+    found = blobs.get_many((digest for _, digest in refs), _decompress)
+    for (key, index, field), digest in refs:
+        if digest not in found:
+            raise ValueError(f"missing blob {digest[:12]} for {key}[{index}].{field}")
+        section[key][index][field] = loads(found[digest])
+
+def pack(
+    conversation_id: str,
+    timestamp: str,
+    state: Dict[str, Any],
+    blobs: Any = None,
+    blob_min_bytes: int = 256
+) -> bytes:
+    """
+    Encode a conversation as a packed file.
+    blobs: Optional BlobStore; response texts and claim lists of at least
+        blob_min_bytes (as JSON) are stored there once and referenced by hash.
+        The pack header lists every referenced hash.
+    """
+    codec = _codec()
+    grouped: Dict[str, Dict[str, Any]] = {}
+    for key, value in state.items():
+        grouped.setdefault(_SECTION_OF.get(key, "meta"), {})[key] = value
+    if "clusters" in grouped:
+        grouped["clusters"] = _dedupe_clusters(grouped["clusters"])
+    blob_hashes = _extract_blobs(grouped, blobs, blob_min_bytes) if blobs is not None else []
+
+    blobs: List[bytes] = []
+    offsets: Dict[str, List[int]] = {}
+    position = 0
+    for name, section in grouped.items():
+        blob = _compress(dumps(section), codec)
+        offsets[name] = [position, len(blob)]
+        blobs.append(blob)
+        position += len(blob)
+
+    header = dumps({
+        "id": conversation_id,
+        "timestamp": timestamp,
+        "codec": codec,
+        "summary": {"query": (state.get("raw_input") or "")[:100]},
+        "sections": offsets,
+        "blobs": blob_hashes,
+    })
+    return MAGIC + _HEADER_LEN.pack(len(header)) + header + b"".join(blobs)
+
+def read_header(f) -> Tuple[Dict[str, Any], int]:
+    """Read a pack's header from an open binary file; returns (header, offset of the first section)."""
+    prefix = f.read(len(MAGIC) + _HEADER_LEN.size)
+    if prefix[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a packed conversation file")
+    (length,) = _HEADER_LEN.unpack(prefix[len(MAGIC):])
+    return loads(f.read(length)), len(prefix) + length
+
+def read_pack(f, sections: Optional[Set[str]] = None, blobs: Any = None) -> Dict[str, Any]:
+    """
+    Decode a packed conversation from an open binary file into the stored
+    {"id", "timestamp", "state"} shape. sections: Only inflate these; the
+    others are neither read nor decompressed. blobs: BlobStore resolving
+    values that were moved out of the pack.
+    """
+    header, base = read_header(f)
+    state: Dict[str, Any] = {}
+    for name, (offset, length) in header["sections"].items():
+        if sections is not None and name not in sections:
+            continue
+        f.seek(base + offset)
+        section = loads(_decompress(f.read(length), header["codec"]))
+        _resolve_blobs(section, blobs)
+        if name == "clusters":
+            section = _restore_clusters(section)
+        state.update(section)
+    return {"id": header["id"], "timestamp": header["timestamp"], "state": state}
@@ -1,15 +1,24 @@
 import json
 import uuid
-from typing import List
+from typing import List, Optional
 from app.models import ClaimsResponse, AtomicClaim, ClaimCluster, ScoredCluster, FinalConsensus, ModelResponse, LockedContext, PeerReview
-from app.engine.llm import get_active_provider_context
+from app.engine.llm import get_stage_provider_context, default_utility_model
 from app.engine.providers import PROVIDER_OPENROUTER, PROVIDER_GROQ
 from app.utils.logger import get_logger
+from app.config.settings import RunProfile, get_run_profile, get_engine_settings
+from app.engine.chairman import available_chairmen, race_chairmen
+from app.engine.prompts import SYNTHESIS_INSTRUCTIONS, build_messages, record_usage
+from app.engine.offload import cpu_pool
 
 logger = get_logger(__name__)
 
 async def detect_agreement(all_claims: List[ClaimsResponse], peer_reviews: List[PeerReview] = None) -> List[ClaimCluster]:
-    """Group similar claims and detect agreement/conflict patterns."""
+    """Group similar claims and detect agreement/conflict patterns (on the CPU pool for large councils)."""
+    size = sum(len(cr.claims) for cr in all_claims)
+    return await cpu_pool.run(cluster_claims, all_claims, peer_reviews, size=size)
+
+def cluster_claims(all_claims: List[ClaimsResponse], peer_reviews: List[PeerReview] = None) -> List[ClaimCluster]:
+    """CPU-bound body of detect_agreement; a plain function so it can run in a worker process."""
     all_claim_list = []
     for cr in all_claims:
         for claim in cr.claims:
@@ -64,7 +73,12 @@ async def detect_agreement(all_claims: List[ClaimsResponse], peer_reviews: List[
     return result
 
 async def score_clusters(clusters: List[ClaimCluster], context: LockedContext, peer_reviews: List[PeerReview] = None) -> List[ScoredCluster]:
-    """Calculate confidence scores based on agreement and peer reviews."""
+    """Calculate confidence scores based on agreement and peer reviews (on the CPU pool for large councils)."""
+    size = len(clusters) * max(1, len(peer_reviews or []))
+    return await cpu_pool.run(score_cluster_list, clusters, peer_reviews, size=size)
+
+def score_cluster_list(clusters: List[ClaimCluster], peer_reviews: List[PeerReview] = None) -> List[ScoredCluster]:
+    """CPU-bound body of score_clusters; a plain function so it can run in a worker process."""
     scored = []
     
     model_scores = {}
@@ -119,16 +133,25 @@ async def score_clusters(clusters: List[ClaimCluster], context: LockedContext, p
     
     return sorted(scored, key=lambda x: x.confidence_score, reverse=True)
 
-async def synthesize_consensus(scored: List[ScoredCluster], context: LockedContext, responses: List[ModelResponse]) -> FinalConsensus:
-    """Use a Chairman model to synthesize the final consensus."""
-    client, available_models, provider_id = get_active_provider_context()
+async def synthesize_consensus(
+    scored: List[ScoredCluster],
+    context: LockedContext,
+    responses: List[ModelResponse],
+    profile: Optional[RunProfile] = None,
+    response_chars: int = 500
+) -> FinalConsensus:
+    """
+    Use a Chairman model to synthesize the final consensus.
+    response_chars: How much of each model response the chairman sees.
+    """
+    profile = profile or get_run_profile()
+    client, available_models, provider_id = get_stage_provider_context("synthesis")
     
     high_confidence = [s for s in scored if s.confidence_score >= 0.6]
     uncertain = [s for s in scored if s.confidence_score < 0.6]
     
-    synthesis_prompt = f"""You are the Chairman of an LLM Council. Your job is to synthesize a final, authoritative answer.
-
-Original Query: {context.normalized_prompt_data.normalized_prompt}
+    # Per-run data only; the fixed chairman instructions are the cacheable prefix
+    synthesis_request = f"""Original Query: {context.normalized_prompt_data.normalized_prompt}
 Constraints: {json.dumps(context.locked_constraints)}
 
 High-confidence topics:
@@ -138,29 +161,31 @@ Uncertain/disputed topics:
 {json.dumps([{"topic": s.canonical_claim, "confidence": s.confidence_score} for s in uncertain], indent=2)}
 
 Model responses:
-{chr(10).join([f"- {r.model_id}: {r.response_text[:500]}..." for r in responses])}
+{chr(10).join([f"- {r.model_id}: {r.response_text[:response_chars]}..." for r in responses])}"""
 
-Synthesize a comprehensive answer that:
-1. Emphasizes high-confidence conclusions
-2. Acknowledges uncertainty
-3. Follows constraints
-4. Is actionable
-
-Respond with JSON:
-{{
-  "final_answer": "...",
-  "key_recommendations": ["..."],
-  "uncertain_areas": ["..."]
-}}"""
+    # Optional: race several chairmen and keep the first valid synthesis
+    settings = get_engine_settings()
+    chairmen = available_chairmen(settings.chairman_candidates) if settings.chairman_race else []
+    if len(chairmen) >= 2:
+        result, winner, raw_text = await race_chairmen(chairmen, SYNTHESIS_INSTRUCTIONS, synthesis_request, profile.completion_kwargs("synthesis"))
+        if result is not None:
+            return _consensus_from_result(result, scored, uncertain, context, responses, winner)
+        if raw_text:
+            return _raw_text_consensus(raw_text, scored)
+        client = None  # every chairman failed; go straight to the manual fallback
 
     # Try primary synthesis with JSON mode
     if client:
         try:
             # Select best available model for synthesis
-            if provider_id == PROVIDER_OPENROUTER:
+            if profile.utility_model(provider_id):
+                model = profile.utility_model(provider_id)
+            elif provider_id == PROVIDER_OPENROUTER:
                 model = "openai/gpt-4o-mini"  # Use mini for reliability
             elif provider_id == PROVIDER_GROQ:
                 model = "llama-3.3-70b-versatile"
+            elif default_utility_model(provider_id):
+                model = default_utility_model(provider_id)
             else:
                 model = available_models[0]["id"] if available_models else "gpt-3.5-turbo"
             
@@ -168,39 +193,23 @@ Respond with JSON:
             
             response = await client.chat.completions.create(
                 model=model,
-                messages=[{"role": "user", "content": synthesis_prompt}],
-                response_format={"type": "json_object"}
+                messages=build_messages(SYNTHESIS_INSTRUCTIONS, synthesis_request, provider_id, model),
+                response_format={"type": "json_object"},
+                **profile.completion_kwargs("synthesis")
             )
+            record_usage("synthesis", response)
             
             raw_content = response.choices[0].message.content
             logger.info(f"Synthesis raw response: {raw_content[:200]}...")
             
             result = json.loads(raw_content)
-            confidence = sum(s.confidence_score for s in scored) / len(scored) if scored else 0.5
-            
-            return FinalConsensus(
-                final_answer=result.get("final_answer", "Synthesis completed but no answer extracted."),
-                confidence=round(confidence, 2),
-                uncertain_areas=result.get("uncertain_areas", []) + [s.canonical_claim for s in uncertain],
-                reasoning_trace=[
-                    {"step": "normalization", "details": f"Intent: {context.normalized_prompt_data.intent}"},
-                    {"step": "execution", "details": f"Queried {len(responses)} models"},
-                    {"step": "synthesis", "details": f"Chairman ({model}) synthesized answer"}
-                ]
-            )
+            return _consensus_from_result(result, scored, uncertain, context, responses, model)
         except json.JSONDecodeError as je:
             logger.error(f"JSON parse error in synthesis: {je}")
             # Fallback: Try to extract answer without JSON parsing
             try:
-                raw_text = response.choices[0].message.content
                 # Just use raw text as the answer
-                confidence = sum(s.confidence_score for s in scored) / len(scored) if scored else 0.5
-                return FinalConsensus(
-                    final_answer=raw_text[:2000],
-                    confidence=round(confidence, 2),
-                    uncertain_areas=["JSON parsing failed, raw response used"],
-                    reasoning_trace=[{"step": "synthesis", "details": "Fallback: raw text extraction"}]
-                )
+                return _raw_text_consensus(response.choices[0].message.content, scored)
             except:
                 pass
         except Exception as e:
@@ -218,3 +227,34 @@ Respond with JSON:
         uncertain_areas=["Automated synthesis failed - manual review recommended"],
         reasoning_trace=[{"step": "error", "details": "Synthesis failed, using concatenated responses"}]
     )
+
+def _consensus_from_result(
+    result: dict,
+    scored: List[ScoredCluster],
+    uncertain: List[ScoredCluster],
+    context: LockedContext,
+    responses: List[ModelResponse],
+    chairman: str
+) -> FinalConsensus:
+    """Build the consensus from a parsed chairman JSON answer."""
+    confidence = sum(s.confidence_score for s in scored) / len(scored) if scored else 0.5
+    return FinalConsensus(
+        final_answer=result.get("final_answer", "Synthesis completed but no answer extracted."),
+        confidence=round(confidence, 2),
+        uncertain_areas=result.get("uncertain_areas", []) + [s.canonical_claim for s in uncertain],
+        reasoning_trace=[
+            {"step": "normalization", "details": f"Intent: {context.normalized_prompt_data.intent}"},
+            {"step": "execution", "details": f"Queried {len(responses)} models"},
+            {"step": "synthesis", "details": f"Chairman ({chairman}) synthesized answer"}
+        ]
+    )
+
+def _raw_text_consensus(raw_text: str, scored: List[ScoredCluster]) -> FinalConsensus:
+    """Use the chairman's unparseable output as the answer."""
+    confidence = sum(s.confidence_score for s in scored) / len(scored) if scored else 0.5
+    return FinalConsensus(
+        final_answer=raw_text[:2000],
+        confidence=round(confidence, 2),
+        uncertain_areas=["JSON parsing failed, raw response used"],
+        reasoning_trace=[{"step": "synthesis", "details": "Fallback: raw text extraction"}]
+    )
@@ -1,21 +1,61 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from pathlib import Path
 from app.engine.graph import AntigravityEngine
-from app.models import GraphState, ConversationSummary
-from app.config.settings import set_keys, get_keys, update_keys, ApiKeys
-from app.engine.persistence import list_conversations, load_conversation
+from app.models import GraphState
+from app.config.settings import set_keys, get_keys, update_keys, ApiKeys, get_engine_settings, get_run_profile, list_run_profiles, NATIVE_PROVIDERS
+from app.engine.persistence import load_conversation, delete_conversation, collect_garbage
 from app.engine.providers import ProviderFactory, PROVIDER_OPENROUTER, PROVIDER_GROQ
 from app.engine.llm import get_all_available_providers
+from app.engine.metrics import metrics
+from app.engine.cancellation import run_until_disconnected, ClientDisconnected
+from app.engine.chairman import chairman_stats
+from app.engine.budgets import output_budgets
+from app.engine.semantic_cache import semantic_cache
+from app.engine.key_pool import key_pool
+from app.engine.blob_store import blob_store
+from app.engine.change_log import change_log
+from app.engine.retention import maintenance_loop, run_maintenance
+from app.engine.segments import segment_store
+from app.engine.search_index import search_index
+from app.engine.analytics import model_analytics
+from app.engine.offload import cpu_pool, monitor_event_loop_lag
+from app.engine import bulk
+from app.utils.serialization import parse_fields, project, model_response, dict_response
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Retention and compaction run in the background, never on a request
+    maintenance = asyncio.create_task(maintenance_loop())
+    lag_probe = asyncio.create_task(monitor_event_loop_lag())
+    # Build the semantic cache index from history now, not inside the first /run
+    cache_warmup = None
+    if get_engine_settings().semantic_cache_enabled:
+        cache_warmup = asyncio.create_task(asyncio.to_thread(semantic_cache.ensure_loaded))
+    # Likewise learn output budgets from history; runs use the defaults meanwhile
+    budgets_warmup = None
+    if get_engine_settings().learned_budgets:
+        budgets_warmup = asyncio.create_task(asyncio.to_thread(output_budgets.ensure_loaded))
+    yield
+    maintenance.cancel()
+    lag_probe.cancel()
+    if cache_warmup is not None:
+        cache_warmup.cancel()
+    if budgets_warmup is not None:
+        budgets_warmup.cancel()
+    cpu_pool.shutdown()
 
 app = FastAPI(
     title="Vibe-Coding Consensus Engine",
     description="Multi-LLM Consensus Platform with Peer Review",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Path to static files (your custom frontend)
@@ -28,13 +68,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 engine = AntigravityEngine()
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # Nobody is listening any more; 499 mirrors nginx's "client closed request"
+    return Response(status_code=499)
+
+async def await_run(http_request: Request, work, finish_in_background: bool = False):
+    """Await an engine run, cancelling it (or detaching it) if the client disconnects."""
+    settings = get_engine_settings()
+    if not settings.cancel_on_disconnect:
+        return await work
+    return await run_until_disconnected(
+        work,
+        http_request.is_disconnected,
+        poll_interval=settings.disconnect_poll_interval,
+        finish_in_background=finish_in_background
+    )
+
 class RunRequest(BaseModel):
     prompt: str
     model_count: int = 4  # Default to all 4 models
+    use_cache: bool = True  # Allow semantic cache answers when enabled server-side
+    finish_on_disconnect: bool = False  # Keep running and save the result if the client goes away
+    profile: Optional[str] = None  # "fast", "balanced", "thorough" or a server-defined profile
     
     class Config:
         @staticmethod
@@ -43,13 +104,23 @@ class RunRequest(BaseModel):
                 raise ValueError('model_count must be between 1 and 4')
             return v
 
+class ResumeRequest(BaseModel):
+    """Request model for resuming a checkpointed run."""
+    from_layer: Optional[str] = None  # Re-run this layer and everything after it
+
 class UpdateKeysRequest(BaseModel):
     """Request model for updating API keys."""
     openrouter_api_key: Optional[str] = None
     groq_api_key: Optional[str] = None
+    # Whole key pools; the first key becomes the primary one, [] clears the provider
+    openrouter_api_keys: Optional[List[str]] = None
+    groq_api_keys: Optional[List[str]] = None
     # Legacy support
     universal_key: Optional[str] = None
+    # Direct provider keys (OpenAI keys starting with sk-or- are treated as OpenRouter)
     openai_api_key: Optional[str] = None
+    anthropic_api_key: Optional[str] = None
+    gemini_api_key: Optional[str] = None
 
 # ===== FRONTEND ROUTES (Your Custom HTML Pages) =====
 
@@ -100,9 +171,10 @@ async def api_status():
 # ===== API ENDPOINTS =====
 
 @app.post("/run", response_model=GraphState)
-async def run_consensus(request: RunRequest):
+async def run_consensus(request: RunRequest, http_request: Request, fields: Optional[str] = None):
     """
     Triggers the full graph execution for a given prompt.
+    fields: Optional comma-separated projection, e.g. "consensus,model_responses".
     """
     if not request.prompt:
         raise HTTPException(status_code=400, detail="Prompt is required")
@@ -110,9 +182,147 @@ async def run_consensus(request: RunRequest):
     # Validate model_count
     model_count = max(1, min(4, request.model_count))
     
-    final_state = await engine.run(request.prompt, model_count=model_count)
+    try:
+        get_run_profile(request.profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    final_state = await await_run(
+        http_request,
+        engine.run(request.prompt, model_count=model_count, use_cache=request.use_cache, profile=request.profile),
+        finish_in_background=request.finish_on_disconnect
+    )
+    
+    settings = get_engine_settings()
+    selected = parse_fields(fields)
+    if settings.fast_json_responses or selected:
+        return model_response(http_request, final_state, selected, settings.response_compression_min_size)
+    return final_state
+
+@app.post("/run/chunked", response_model=GraphState)
+async def run_chunked(
+    http_request: Request,
+    task: Optional[str] = None,
+    model_count: int = 4,
+    profile: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Map-reduce run over a large plain-text request body (e.g. pasted logs).
+    The body is chunked as it is received instead of being read into memory;
+    `task` says what to do with it.
+    """
+    model_count = max(1, min(4, model_count))
+    try:
+        get_run_profile(profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Reading the body stream and polling for a disconnect both consume the
+    # ASGI receive channel, so this endpoint is awaited directly
+    final_state = await engine.run_chunked(
+        http_request.stream(), task=task, model_count=model_count, profile=profile
+    )
+    
+    settings = get_engine_settings()
+    selected = parse_fields(fields)
+    if settings.fast_json_responses or selected:
+        return model_response(http_request, final_state, selected, settings.response_compression_min_size)
+    return final_state
+
+@app.post("/run/{conversation_id}/resume", response_model=GraphState)
+async def resume_consensus(conversation_id: str, http_request: Request, request: Optional[ResumeRequest] = None, fields: Optional[str] = None):
+    """
+    Resumes a run from its layer checkpoints, skipping layers that already succeeded.
+    Pass from_layer (e.g. "scoring") to recompute that layer and all later ones.
+    """
+    from_layer = request.from_layer if request else None
+    try:
+        final_state = await await_run(http_request, engine.resume(conversation_id, from_layer=from_layer))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if final_state is None:
+        raise HTTPException(status_code=404, detail="No checkpoints found for this conversation")
+    
+    settings = get_engine_settings()
+    selected = parse_fields(fields)
+    if settings.fast_json_responses or selected:
+        return model_response(http_request, final_state, selected, settings.response_compression_min_size)
     return final_state
 
+@app.get("/profiles")
+async def get_profiles():
+    """
+    Lists the run profiles that can be selected per request.
+    """
+    return {
+        "default": get_engine_settings().default_profile,
+        "profiles": [get_run_profile(name).model_dump() for name in list_run_profiles()]
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Returns in-process engine counters (e.g. coalesced runs).
+    """
+    return metrics.snapshot()
+
+@app.get("/metrics/chairman")
+async def get_chairman_metrics():
+    """
+    Returns win rate, failure counts and mean latency per chairman model.
+    """
+    return chairman_stats()
+
+@app.get("/metrics/budgets")
+async def get_budget_metrics():
+    """
+    Returns observed answer counts and learned council max_tokens per intent / intent:domain.
+    """
+    return await asyncio.to_thread(output_budgets.stats)
+
+@app.get("/analytics/models")
+async def get_model_analytics(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    intent: Optional[str] = None,
+    domain: Optional[str] = None,
+    model: Optional[str] = None,
+    group_by: Optional[str] = None
+):
+    """
+    Returns per-model latency, error rate, token usage, average peer-review score and
+    supporting vs conflicting claim counts from incrementally maintained rollups.
+    since / until: Days (YYYY-MM-DD), inclusive. group_by: "day", "intent" or "domain".
+    """
+    try:
+        models = await asyncio.to_thread(model_analytics.models, since, until, intent, domain, model, group_by)
+        return {"models": models}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/metrics/storage")
+async def get_storage_metrics():
+    """
+    Returns blob store size (blobs, references, stored vs referenced bytes) and segment usage.
+    """
+    return {**blob_store.stats(), "segments": segment_store.stats()}
+
+@app.post("/storage/gc")
+async def run_storage_gc():
+    """
+    Recounts blob references from the stored conversations and deletes unreferenced blobs.
+    """
+    # Reads every pack header and segment; keep the scan off the event loop
+    return await asyncio.to_thread(collect_garbage)
+
+@app.post("/storage/maintenance")
+async def run_storage_maintenance():
+    """
+    Applies retention, compacts old conversations into segments and rewrites sparse segments now.
+    """
+    return await asyncio.to_thread(run_maintenance)
+
 @app.post("/settings/keys")
 async def update_api_keys(request: UpdateKeysRequest):
     """
@@ -132,6 +342,7 @@ async def update_api_keys(request: UpdateKeysRequest):
             updated_providers.append("openrouter")
         else:
             keys.openrouter_api_key = None
+            keys.openrouter_extra_keys = []
     
     # Handle Groq key
     if request.groq_api_key is not None:
@@ -141,6 +352,22 @@ async def update_api_keys(request: UpdateKeysRequest):
             updated_providers.append("groq")
         else:
             keys.groq_api_key = None
+            keys.groq_extra_keys = []
+    
+    # Handle key pools
+    if request.openrouter_api_keys is not None:
+        pool = [k.strip() for k in request.openrouter_api_keys if k and k.strip()]
+        keys.openrouter_api_key = pool[0] if pool else None
+        keys.openrouter_extra_keys = pool[1:]
+        if pool:
+            updated_providers.append("openrouter")
+    
+    if request.groq_api_keys is not None:
+        pool = [k.strip() for k in request.groq_api_keys if k and k.strip()]
+        keys.groq_api_key = pool[0] if pool else None
+        keys.groq_extra_keys = pool[1:]
+        if pool:
+            updated_providers.append("groq")
     
     # Legacy: Handle universal_key for backward compatibility
     if request.universal_key:
@@ -151,16 +378,31 @@ async def update_api_keys(request: UpdateKeysRequest):
         elif detected == PROVIDER_GROQ:
             keys.groq_api_key = request.universal_key
             updated_providers.append("groq")
+        elif detected in NATIVE_PROVIDERS:
+            # Anthropic, Gemini and OpenAI keys get their direct routes
+            setattr(keys, f"{detected}_api_key", request.universal_key)
+            updated_providers.append(detected)
         else:
             # Store as universal for other detected providers
             keys.universal_key = request.universal_key
             keys.provider_id = detected
     
-    # Legacy: Handle openai_api_key (treat as OpenRouter if it matches pattern)
+    # Handle openai_api_key (treat as OpenRouter if it matches pattern)
     if request.openai_api_key:
         if request.openai_api_key.startswith("sk-or-"):
             keys.openrouter_api_key = request.openai_api_key
             updated_providers.append("openrouter")
+        else:
+            keys.openai_api_key = request.openai_api_key.strip()
+            updated_providers.append("openai")
+    
+    # Direct Anthropic / Gemini keys ("" clears them)
+    for provider_id in ("anthropic", "gemini"):
+        value = getattr(request, f"{provider_id}_api_key")
+        if value is not None:
+            setattr(keys, f"{provider_id}_api_key", value.strip() or None)
+            if value.strip():
+                updated_providers.append(provider_id)
     
     set_keys(keys)
     
@@ -181,22 +423,137 @@ async def get_keys_status():
     return {
         "providers": keys.get_status(),
         "available": keys.get_available_providers(),
-        "all_providers": get_all_available_providers()
+        "all_providers": get_all_available_providers(),
+        # Per-key load and health of the pools in use (keys masked)
+        "key_pools": key_pool.stats()
     }
 
-@app.get("/conversations", response_model=List[ConversationSummary])
-async def get_conversations():
+@app.get("/conversations")
+async def get_conversations(request: Request, since: Optional[str] = None):
     """
-    List all saved conversations.
+    List all saved conversations, newest first.
+    since: Cursor from a previous response; returns only conversations saved or
+        deleted after it, as {"cursor", "reset", "changes", "deleted"}. A cursor the
+        server no longer recognises yields the full list with reset=true.
+    The ETag is the current cursor; If-None-Match with it answers 304 when nothing changed.
     """
-    return list_conversations()
+    cursor = change_log.cursor()
+    etag = f'"{cursor}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    if since is None:
+        body = change_log.summaries()
+    else:
+        seq = change_log.parse_cursor(since)
+        if seq is None:
+            body = {"cursor": cursor, "reset": True, "changes": change_log.summaries(), "deleted": []}
+        else:
+            changes, deleted = change_log.changes_since(seq)
+            body = {"cursor": cursor, "reset": False, "changes": changes, "deleted": deleted}
+    response = dict_response(request, body, get_engine_settings().response_compression_min_size)
+    response.headers["ETag"] = etag
+    return response
+
+@app.get("/conversations/search")
+async def search_conversations(
+    q: str = "",
+    intent: Optional[str] = None,
+    domain: Optional[str] = None,
+    model: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0
+):
+    """
+    Search saved conversations by text (prompt, final answer, claims) and/or
+    intent, domain and model id. Text matches are ranked by relevance,
+    otherwise results are newest first.
+    """
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be 1-100 and offset non-negative")
+    total, results = await asyncio.to_thread(
+        search_index.search, q, intent=intent, domain=domain, model=model, limit=limit, offset=offset
+    )
+    return {"total": total, "limit": limit, "offset": offset, "results": results}
+
+@app.get("/export/conversations")
+async def export_conversations(
+    format: str = "ndjson",
+    table: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    intent: Optional[str] = None,
+    model: Optional[str] = None
+):
+    """
+    Streams saved conversations, optionally filtered by save time (ISO since/until),
+    intent and model id. NDJSON without a table is whole conversations, re-importable
+    with POST /import/conversations; table ("conversations", "responses", "claims",
+    "reviews") gives one flat row per item instead, which format=parquet requires.
+    """
+    filters = {"since": since, "until": until, "intent": intent, "model": model}
+    if table is not None and table not in bulk.TABLES:
+        raise HTTPException(status_code=400, detail=f"Unknown table '{table}'. Available: {', '.join(bulk.TABLES)}")
+    if format == "ndjson":
+        name = table or "conversations"
+        # A plain generator is iterated in the threadpool, keeping the event loop free
+        return StreamingResponse(
+            bulk.export_ndjson(table, **filters),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": f'attachment; filename="{name}.ndjson"'}
+        )
+    if format == "parquet":
+        if table is None:
+            raise HTTPException(status_code=400, detail="Parquet export needs a table")
+        if not bulk.parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server")
+        return StreamingResponse(
+            bulk.export_parquet(table, **filters),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": f'attachment; filename="{table}.parquet"'}
+        )
+    raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'parquet'")
+
+@app.post("/import/conversations")
+async def import_conversations(request: Request, overwrite: bool = False):
+    """
+    Imports conversations from an NDJSON body (plain or gzipped, e.g. an export or a
+    retention archive), read as it arrives. Ids and timestamps are kept; existing
+    conversations are skipped unless overwrite=true.
+    Returns {"imported", "skipped", "failed", "errors"}.
+    """
+    reader = bulk.LineReader()
+    report = None
+    async for chunk in request.stream():
+        lines = reader.feed(chunk)
+        if lines:
+            report = await asyncio.to_thread(bulk.import_lines, lines, overwrite, report)
+    return await asyncio.to_thread(bulk.import_lines, reader.finish(), overwrite, report)
 
 @app.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: str):
+async def get_conversation(conversation_id: str, request: Request, fields: Optional[str] = None):
     """
     Get a specific conversation by ID.
+    fields: Optional comma-separated projection of the stored state, e.g. "consensus".
     """
-    conv = load_conversation(conversation_id)
+    selected = parse_fields(fields)
+    # Packed conversations only decompress the sections holding the selected fields
+    conv = await asyncio.to_thread(load_conversation, conversation_id, fields=selected)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    if selected:
+        conv = {**conv, "state": project(conv.get("state") or {}, selected)}
+    settings = get_engine_settings()
+    if settings.fast_json_responses:
+        return dict_response(request, conv, settings.response_compression_min_size)
     return conv
+
+@app.delete("/conversations/{conversation_id}")
+async def remove_conversation(conversation_id: str):
+    """
+    Delete a conversation; blobs no other conversation refers to are removed with it.
+    """
+    if not await asyncio.to_thread(delete_conversation, conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"deleted": conversation_id}
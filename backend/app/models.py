@@ -20,6 +20,7 @@ class ModelResponse(BaseModel):
     model_id: str
     response_text: str
     token_count: int
+    latency_ms: Optional[float] = None  # Wall time of the council call
 
 # --- Layer 4: Claims ---
 class AtomicClaim(BaseModel):
@@ -62,10 +63,18 @@ class FinalConsensus(BaseModel):
     uncertain_areas: List[str]
     reasoning_trace: List[Dict[str, Any]]
 
+# --- Semantic Cache ---
+class SemanticMatch(BaseModel):
+    conversation_id: str
+    similarity: float
+    query: str
+    consensus: FinalConsensus
+
 # --- Graph State ---
 class GraphState(BaseModel):
     raw_input: str
     conversation_id: Optional[str] = None
+    profile: Optional[str] = None
     normalized: Optional[NormalizedPrompt] = None
     locked_context: Optional[LockedContext] = None
     model_responses: List[ModelResponse] = []
@@ -74,6 +83,7 @@ class GraphState(BaseModel):
     agreement_clusters: List[ClaimCluster] = []
     scored_clusters: List[ScoredCluster] = []
     consensus: Optional[FinalConsensus] = None
+    semantic_match: Optional[SemanticMatch] = None
     errors: List[str] = []
 
 # --- Conversation List Item ---
@@ -0,0 +1,98 @@
+import gzip
+import json
+from typing import Any, Dict, List, Optional
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+# Optional fast paths: orjson for JSON, brotli for compression
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, default=str, separators=(",", ":")).encode()
+
+def loads(data) -> Any:
+    """Parse JSON from str or bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Turn "consensus,model_responses" into a list; None or empty means everything."""
+    if not fields:
+        return None
+    parsed = [f.strip() for f in fields.split(",") if f.strip()]
+    return parsed or None
+
+def include_spec(fields: List[str]) -> Dict[str, Any]:
+    """
+    Build a pydantic include spec from dotted paths,
+    e.g. ["consensus.final_answer"] -> {"consensus": {"final_answer": True}}.
+    """
+    spec: Dict[str, Any] = {}
+    for path in fields:
+        node = spec
+        parts = path.split(".")
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is True:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = True
+    return spec
+
+def project(data: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Keep only the requested (optionally dotted) keys of a plain dict."""
+    if not fields:
+        return data
+    return _apply_spec(data, include_spec(fields))
+
+def _apply_spec(data: Any, spec: Any) -> Any:
+    if spec is True:
+        return data
+    if isinstance(data, list):
+        return [_apply_spec(item, spec) for item in data]
+    if not isinstance(data, dict):
+        return data
+    return {k: _apply_spec(data[k], sub) for k, sub in spec.items() if k in data}
+
+def encode_body(request: Request, body: bytes, min_size: int) -> Response:
+    """Wrap JSON bytes in a response, compressed when the client accepts it and it is large enough."""
+    headers = {"Vary": "Accept-Encoding"}
+    accepted = request.headers.get("accept-encoding", "")
+    if min_size >= 0 and len(body) >= min_size:
+        if brotli is not None and "br" in accepted:
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def model_response(request: Request, model: BaseModel, fields: Optional[List[str]], min_size: int) -> Response:
+    """
+    Serialize an engine-produced model straight to JSON.
+    Skips FastAPI's response_model re-validation, which the engine's own models do not need.
+    """
+    if fields and any("." in f for f in fields):
+        # Dotted paths may reach into lists, which pydantic's include cannot express
+        body = dumps(project(model.model_dump(mode="json"), fields))
+    else:
+        body = model.model_dump_json(include=set(fields) if fields else None).encode()
+    return encode_body(request, body, min_size)
+
+def dict_response(request: Request, data: Dict[str, Any], min_size: int) -> Response:
+    """Serialize a plain dict (e.g. a stored conversation) to a JSON response."""
+    return encode_body(request, dumps(data), min_size)
@@ -0,0 +1,66 @@
+import os
+import pytest
+
+@pytest.fixture(autouse=True)
+def no_environment_provider_keys(monkeypatch):
+    """Provider keys from the environment would make tests call real APIs"""
+    for name in ("OPENROUTER_API_KEY", "GROQ_API_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY", "GEMINI_API_KEY"):
+        monkeypatch.delenv(name, raising=False)
+
+@pytest.fixture(autouse=True)
+def isolated_search_index(monkeypatch, tmp_path):
+    """Saved conversations are indexed into a per-test database"""
+    from app.engine.search_index import search_index
+    search_index.close()
+    monkeypatch.setattr(search_index, "path", str(tmp_path / "index.sqlite"))
+    yield search_index
+    search_index.close()
+
+@pytest.fixture(autouse=True)
+def isolated_blob_store(monkeypatch, tmp_path):
+    """Blobs of saved conversations go to a per-test database"""
+    from app.engine.blob_store import blob_store
+    blob_store.close()
+    monkeypatch.setattr(blob_store, "path", str(tmp_path / "blobs.sqlite"))
+    yield blob_store
+    blob_store.close()
+
+@pytest.fixture(autouse=True)
+def isolated_change_log(monkeypatch, tmp_path):
+    """History changes are logged to a per-test database"""
+    from app.engine.change_log import change_log
+    change_log.close()
+    monkeypatch.setattr(change_log, "path", str(tmp_path / "index.sqlite"))
+    yield change_log
+    change_log.close()
+
+@pytest.fixture(autouse=True)
+def isolated_model_analytics(monkeypatch, tmp_path):
+    """Model rollups are kept in a per-test database"""
+    from app.engine.analytics import model_analytics
+    model_analytics.close()
+    monkeypatch.setattr(model_analytics, "path", str(tmp_path / "index.sqlite"))
+    yield model_analytics
+    model_analytics.close()
+
+@pytest.fixture(autouse=True)
+def isolated_segments(monkeypatch, tmp_path):
+    """Compacted conversations and archives go to per-test directories"""
+    from app.engine import retention
+    from app.engine.segments import segment_store
+    segment_store.close()
+    monkeypatch.setattr(segment_store, "root", str(tmp_path / "segments"))
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    yield segment_store
+    segment_store.close()
+
+@pytest.fixture(autouse=True)
+def isolated_conversation_store(monkeypatch, tmp_path):
+    """Saved conversations and layer checkpoints go to per-test directories"""
+    from app.engine import persistence
+    from app.engine.checkpoints import checkpoint_store
+    monkeypatch.setattr(persistence, "DATA_DIR", str(tmp_path / "conversations"))
+    monkeypatch.setattr(checkpoint_store, "directory", str(tmp_path / "checkpoints"))
+    os.makedirs(persistence.DATA_DIR)
+    os.makedirs(checkpoint_store.directory)
+    yield persistence.DATA_DIR
@@ -0,0 +1,84 @@
+"""Local stand-ins for provider APIs, served through httpx.ASGITransport or on a localhost port."""
+import json
+import threading
+import time
+from contextlib import contextmanager
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def anthropic_stub(received: list) -> FastAPI:
+    """Anthropic Messages API: echoes the last user turn; model "limited" answers 429."""
+    app = FastAPI()
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        received.append({"headers": dict(request.headers), "body": body})
+        if body["model"] == "limited":
+            return JSONResponse({"type": "error", "error": {"type": "rate_limit_error", "message": "slow down"}}, status_code=429)
+
+        user_text = next(m["content"] for m in reversed(body["messages"]) if m["role"] == "user")
+        prefilled = body["messages"][-1]["role"] == "assistant"
+        text = f'"echo": "{user_text}"}}' if prefilled else f"echo: {user_text}"
+        usage = {"input_tokens": 12, "output_tokens": 5, "cache_read_input_tokens": 1024}
+
+        if not body.get("stream"):
+            return {
+                "id": "msg_stub", "type": "message", "role": "assistant", "model": body["model"],
+                "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "usage": usage
+            }
+
+        async def events():
+            yield f"event: message_start\ndata: {json.dumps({'type': 'message_start', 'message': {'id': 'msg_stub', 'usage': usage}})}\n\n"
+            for piece in (text[:4], text[4:]):
+                delta = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}
+                yield f"event: content_block_delta\ndata: {json.dumps(delta)}\n\n"
+            yield f"event: message_delta\ndata: {json.dumps({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}})}\n\n"
+            yield f"event: message_stop\ndata: {json.dumps({'type': 'message_stop'})}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/v1/models")
+    async def models():
+        return {"data": [{"id": "claude-3-5-haiku-latest", "type": "model"}]}
+
+    return app
+
+def openai_compatible_stub(received: list, reply=None) -> FastAPI:
+    """
+    OpenAI-style chat completions (as served by Gemini's compatible endpoint, Ollama or llama.cpp).
+    reply: Optional function of the request body returning the answer text.
+    """
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    @app.post("/v1beta/openai/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        received.append({"headers": dict(request.headers), "body": body})
+        if reply is not None:
+            content = reply(body)
+        else:
+            content = '{"answer": "stub"}' if body.get("response_format") else "stub answer"
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+        }
+
+    return app
+
+@contextmanager
+def serve(app: FastAPI):
+    """Run an app on a free localhost port in a background thread; yields its base URL."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
@@ -216,3 +216,198 @@ async def test_conversation_not_found():
         response = await ac.get("/conversations/non-existent-id")
     assert response.status_code == 404
     assert "not found" in response.json()["detail"].lower()
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    """Test that /metrics returns a dict of counter namespaces"""
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get("/metrics")
+    assert response.status_code == 200
+    assert isinstance(response.json(), dict)
+
+@pytest.mark.asyncio
+async def test_run_consensus_field_projection():
+    """Test that ?fields= limits the /run response to the requested keys"""
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/run?fields=raw_input,consensus.final_answer", json={"prompt": "Projection query", "model_count": 1})
+    assert response.status_code == 200
+    data = response.json()
+    assert set(data.keys()) <= {"raw_input", "consensus"}
+    assert data["raw_input"] == "Projection query"
+    if data.get("consensus"):
+        assert set(data["consensus"].keys()) == {"final_answer"}
+
+@pytest.mark.asyncio
+async def test_conversation_projection_and_gzip():
+    """Test that stored conversations can be projected and are gzip-encoded when large"""
+    from app.engine.persistence import save_conversation
+    conv_id = save_conversation({"raw_input": "x" * 4000, "consensus": {"final_answer": "ok"}, "model_responses": []})
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        full = await ac.get(f"/conversations/{conv_id}", headers={"Accept-Encoding": "gzip"})
+        projected = await ac.get(f"/conversations/{conv_id}?fields=consensus")
+    assert full.status_code == 200
+    assert full.headers.get("content-encoding") == "gzip"
+    assert full.json()["state"]["raw_input"] == "x" * 4000
+    assert projected.json()["state"] == {"consensus": {"final_answer": "ok"}}
+
+@pytest.mark.asyncio
+async def test_run_unknown_profile_rejected():
+    """Test that /run rejects an unknown profile name"""
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/run", json={"prompt": "Test", "profile": "warp-speed"})
+        profiles = await ac.get("/profiles")
+    assert response.status_code == 400
+    names = [p["name"] for p in profiles.json()["profiles"]]
+    assert {"fast", "balanced", "thorough"} <= set(names)
+
+@pytest.mark.asyncio
+async def test_run_chunked_streams_body(monkeypatch):
+    """A plain-text body is chunked as it streams in and reduced to one consensus"""
+    from app.config import settings
+    from app.engine import map_reduce
+    from app.models import ModelResponse
+
+    async def fake_models(context, model_count=4, **kwargs):
+        return [ModelResponse(model_id="gpt-4o", response_text="Disk full errors in this part.", token_count=5)]
+
+    monkeypatch.setattr(settings, "runtime_keys", settings.ApiKeys())
+    monkeypatch.setattr(map_reduce, "execute_parallel_models", fake_models)
+    original = settings.get_engine_settings()
+    settings.set_engine_settings(original.model_copy(update={"chunk_chars": 1000}))
+
+    async def body():
+        for i in range(50):
+            yield f"ERROR write failed: no space left on device ({i})\n".encode() * 5
+
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.post("/run/chunked?task=Why+do+writes+fail&model_count=1", content=body())
+    finally:
+        settings.set_engine_settings(original)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["model_responses"]) > 5
+    assert "Streamed input" in data["raw_input"]
+
+@pytest.mark.asyncio
+async def test_key_pool_update_and_masked_status():
+    """A key pool can be set per provider; status reports each key masked"""
+    from app.config import settings
+    original = settings.get_keys().model_copy(deep=True)
+    pool = ["gsk_" + "a" * 52, "gsk_" + "b" * 52]
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await ac.post("/settings/keys", json={"groq_api_keys": pool})
+            assert response.status_code == 200
+            assert response.json()["providers_status"]["groq"]["pool_size"] == 2
+
+            from app.engine.llm import get_provider_client
+            client, _ = get_provider_client("groq")
+            assert client is get_provider_client("groq")[0]
+
+            status = (await ac.get("/settings/keys/status")).json()
+        prefixes = [k["key_prefix"] for k in status["key_pools"]["groq"]]
+        assert prefixes == ["gsk_aaaa...", "gsk_bbbb..."]
+        assert "a" * 20 not in str(status)
+    finally:
+        settings.set_keys(original)
+
+@pytest.mark.asyncio
+async def test_search_conversations_endpoint():
+    """Saved conversations are searchable by text and intent right after saving"""
+    import uuid
+    from app.engine.persistence import save_conversation
+    token = f"probe{uuid.uuid4().hex}"
+    conversation_id = save_conversation({
+        "raw_input": "Why does my Kubernetes pod restart?",
+        "normalized": {"intent": token, "domain": "devops", "normalized_prompt": "Diagnose pod restarts"},
+        "consensus": {"final_answer": f"Check the {token} setting.", "confidence": 0.7}
+    })
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        by_text = (await ac.get("/conversations/search", params={"q": token[:12]})).json()
+        by_intent = (await ac.get("/conversations/search", params={"intent": token})).json()
+        bad = await ac.get("/conversations/search", params={"limit": 0})
+    assert [r["id"] for r in by_text["results"]] == [conversation_id]
+    assert by_text["results"][0]["domain"] == "devops"
+    assert [r["id"] for r in by_intent["results"]] == [conversation_id]
+    assert bad.status_code == 400
+
+@pytest.mark.asyncio
+async def test_delete_conversation():
+    """Deleting a conversation removes it from storage, search and listings"""
+    from app.engine.persistence import save_conversation
+    conv_id = save_conversation({"raw_input": "Delete me", "model_responses": [
+        {"model_id": "a", "response_text": "A long answer. " * 50, "token_count": 100}
+    ]})
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        deleted = await ac.delete(f"/conversations/{conv_id}")
+        missing = await ac.get(f"/conversations/{conv_id}")
+        again = await ac.delete(f"/conversations/{conv_id}")
+        storage = (await ac.get("/metrics/storage")).json()
+    assert deleted.json() == {"deleted": conv_id}
+    assert missing.status_code == 404 and again.status_code == 404
+    assert storage["blobs"] == 0
+
+@pytest.mark.asyncio
+async def test_conversations_delta_sync_and_etag():
+    """History syncs by cursor, answers 304 when unchanged and reports deletions"""
+    from app.engine.persistence import save_conversation
+    first = save_conversation({"raw_input": "First question"})
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        full = await ac.get("/conversations")
+        etag = full.headers["etag"]
+        cursor = etag.strip('"')
+        assert first in [c["id"] for c in full.json()]
+
+        unchanged = await ac.get("/conversations", params={"since": cursor}, headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+
+        second = save_conversation({"raw_input": "Second question"})
+        await ac.delete(f"/conversations/{first}")
+        delta = (await ac.get("/conversations", params={"since": cursor}, headers={"If-None-Match": etag})).json()
+        assert [c["id"] for c in delta["changes"]] == [second]
+        assert delta["deleted"] == [first] and not delta["reset"]
+
+        stale = (await ac.get("/conversations", params={"since": "0123abcd:5"})).json()
+        assert stale["reset"] and second in [c["id"] for c in stale["changes"]]
+        assert delta["cursor"] != cursor
+
+@pytest.mark.asyncio
+async def test_export_and_import_conversations():
+    """Conversations stream out as NDJSON and back in through the import endpoint"""
+    import json
+    from app.engine import bulk, persistence
+    conv_id = persistence.save_conversation({"raw_input": "Export me", "model_responses": [
+        {"model_id": "a", "response_text": "An answer", "token_count": 3}
+    ]})
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        exported = await ac.get("/export/conversations")
+        rows = await ac.get("/export/conversations", params={"table": "responses"})
+        unknown = await ac.get("/export/conversations", params={"table": "nope"})
+        parquet = await ac.get("/export/conversations", params={"format": "parquet", "table": "claims"})
+        persistence.delete_conversation(conv_id)
+        imported = (await ac.post("/import/conversations", content=exported.content)).json()
+    assert exported.headers["content-type"] == "application/x-ndjson"
+    assert json.loads(rows.content)["response_text"] == "An answer"
+    assert unknown.status_code == 400
+    assert parquet.status_code == (200 if bulk.parquet_available() else 501)
+    assert imported == {"imported": 1, "skipped": 0, "failed": 0, "errors": []}
+    assert persistence.load_conversation(conv_id)["state"]["raw_input"] == "Export me"
+
+@pytest.mark.asyncio
+async def test_model_analytics_endpoint():
+    """Per-model analytics come from the rollups and reject unknown groupings"""
+    from app.engine.analytics import model_analytics
+    model_analytics.ensure_built([])
+    model_analytics.record("a1", "2025-03-01T00:00:00", {"model_responses": [
+        {"model_id": "gpt-4o", "response_text": "Hi", "token_count": 1, "latency_ms": 50.0}
+    ]})
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.get("/analytics/models", params={"group_by": "day"})
+        bad = await ac.get("/analytics/models", params={"group_by": "hour"})
+    assert response.json()["models"] == [{
+        "model_id": "gpt-4o", "day": "2025-03-01", "responses": 1, "errors": 0, "error_rate": 0.0,
+        "avg_latency_ms": 50.0, "tokens": 1, "avg_tokens": 1.0, "reviews": 0, "avg_review_score": None,
+        "supporting": 0, "conflicting": 0, "support_rate": None
+    }]
+    assert bad.status_code == 400
@@ -80,3 +80,1232 @@ async def test_lock_constraints_hash_consistency():
     
     # Same input should produce same hash
     assert locked1.constraint_hash == locked2.constraint_hash
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    """Concurrent calls with the same key share one execution"""
+    import asyncio
+    from app.engine.coalescing import SingleFlight, coalescing_key
+
+    flight = SingleFlight("test_flight")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    key = coalescing_key("council", "Test query", "abc123", 2)
+    results = await asyncio.gather(*[flight.do(key, work) for _ in range(5)])
+
+    assert results == ["done"] * 5
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_when_all_waiters_leave():
+    """The shared task is cancelled only once its last waiter is cancelled"""
+    import asyncio
+    from app.engine.coalescing import SingleFlight
+
+    flight = SingleFlight("test_flight")
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    first = asyncio.ensure_future(flight.do("k", work))
+    second = asyncio.ensure_future(flight.do("k", work))
+    await started.wait()
+
+    first.cancel()
+    await asyncio.sleep(0)
+    assert not cancelled.is_set()
+
+    second.cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+def _cached_consensus(conversation_id, fields=None):
+    return {"id": conversation_id, "state": {"consensus": {
+        "final_answer": "Use FastAPI", "confidence": 0.8,
+        "uncertain_areas": [], "reasoning_trace": []
+    }}}
+
+def test_semantic_cache_matches_paraphrase(monkeypatch):
+    """A reworded prompt with the same constraints reuses the stored consensus"""
+    from app.engine import semantic_cache as sc
+
+    monkeypatch.setattr(sc, "load_conversation", _cached_consensus)
+    cache = sc.SemanticCache(threshold=0.7)
+    cache._loaded = True
+    cache.add("conv-1", "What is the best Python web framework for building REST APIs?", "hash-a")
+    cache.add("conv-2", "How do I center a div with CSS flexbox?", "hash-a")
+
+    match = cache.lookup("Which Python web framework is best for building a REST API?", "hash-a")
+    assert match is not None
+    assert match.conversation_id == "conv-1"
+    assert match.consensus.final_answer == "Use FastAPI"
+
+    # Different locked constraints never match
+    assert cache.lookup("What is the best Python web framework for building REST APIs?", "hash-b") is None
+
+def test_semantic_cache_builds_from_packs_and_evicts_deleted(monkeypatch):
+    """The index is built from the needed sections only, and deleted conversations stop matching"""
+    from app.engine import persistence, semantic_cache as sc, storage
+
+    def run(prompt):
+        return {
+            "raw_input": prompt, "errors": [],
+            "locked_context": {"constraint_hash": "hash-a", "normalized_prompt_data": {"normalized_prompt": prompt}},
+            "model_responses": [{"model_id": "gpt-4o", "response_text": "Use FastAPI", "token_count": 2}],
+            "all_claims": [{"model_id": "gpt-4o", "claims": [{"claim_id": "1", "text": "Use FastAPI"}]}],
+            "consensus": {"final_answer": "Use FastAPI", "confidence": 0.9, "uncertain_areas": [], "reasoning_trace": []},
+        }
+
+    first = persistence.save_conversation(run("What is the best Python web framework for REST APIs?"))
+    second = persistence.save_conversation(run("Which Python web framework is best for building REST APIs?"))
+    cache = sc.SemanticCache(threshold=0.7)
+    monkeypatch.setattr(sc, "semantic_cache", cache)
+
+    sections = []
+    real = storage.read_pack
+    monkeypatch.setattr(persistence, "read_pack", lambda f, wanted=None, **kw: sections.append(wanted) or real(f, wanted, **kw))
+    cache.ensure_loaded()
+    assert len(cache) == 2 and len(sections) == 2 and all("claims" not in wanted for wanted in sections)
+
+    match = cache.lookup("Which Python web framework is best for building REST APIs?", "hash-a")
+    assert match.conversation_id == second
+    persistence.delete_conversation(second)
+    assert len(cache) == 1
+    assert cache.lookup("Which Python web framework is best for building REST APIs?", "hash-a").conversation_id == first
+
+def test_semantic_cache_lookup_is_fast_at_scale(monkeypatch):
+    """Brute-force and LSH lookups stay in the millisecond range for large histories"""
+    import time
+    import numpy as np
+    from app.engine import semantic_cache as sc
+
+    monkeypatch.setattr(sc, "load_conversation", _cached_consensus)
+    for ann_min_size in (0, 1000):
+        cache = sc.SemanticCache(threshold=0.9, ann_min_size=ann_min_size)
+        cache._loaded = True
+        rng = np.random.default_rng(0)
+        partition = sc._Partition(cache.dims)
+        vectors = rng.standard_normal((30000, cache.dims)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        partition.vectors = vectors
+        partition.entries = [(f"conv-{i}", "") for i in range(len(vectors))]
+        if ann_min_size:
+            partition.build_lsh()
+        cache._partitions["hash-a"] = partition
+        cache.add("target", "Explain how database indexes speed up queries", "hash-a")
+
+        started = time.perf_counter()
+        match = cache.lookup("Explain how database indexes speed up queries", "hash-a")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        assert match is not None and match.conversation_id == "target"
+        assert elapsed_ms < 50
+
+def test_semantic_cache_skips_failed_runs(monkeypatch):
+    """Runs with errors, failed model calls or a fallback synthesis are never indexed"""
+    from app.engine import semantic_cache as sc
+
+    consensus = {"final_answer": "x", "confidence": 0.8, "uncertain_areas": [], "reasoning_trace": []}
+    ok = {"consensus": consensus, "locked_context": {"constraint_hash": "h"},
+          "model_responses": [{"model_id": "GPT-4o (OR)", "response_text": "Answer", "token_count": 1}], "errors": []}
+    assert sc.is_cacheable(ok)
+    assert not sc.is_cacheable({**ok, "errors": ["boom"]})
+    assert not sc.is_cacheable({**ok, "model_responses": [{"model_id": "GPT-4o (OR)", "response_text": "Error (openrouter): 401", "token_count": 0}]})
+    assert not sc.is_cacheable({**ok, "model_responses": ok["model_responses"] + [{"model_id": "system", "response_text": "No models available", "token_count": 0}]})
+
+    # A fallback consensus is never handed out as a cache hit
+    fallback = {**consensus, "reasoning_trace": [{"step": "synthesis", "details": "Fallback: raw text extraction"}]}
+    assert not sc.is_cacheable({**ok, "consensus": fallback})
+    prompt = "What is the best Python web framework for building REST APIs?"
+    monkeypatch.setattr(sc, "load_conversation", lambda conversation_id, fields=None: {"state": {"consensus": fallback}})
+    cache = sc.SemanticCache(threshold=0.7)
+    cache._loaded = True
+    cache.remember("conv-1", {**ok, "consensus": fallback, "locked_context": {
+        "constraint_hash": "h", "normalized_prompt_data": {"normalized_prompt": prompt}
+    }})
+    assert cache.lookup(prompt, "h") is None
+
+@pytest.mark.asyncio
+async def test_resume_restarts_from_failed_layer(monkeypatch, tmp_path):
+    """A run that fails in synthesis resumes without re-querying the models"""
+    from app.config import settings
+    from app.engine import graph
+    from app.engine.checkpoints import CheckpointStore
+    from app.models import ModelResponse, FinalConsensus
+
+    # No provider keys: utility layers use their offline fallbacks
+    monkeypatch.setattr(settings, "runtime_keys", settings.ApiKeys())
+    monkeypatch.setattr(graph, "checkpoint_store", CheckpointStore(str(tmp_path)))
+    calls = {"models": 0, "synthesis": 0}
+    synthesis_ok = {"value": False}
+
+    async def fake_models(context, model_count=4, **kwargs):
+        calls["models"] += 1
+        return [ModelResponse(model_id="gpt-4o", response_text="Use a cache for slow queries.", token_count=6)]
+
+    async def fake_synthesis(scored, context, responses, **kwargs):
+        calls["synthesis"] += 1
+        if not synthesis_ok["value"]:
+            raise RuntimeError("chairman unavailable")
+        return FinalConsensus(final_answer="Cache it", confidence=0.8, uncertain_areas=[], reasoning_trace=[])
+
+    monkeypatch.setattr(graph, "execute_parallel_models", fake_models)
+    monkeypatch.setattr(graph, "synthesize_consensus", fake_synthesis)
+
+    engine = graph.AntigravityEngine()
+    failed = await engine.run("Checkpoint query", model_count=1)
+    assert failed.errors and failed.consensus is None
+    assert calls == {"models": 1, "synthesis": 2}  # one automatic retry
+
+    # Forcing a downstream layer re-runs it and everything after, still without model calls
+    rescored = await engine.resume(failed.conversation_id, from_layer="scoring")
+    assert rescored.errors and calls == {"models": 1, "synthesis": 4}
+
+    synthesis_ok["value"] = True
+    resumed = await engine.resume(failed.conversation_id)
+    assert resumed.consensus.final_answer == "Cache it"
+    assert resumed.errors == []
+    assert calls == {"models": 1, "synthesis": 5}
+
+    # Saved cleanly: the checkpoints are gone
+    assert await engine.resume(failed.conversation_id) is None
+    assert await engine.resume("unknown-run") is None
+
+@pytest.mark.asyncio
+async def test_checkpoints_only_outlive_unfinished_runs(monkeypatch):
+    """Clean and coalesced runs leave no checkpoints; a failed run keeps its until deleted"""
+    import asyncio
+    import os
+    from app.config import settings
+    from app.engine import graph, persistence
+    from app.engine.checkpoints import checkpoint_store
+    from app.models import ModelResponse, FinalConsensus
+
+    monkeypatch.setattr(settings, "runtime_keys", settings.ApiKeys())
+    calls = {"models": 0}
+    synthesis_ok = {"value": True}
+
+    async def fake_models(context, model_count=4, **kwargs):
+        calls["models"] += 1
+        await asyncio.sleep(0.05)
+        return [ModelResponse(model_id="gpt-4o", response_text="Index the foreign keys.", token_count=4)]
+
+    async def fake_synthesis(scored, context, responses, **kwargs):
+        if not synthesis_ok["value"]:
+            raise RuntimeError("chairman unavailable")
+        return FinalConsensus(final_answer="Index them", confidence=0.8, uncertain_areas=[], reasoning_trace=[])
+
+    monkeypatch.setattr(graph, "execute_parallel_models", fake_models)
+    monkeypatch.setattr(graph, "synthesize_consensus", fake_synthesis)
+    original = settings.get_engine_settings()
+    settings.set_engine_settings(original.model_copy(update={"coalesce_raw_prompt": False}))
+    try:
+        engine = graph.AntigravityEngine()
+        await asyncio.gather(*(engine.run("Speed up joins", model_count=1) for _ in range(2)))
+        assert calls["models"] == 1
+        assert os.listdir(checkpoint_store.directory) == []
+
+        synthesis_ok["value"] = False
+        failed = await engine.run("Speed up joins", model_count=1)
+        assert os.listdir(checkpoint_store.directory) == [f"{failed.conversation_id}.json"]
+        persistence.delete_conversation(failed.conversation_id)
+        assert os.listdir(checkpoint_store.directory) == []
+    finally:
+        settings.set_engine_settings(original)
+
+@pytest.mark.asyncio
+async def test_coalesced_runs_keep_their_own_identity(monkeypatch):
+    """Joiners keep their prompt and get the leader's saved conversation; resumed runs never join"""
+    import asyncio
+    from app.config import settings
+    from app.engine import graph
+    from app.models import ModelResponse, FinalConsensus, NormalizedPrompt
+
+    monkeypatch.setattr(settings, "runtime_keys", settings.ApiKeys())
+    synthesis_ok = {"value": False}
+
+    async def same_normalization(raw_input, profile=None):
+        return NormalizedPrompt(intent="general_query", domain="general", explicit_constraints={},
+                                inferred_constraints={}, normalized_prompt=raw_input.strip().lower())
+
+    async def fake_models(context, model_count=4, **kwargs):
+        await asyncio.sleep(0.05)
+        return [ModelResponse(model_id="gpt-4o", response_text="Batch the writes.", token_count=3)]
+
+    async def fake_synthesis(scored, context, responses, **kwargs):
+        if not synthesis_ok["value"]:
+            raise RuntimeError("chairman unavailable")
+        return FinalConsensus(final_answer="Batch them", confidence=0.8, uncertain_areas=[], reasoning_trace=[])
+
+    monkeypatch.setattr(graph, "normalize_prompt", same_normalization)
+    monkeypatch.setattr(graph, "execute_parallel_models", fake_models)
+    monkeypatch.setattr(graph, "synthesize_consensus", fake_synthesis)
+    original = settings.get_engine_settings()
+    settings.set_engine_settings(original.model_copy(update={"coalesce_raw_prompt": False}))
+    try:
+        engine = graph.AntigravityEngine()
+        failed = await engine.run("Faster writes?", model_count=1)
+        synthesis_ok["value"] = True
+
+        leader, joiner, resumed = await asyncio.gather(
+            engine.run("Faster writes?", model_count=1),
+            engine.run("  FASTER WRITES?", model_count=1),
+            engine.resume(failed.conversation_id)
+        )
+        assert joiner.raw_input == "  FASTER WRITES?" and leader.raw_input == "Faster writes?"
+        assert joiner.conversation_id == leader.conversation_id != failed.conversation_id
+        assert resumed.conversation_id == failed.conversation_id and resumed.errors == []
+    finally:
+        settings.set_engine_settings(original)
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_gathered_calls():
+    """A client disconnect cancels the run and every call it gathered"""
+    import asyncio
+    from app.engine.cancellation import run_until_disconnected, ClientDisconnected
+
+    cancelled = []
+
+    async def model_call(i):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(i)
+            raise
+
+    async def run():
+        await asyncio.gather(*[model_call(i) for i in range(3)])
+
+    checks = {"count": 0}
+    async def is_disconnected():
+        checks["count"] += 1
+        return checks["count"] >= 2
+
+    with pytest.raises(ClientDisconnected):
+        await run_until_disconnected(run(), is_disconnected, poll_interval=0.01)
+    await asyncio.sleep(0)
+    assert sorted(cancelled) == [0, 1, 2]
+
+@pytest.mark.asyncio
+async def test_disconnect_can_finish_in_background():
+    """With finish_in_background the run completes after the client leaves"""
+    import asyncio
+    from app.engine.cancellation import run_until_disconnected, ClientDisconnected, background_run_count
+
+    finished = asyncio.Event()
+
+    async def run():
+        await asyncio.sleep(0.05)
+        finished.set()
+
+    async def is_disconnected():
+        return True
+
+    with pytest.raises(ClientDisconnected):
+        await run_until_disconnected(run(), is_disconnected, poll_interval=0.01, finish_in_background=True)
+    assert background_run_count() == 1
+    await asyncio.wait_for(finished.wait(), timeout=1)
+
+@pytest.mark.asyncio
+async def test_early_exit_cancels_remaining_models():
+    """Once the first responses agree, slower model calls are cancelled"""
+    import asyncio
+    from app.engine.agreement import AgreementTracker
+    from app.engine.execution import _gather_until_agreement
+    from app.models import ModelResponse
+
+    answer = "Paris is the capital of France. It is also the largest city in the country."
+    cancelled = []
+
+    async def respond(name, delay, text):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(name)
+            raise
+        return ModelResponse(model_id=name, response_text=text, token_count=len(text.split()))
+
+    tracker = AgreementTracker(threshold=0.75, min_responses=2)
+    responses = await _gather_until_agreement([
+        respond("a", 0.01, answer),
+        respond("b", 0.02, answer),
+        respond("c", 5, "A slow answer"),
+    ], tracker)
+
+    assert [r.model_id for r in responses] == ["a", "b"]
+    assert tracker.stopped_early
+    assert cancelled == ["c"]
+    assert tracker.trace_entry("skipped")["step"] == "early_exit"
+
+def test_agreement_tracker_requires_agreement():
+    """Disagreeing responses never trigger an early exit"""
+    from app.engine.agreement import AgreementTracker
+    from app.models import ModelResponse
+
+    tracker = AgreementTracker(threshold=0.75)
+    assert not tracker.add(ModelResponse(model_id="a", response_text="Use PostgreSQL for relational data with strong consistency.", token_count=8))
+    assert not tracker.add(ModelResponse(model_id="b", response_text="Kubernetes orchestrates containers across a cluster of machines.", token_count=8))
+    assert tracker.agreement < 0.75
+
+def test_run_profiles_resolve_with_server_overrides():
+    """Built-in profiles can be overridden and extended server-side"""
+    from app.config import settings
+
+    original = settings.get_engine_settings()
+    try:
+        settings.set_engine_settings(settings.EngineSettings(
+            run_profiles={"chat": {"peer_review": False, "max_tokens": {"execution": 256}}, "fast": {"max_reviewers": 1}}
+        ))
+        chat = settings.get_run_profile("chat")
+        assert chat.name == "chat" and not chat.peer_review
+        assert chat.completion_kwargs("execution") == {"max_tokens": 256}
+        assert settings.get_run_profile("fast").max_reviewers == 1
+        assert not settings.get_run_profile("fast").llm_normalization
+        assert settings.get_run_profile().name == "balanced"
+        with pytest.raises(ValueError):
+            settings.get_run_profile("missing")
+    finally:
+        settings.set_engine_settings(original)
+
+@pytest.mark.asyncio
+async def test_fast_profile_skips_llm_normalization():
+    """The fast profile normalizes locally instead of calling an LLM"""
+    from app.config.settings import get_run_profile
+    normalized = await normalize_prompt("Explain Python generators", profile=get_run_profile("fast"))
+    assert normalized.normalized_prompt == "Explain Python generators"
+
+@pytest.mark.asyncio
+async def test_speculative_council_kept_when_prompt_unchanged(monkeypatch, tmp_path):
+    """Speculative responses are reused when normalization barely changes the prompt"""
+    import asyncio
+    from app.config import settings
+    from app.engine import graph
+    from app.engine.checkpoints import CheckpointStore
+    from app.models import ModelResponse, NormalizedPrompt
+
+    monkeypatch.setattr(settings, "runtime_keys", settings.ApiKeys())
+    monkeypatch.setattr(graph, "checkpoint_store", CheckpointStore(str(tmp_path)))
+    original = settings.get_engine_settings()
+    settings.set_engine_settings(original.model_copy(update={"speculative_execution": True}))
+
+    events = []
+
+    async def slow_normalize(raw_input, profile=None):
+        events.append("normalize-start")
+        await asyncio.sleep(0.05)
+        events.append("normalize-end")
+        return NormalizedPrompt(
+            intent="explain_concept", domain="web_dev", explicit_constraints={},
+            inferred_constraints={"language": "english", "depth": "intermediate"},
+            normalized_prompt=raw_input
+        )
+
+    async def fake_models(context, model_count=4, **kwargs):
+        events.append("models-start")
+        return [ModelResponse(model_id="gpt-4o", response_text="Speculation works.", token_count=2)]
+
+    monkeypatch.setattr(graph, "normalize_prompt", slow_normalize)
+    monkeypatch.setattr(graph, "execute_parallel_models", fake_models)
+    try:
+        state = await graph.AntigravityEngine().run("Explain speculative execution", model_count=1)
+    finally:
+        settings.set_engine_settings(original)
+
+    assert events.index("models-start") < events.index("normalize-end")
+    assert events.count("models-start") == 1
+    assert any(step["step"] == "speculation" for step in state.consensus.reasoning_trace)
+
+def test_parse_chairman_output_checks_schema():
+    """Only JSON objects with a non-empty final_answer count as a valid synthesis"""
+    from app.engine.chairman import parse_chairman_output
+    assert parse_chairman_output('{"final_answer": "42", "uncertain_areas": "none"}') == {
+        "final_answer": "42", "uncertain_areas": []
+    }
+    assert parse_chairman_output('{"final_answer": ""}') is None
+    assert parse_chairman_output("not json") is None
+    assert parse_chairman_output("[1, 2]") is None
+
+@pytest.mark.asyncio
+async def test_chairman_race_keeps_first_valid_answer():
+    """An invalid fast answer is skipped, the first valid one wins and the rest is cancelled"""
+    import asyncio
+    from types import SimpleNamespace
+    from app.engine.chairman import race_chairmen, chairman_stats
+
+    cancelled = []
+
+    def fake_client(delay, content):
+        async def create(**kwargs):
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(content)
+                raise
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    chairmen = [
+        ("test:fast-invalid", fake_client(0.01, "not json"), "fast-invalid"),
+        ("test:valid", fake_client(0.03, '{"final_answer": "Valid"}'), "valid"),
+        ("test:slow", fake_client(5, '{"final_answer": "Slow"}'), "slow"),
+    ]
+    result, winner, first_raw = await race_chairmen(chairmen, "instructions", "request", {})
+
+    assert result["final_answer"] == "Valid"
+    assert winner == "test:valid"
+    assert first_raw == "not json"
+    assert cancelled == ['{"final_answer": "Slow"}']
+    stats = chairman_stats()
+    assert stats["test:valid"]["wins"] >= 1
+    assert stats["test:fast-invalid"]["invalid"] >= 1
+
+def test_prompt_templates_keep_a_stable_cacheable_prefix():
+    """Instructions form an identical system prefix; cache hints only on routes that accept them"""
+    from types import SimpleNamespace
+    from app.engine.metrics import metrics
+    from app.engine.prompts import SYNTHESIS_INSTRUCTIONS, build_messages, record_usage
+
+    first = build_messages(SYNTHESIS_INSTRUCTIONS, "Query: one", "groq", "llama-3.3-70b-versatile")
+    second = build_messages(SYNTHESIS_INSTRUCTIONS, "Query: two", "groq", "llama-3.3-70b-versatile")
+    assert first[0] == second[0] == {"role": "system", "content": SYNTHESIS_INSTRUCTIONS}
+    assert first[1]["content"] == "Query: one"
+
+    hinted = build_messages(SYNTHESIS_INSTRUCTIONS, "Query", "openrouter", "anthropic/claude-3.5-sonnet")
+    assert hinted[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+    assert isinstance(build_messages(SYNTHESIS_INSTRUCTIONS, "Query", "openrouter", "openai/gpt-4o")[0]["content"], str)
+
+    before = metrics.snapshot().get("prompt_cache", {}).get("synthesis_cached_tokens", 0)
+    usage = SimpleNamespace(prompt_tokens=1500, prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+    record_usage("synthesis", SimpleNamespace(usage=usage))
+    assert metrics.snapshot()["prompt_cache"]["synthesis_cached_tokens"] == before + 1024
+
+def test_text_chunker_streams_with_overlap():
+    """Chunks stay within the size limit, overlap, and cover the whole input"""
+    from app.engine.chunking import TextChunker, iter_chunks
+    lines = [f"2024-01-01 12:00:{i:02d} worker-{i} handled request {i}\n" for i in range(400)]
+    text = "".join(lines)
+    chunks = list(iter_chunks((text[i:i + 1000].encode() for i in range(0, len(text), 1000)), TextChunker(2000, 100)))
+
+    assert len(chunks) > 1
+    assert all(len(c) <= 2000 for c in chunks)
+    assert all(c.endswith("\n") for c in chunks[:-1])
+    assert chunks[1].startswith(chunks[0][-100:][:10])
+    assert all(line in "".join(chunks) for line in lines)
+
+@pytest.mark.asyncio
+async def test_chunked_run_bounds_parallelism(monkeypatch, tmp_path):
+    """Large inputs are map-reduced with at most chunk_parallelism parts in flight"""
+    import asyncio
+    from app.config import settings
+    from app.engine import graph, map_reduce
+    from app.models import ModelResponse
+
+    monkeypatch.setattr(settings, "runtime_keys", settings.ApiKeys())
+    original = settings.get_engine_settings()
+    settings.set_engine_settings(original.model_copy(update={
+        "chunk_threshold_chars": 5000, "chunk_chars": 2000, "chunk_overlap_chars": 0,
+        "chunk_parallelism": 2, "reduce_fanout": 3
+    }))
+
+    running, peak, prompts = 0, 0, []
+
+    async def fake_models(context, model_count=4, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        prompts.append(context.normalized_prompt_data.normalized_prompt)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return [ModelResponse(model_id="gpt-4o", response_text="Found a timeout in this part of the log.", token_count=8)]
+
+    monkeypatch.setattr(map_reduce, "execute_parallel_models", fake_models)
+    raw = "Why do requests time out?\n" + "".join(f"line {i}: request timed out after 30s\n" for i in range(600))
+    try:
+        state = await graph.AntigravityEngine().run(raw, model_count=1)
+    finally:
+        settings.set_engine_settings(original)
+
+    assert not state.errors
+    assert peak == 2
+    assert len(state.model_responses) == len(prompts) > 3
+    assert all(len(p) < 2000 + 3000 for p in prompts)
+    assert state.consensus.reasoning_trace[-1]["step"] == "map_reduce"
+    assert "3 level(s)" in state.consensus.reasoning_trace[-1]["details"]
+
+@pytest.mark.asyncio
+async def test_output_budgets_learned_and_applied(monkeypatch):
+    """Council max_tokens follow configured, then learned (from saved packs), then default intent budgets"""
+    from types import SimpleNamespace
+    from app.config import settings
+    from app.engine import budgets, execution, persistence
+    from app.engine.normalization import lock_constraints
+    from app.models import NormalizedPrompt
+
+    def stored(intent, words):
+        return {
+            "normalized": {"intent": intent, "domain": "web_dev"},
+            "model_responses": [{"model_id": "gpt-4o", "response_text": "ok", "token_count": words}]
+        }
+
+    for state in [stored("explain_concept", 300 + i) for i in range(30)] + [stored("debug_code", 900)]:
+        persistence.save_conversation(state)
+    monkeypatch.setattr(budgets, "output_budgets", budgets.OutputBudgets())
+    monkeypatch.setattr(execution, "output_budgets", budgets.output_budgets)
+
+    def prompt(intent):
+        return NormalizedPrompt(intent=intent, domain="web_dev", explicit_constraints={}, inferred_constraints={}, normalized_prompt="q")
+
+    original = settings.get_engine_settings()
+    try:
+        settings.set_engine_settings(original.model_copy(update={"budget_min_samples": 20}))
+        # The history is not scanned on demand: defaults apply until it has been loaded
+        assert budgets.output_budgets.budget_for(prompt("explain_concept")) == budgets.DEFAULT_INTENT_BUDGETS["explain_concept"]
+        budgets.output_budgets.ensure_loaded()
+        learned = budgets.output_budgets.budget_for(prompt("explain_concept"))
+        assert 400 < learned < 600
+        # Too few samples for debug_code: the built-in default applies
+        assert budgets.output_budgets.budget_for(prompt("debug_code")) == budgets.DEFAULT_INTENT_BUDGETS["debug_code"]
+        assert budgets.output_budgets.budget_for(prompt("unknown_intent")) is None
+
+        settings.set_engine_settings(original.model_copy(update={"output_budgets": {"explain_concept:web_dev": 700}}))
+        assert budgets.output_budgets.budget_for(prompt("explain_concept")) == 700
+
+        requested = []
+
+        async def create(**kwargs):
+            requested.append(kwargs["max_tokens"])
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Short answer."))])
+
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        monkeypatch.setattr(execution, "get_unified_models", lambda: [{"id": "m", "name": "m", "provider": "groq"}])
+        monkeypatch.setattr(execution, "get_provider_client", lambda provider: (client, []))
+        context = await lock_constraints(prompt("explain_concept"))
+        await execution.execute_parallel_models(context, model_count=1)
+        await execution.execute_parallel_models(context, model_count=1, profile=settings.get_run_profile("fast"))
+        assert requested == [700, 512]
+    finally:
+        settings.set_engine_settings(original)
+
+@pytest.mark.asyncio
+async def test_key_pool_spreads_load_and_benches_rate_limited_keys():
+    """Requests go to the least-loaded key; a 429 benches that key"""
+    import asyncio
+    from app.engine.key_pool import KeyPool, KeyPoolTransport, sdk_httpx as httpx
+
+    seen = []
+
+    async def handler(request):
+        key = request.headers["Authorization"].split()[-1]
+        seen.append(key)
+        if key == "gsk_limited_key":
+            return httpx.Response(429, headers={"retry-after": "60"})
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={}, headers={"x-ratelimit-remaining-requests": "99"})
+
+    pool = KeyPool()
+    keys = ["gsk_limited_key", "gsk_second_key", "gsk_third_key"]
+    transport = KeyPoolTransport(pool, "groq", keys, httpx.MockTransport(handler))
+    async with httpx.AsyncClient(transport=transport, base_url="https://api.groq.test") as client:
+        first = await client.get("/")
+        assert first.status_code == 429
+        responses = await asyncio.gather(*[client.get("/") for _ in range(6)])
+
+    assert all(r.status_code == 200 for r in responses)
+    assert seen.count("gsk_limited_key") == 1
+    assert seen.count("gsk_second_key") == seen.count("gsk_third_key") == 3
+    states = {k: pool._state("groq", k) for k in keys}
+    assert states["gsk_limited_key"].rate_limited == 1
+    assert states["gsk_second_key"].remaining == 99
+
+@pytest.mark.asyncio
+async def test_key_rotation_closes_replaced_connection_pools(monkeypatch):
+    """A replaced client's pool is closed, but only after the responses it is still reading"""
+    import asyncio
+    from app.engine import cassette
+    from app.engine.key_pool import KeyPool, sdk_httpx as httpx
+    from app.engine.providers import ProviderFactory
+
+    closed = []
+
+    class Inner(httpx.MockTransport):
+        async def aclose(self):
+            closed.append(self)
+
+    monkeypatch.setattr(cassette, "provider_transport", lambda provider_id=None: Inner(lambda request: httpx.Response(200, json={})))
+    pool = KeyPool()
+    adapter = ProviderFactory.get_adapter("groq")
+    pool.client("groq", adapter, ["gsk_old_key"])
+    old = pool._transports[("groq", ("gsk_old_key",))]
+    response = await old.handle_async_request(httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions"))
+
+    pool.client("groq", adapter, ["gsk_new_key"])
+    await asyncio.sleep(0)
+    assert closed == [] and old.retired
+    await response.aclose()
+    assert closed == [old.inner]
+    assert not pool._transports[("groq", ("gsk_new_key",))].retired
+
+@pytest.mark.asyncio
+async def test_anthropic_adapter_against_stub_server():
+    """Anthropic keys go straight to the Messages API with JSON mode, caching hints and streaming"""
+    import json as jsonlib
+    from openai import APIStatusError
+    from app.engine.key_pool import KeyPool, KeyPoolTransport, sdk_httpx as httpx
+    from app.engine.prompts import build_messages, cached_prompt_tokens
+    from app.engine.providers import ProviderFactory, AnthropicProvider
+    from tests.provider_stubs import anthropic_stub
+
+    received = []
+    adapter = ProviderFactory.get_adapter("anthropic")
+    assert isinstance(adapter, AnthropicProvider)
+    pool = KeyPool()
+    transport = KeyPoolTransport(pool, "anthropic", ["sk-ant-stub"], httpx.ASGITransport(app=anthropic_stub(received)), adapter.auth_headers)
+    from app.config import settings
+    original = settings.get_engine_settings()
+    settings.set_engine_settings(original.model_copy(update={"provider_base_urls": {"anthropic": "http://stub/v1"}}))
+    try:
+        client = adapter.get_client("sk-ant-stub", http_client=httpx.AsyncClient(transport=transport))
+    finally:
+        settings.set_engine_settings(original)
+
+    messages = build_messages("Return JSON.", "hi", "openrouter", "anthropic/claude-3.5-sonnet")
+    completion = await client.chat.completions.create(
+        model="claude-3-5-haiku-latest", messages=messages, response_format={"type": "json_object"}, max_tokens=100
+    )
+    assert jsonlib.loads(completion.choices[0].message.content) == {"echo": "hi"}
+    assert cached_prompt_tokens(completion.usage) == 1024
+    sent = received[-1]
+    assert sent["headers"]["x-api-key"] == "sk-ant-stub"
+    assert sent["body"]["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert sent["body"]["max_tokens"] == 100
+
+    stream = await client.chat.completions.create(
+        model="claude-3-5-haiku-latest", messages=[{"role": "user", "content": "hi"}], stream=True
+    )
+    chunks = [chunk async for chunk in stream]
+    assert "".join(c.choices[0].delta.content or "" for c in chunks) == "echo: hi"
+    assert chunks[-1].choices[0].finish_reason == "stop"
+
+    assert (await client.models.list()).data[0].id == "claude-3-5-haiku-latest"
+    with pytest.raises(APIStatusError):
+        await client.chat.completions.create(model="limited", messages=[{"role": "user", "content": "hi"}])
+    assert pool._state("anthropic", "sk-ant-stub").rate_limited == 1
+
+@pytest.mark.asyncio
+async def test_gemini_and_anthropic_keys_use_direct_routes():
+    """Direct keys resolve to their own adapters instead of OpenRouter"""
+    from app.config import settings
+    from app.engine import llm
+    from app.engine.key_pool import sdk_httpx as httpx
+    from app.engine.providers import GeminiProvider
+    from tests.provider_stubs import openai_compatible_stub
+
+    original = settings.get_keys()
+    try:
+        settings.set_keys(settings.ApiKeys(anthropic_api_key="sk-ant-api03-direct"))
+        client, models, provider_id = llm.get_active_provider_context()
+        assert provider_id == "anthropic" and models[0]["provider"] == "anthropic"
+        assert llm.get_unified_models() == models
+        assert llm.default_utility_model("anthropic") == "claude-3-5-haiku-latest"
+    finally:
+        settings.set_keys(original)
+
+    received = []
+    engine_settings = settings.get_engine_settings()
+    settings.set_engine_settings(engine_settings.model_copy(update={"provider_base_urls": {"gemini": "http://stub/v1beta/openai/"}}))
+    try:
+        http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=openai_compatible_stub(received)))
+        client = GeminiProvider().get_client("AIza-stub", http_client=http_client)
+        completion = await client.chat.completions.create(
+            model="gemini-2.0-flash", messages=[{"role": "user", "content": "hi"}], response_format={"type": "json_object"}
+        )
+    finally:
+        settings.set_engine_settings(engine_settings)
+    assert completion.choices[0].message.content == '{"answer": "stub"}'
+    assert received[0]["headers"]["authorization"] == "Bearer AIza-stub"
+
+@pytest.mark.asyncio
+async def test_utility_stages_routed_to_local_server(monkeypatch):
+    """Stages listed in stage_providers run on the local OpenAI-compatible server"""
+    import json as jsonlib
+    from app.config import settings
+    from app.engine.execution import extract_claims
+    from app.models import ModelResponse
+    from tests.provider_stubs import openai_compatible_stub, serve
+
+    def reply(body):
+        if "prompt analyzer" in str(body["messages"][0]["content"]):
+            return jsonlib.dumps({
+                "intent": "explain_concept", "domain": "python", "explicit_constraints": {},
+                "inferred_constraints": {}, "normalized_prompt": "Explain Python generators."
+            })
+        return jsonlib.dumps({"claims": ["Generators yield values lazily."]})
+
+    received = []
+    monkeypatch.setattr(settings, "runtime_keys", settings.ApiKeys(groq_api_key="gsk_remote_council_key"))
+    original = settings.get_engine_settings()
+    with serve(openai_compatible_stub(received, reply)) as base_url:
+        settings.set_engine_settings(original.model_copy(update={
+            "local_base_url": base_url + "/v1",
+            "local_model": "tiny-local",
+            "stage_providers": {"normalization": "local", "claims": "local"}
+        }))
+        try:
+            normalized = await normalize_prompt("explain python generators pls")
+            claims = await extract_claims([ModelResponse(model_id="llama", response_text="Generators are lazy.", token_count=3)])
+        finally:
+            settings.set_engine_settings(original)
+
+    assert normalized.intent == "explain_concept"
+    assert claims[0].claims[0].text == "Generators yield values lazily."
+    assert [r["body"]["model"] for r in received] == ["tiny-local", "tiny-local"]
+
+def test_search_index_ranks_filters_and_paginates(tmp_path):
+    """Search ranks prompt matches first, filters on metadata and survives re-indexing"""
+    from app.engine.search_index import SearchIndex
+
+    def run(prompt, answer, intent="explain_concept", domain="python", model="gpt-4o"):
+        return {
+            "raw_input": prompt,
+            "normalized": {"intent": intent, "domain": domain, "normalized_prompt": prompt},
+            "model_responses": [{"model_id": model, "response_text": answer}],
+            "all_claims": [{"model_id": model, "claims": [{"text": answer}]}],
+            "consensus": {"final_answer": answer, "confidence": 0.8}
+        }
+
+    index = SearchIndex(str(tmp_path / "index.sqlite"))
+    index.ensure_built([])
+    index.add("a", "2025-01-01T00:00:00", run("How do Python generators work?", "They yield lazily."))
+    index.add("b", "2025-01-02T00:00:00", run("Explain decorators", "Decorators can wrap generators too."))
+    index.add("c", "2025-01-03T00:00:00", run("Pick a SQL database", "Use Postgres.", "compare_options", "databases", "llama-3.3"))
+    for i in range(30):
+        index.add(f"bulk-{i}", f"2024-12-{i % 28 + 1:02d}T00:00:00", run(f"Filler question {i}", "Nothing relevant."))
+
+    total, results = index.search("generator")
+    assert total == 2
+    assert [r["id"] for r in results] == ["a", "b"]
+
+    total, results = index.search("postgres")
+    assert [r["id"] for r in results] == ["c"]
+    assert results[0]["models"] == ["llama-3.3"]
+
+    total, results = index.search(intent="compare_options")
+    assert total == 1
+    assert index.search("generator", model="llama-3.3")[0] == 0
+
+    total, first = index.search("filler", limit=10)
+    _, second = index.search("filler", limit=10, offset=10)
+    assert total == 30
+    assert not {r["id"] for r in first} & {r["id"] for r in second}
+
+    index.add("a", "2025-01-04T00:00:00", run("Rust ownership", "Borrowing rules."))
+    assert [r["id"] for r in index.search("generator")[1]] == ["b"]
+    index.remove("b")
+    assert index.search("generator")[0] == 0
+    assert index.search("'\"*(")[0] == 32
+    index.close()
+
+def test_packed_conversation_storage(monkeypatch, tmp_path):
+    """Packs round-trip, load single sections, dedupe clusters and leave legacy JSON readable"""
+    import os
+    from app.engine import persistence, storage
+
+    cluster = {"cluster_id": "c1", "canonical_claim": "Use FastAPI", "supporting_models": ["a", "b"], "conflicting_models": []}
+    state = {
+        "raw_input": "Which framework?",
+        "model_responses": [{"model_id": m, "response_text": "Use FastAPI. " * 200, "token_count": 600} for m in "ab"],
+        "agreement_clusters": [cluster, {**cluster, "cluster_id": "c2"}],
+        "scored_clusters": [{**cluster, "confidence_score": 0.9, "reasons": ["agreement"]}],
+        "consensus": {"final_answer": "FastAPI", "confidence": 0.9, "uncertain_areas": [], "reasoning_trace": []},
+        "custom_key": 1
+    }
+    conversation_id = persistence.save_conversation(state)
+    packed = tmp_path / "conversations" / f"{conversation_id}.qcp"
+    assert persistence.load_conversation(conversation_id)["state"] == state
+    assert packed.stat().st_size * 5 < len(json.dumps({"state": state}, indent=2))
+
+    # Only the consensus section is inflated
+    inflated = []
+    real = storage._decompress
+    monkeypatch.setattr(storage, "_decompress", lambda data, codec: inflated.append(len(data)) or real(data, codec))
+    assert persistence.load_conversation(conversation_id, fields=["consensus.final_answer"])["state"] == {"consensus": state["consensus"]}
+    assert len(inflated) == 1
+
+    with open(tmp_path / "conversations" / "legacy.json", "w") as f:
+        json.dump({"id": "legacy", "timestamp": "2024-01-01T00:00:00", "state": {"raw_input": "old"}}, f, indent=2)
+    assert persistence.load_conversation("legacy", fields=["consensus"])["state"]["raw_input"] == "old"
+    assert [c["query"] for c in persistence.list_conversations()] == ["Which framework?", "old"]
+    assert {c["id"] for c in persistence.iter_conversations()} == {conversation_id, "legacy"}
+
+    # Re-saving a legacy conversation replaces its JSON file
+    persistence.save_conversation({"raw_input": "old, resumed"}, "legacy")
+    assert sorted(os.listdir(persistence.DATA_DIR)) == sorted([packed.name, "legacy.qcp"])
+
+def test_blob_store_dedupes_and_collects():
+    """Repeated responses are stored once and deleted with their last conversation"""
+    from app.engine import persistence
+    from app.engine.blob_store import blob_store
+
+    answer = "Use a connection pool and keep transactions short. " * 40
+
+    def state(extra):
+        return {
+            "raw_input": "How do I scale Postgres?",
+            "model_responses": [{"model_id": "a", "response_text": answer, "token_count": 400},
+                                {"model_id": "b", "response_text": answer + extra, "token_count": 400}],
+            "all_claims": [{"model_id": "a", "claims": [{"claim_id": "1", "text": "Pool connections"}]}]
+        }
+
+    first = persistence.save_conversation(state("one"))
+    second = persistence.save_conversation(state("two"))
+    stats = blob_store.stats()
+    assert stats["blobs"] == 3 and stats["references"] == 4
+    assert persistence.load_conversation(second)["state"] == state("two")
+
+    # Re-saving drops the references of the previous version
+    persistence.save_conversation(state("three"), second)
+    assert blob_store.stats()["blobs"] == 3
+
+    assert persistence.delete_conversation(first)
+    stats = blob_store.stats()
+    assert stats["blobs"] == 2 and stats["references"] == 2
+    assert not persistence.delete_conversation(first)
+    assert persistence.load_conversation(second)["state"]["model_responses"][0]["response_text"] == answer
+
+    # A full sweep repairs leaked references
+    blob_store.put_many([b'"orphan"'], lambda data: ("zlib", __import__("zlib").compress(data)))
+    assert persistence.collect_garbage() == {"deleted": 1, "live": 2}
+    assert persistence.delete_conversation(second)
+    assert blob_store.stats()["blobs"] == 0
+
+def test_compaction_retention_and_archive(monkeypatch):
+    """Old conversations move into segments, stay loadable and expire into the archive"""
+    import gzip
+    import os
+    from datetime import datetime, timedelta
+    from app.config import settings
+    from app.engine import persistence, retention
+    from app.engine.segments import segment_store
+
+    monkeypatch.setattr(segment_store, "max_bytes", 2000)
+    ids = [persistence.save_conversation({
+        "raw_input": f"Question {i}",
+        "model_responses": [{"model_id": "a", "response_text": f"Answer {i}. " * 100, "token_count": 300}],
+        "consensus": {"final_answer": f"Final {i}"}
+    }) for i in range(6)]
+
+    later = datetime.now() + timedelta(days=30)
+    report = retention.run_maintenance(now=later)
+    assert report["compacted"] == 6 and report["deleted"] == 0
+    assert os.listdir(persistence.DATA_DIR) == []
+    assert segment_store.stats()["segments"] > 1
+    assert persistence.load_conversation(ids[0], fields=["consensus"])["state"] == {"consensus": {"final_answer": "Final 0"}}
+    assert persistence.load_conversation(ids[1])["state"]["model_responses"][0]["response_text"].startswith("Answer 1.")
+    assert len(persistence.list_conversations()) == 6
+
+    # A resumed conversation leaves the segments; a deleted one is tombstoned
+    persistence.save_conversation({"raw_input": "Question 2, resumed"}, ids[2])
+    assert persistence.delete_conversation(ids[3])
+    assert ids[2] not in segment_store and ids[3] not in segment_store
+    segment_store.close()
+    os.remove(os.path.join(segment_store.root, "index.sqlite"))
+    assert segment_store.rebuild_index() == 4
+    assert persistence.load_conversation(ids[2])["state"]["raw_input"] == "Question 2, resumed"
+
+    original = settings.get_engine_settings()
+    settings.set_engine_settings(original.model_copy(update={"retention_max_count": 2, "segment_min_live_ratio": 0.9}))
+    try:
+        report = retention.run_maintenance(now=later)
+    finally:
+        settings.set_engine_settings(original)
+    assert report["deleted"] == 3 and report["segment_bytes_reclaimed"] > 0
+    assert {c["id"] for c in persistence.list_conversations()} == {ids[2], ids[5]}
+    with gzip.open(report["archive"]) as f:
+        archived = [json.loads(line) for line in f]
+    assert [a["id"] for a in archived] == [ids[0], ids[1], ids[4]]
+    assert archived[0]["state"]["model_responses"][0]["response_text"].startswith("Answer 0.")
+    assert persistence.load_conversation(ids[5])["state"]["consensus"] == {"final_answer": "Final 5"}
+
+def test_retention_byte_limit_counts_blobs():
+    """Stored sizes include each conversation's share of its blobs, so the byte limit bounds real storage"""
+    import random
+    from datetime import datetime
+    from app.config import settings
+    from app.engine import persistence, retention
+    from app.engine.blob_store import blob_store
+
+    def state(text):
+        return {"raw_input": "Q", "model_responses": [{"model_id": "a", "response_text": text, "token_count": 900}]}
+
+    rng = random.Random(0)
+    unique = " ".join(str(rng.random()) for _ in range(600))
+    shared = " ".join(str(rng.random()) for _ in range(600))
+    old = persistence.save_conversation(state(unique), timestamp="2025-01-01T00:00:00")
+    persistence.save_conversation(state(shared), timestamp="2025-01-02T00:00:00")
+    persistence.save_conversation(state(shared), timestamp="2025-01-03T00:00:00")
+
+    packs = {c["id"]: c["size"] for c in persistence.stored_conversations()}
+    full = {c["id"]: c["size"] for c in persistence.stored_conversations(full_size=True)}
+    blob_bytes = blob_store._db().execute("SELECT SUM(length(data)) FROM blobs").fetchone()[0]
+    extra = {i: full[i] - packs[i] for i in full}
+    assert sum(extra.values()) == pytest.approx(blob_bytes, abs=3)
+    # The shared blob is split between the two conversations referencing it
+    assert all(extra[old] > 1.5 * extra[i] for i in extra if i != old)
+
+    # Every pack alone fits the limit; with their blobs the oldest conversation has to go
+    original = settings.get_engine_settings()
+    limit = sum(full.values()) - 1
+    assert sum(packs.values()) < limit
+    settings.set_engine_settings(original.model_copy(update={"retention_max_bytes": limit, "archive_expired": False}))
+    try:
+        report = retention.run_maintenance(now=datetime(2025, 1, 4))
+    finally:
+        settings.set_engine_settings(original)
+    assert report["deleted"] == 1 and not persistence.conversation_exists(old)
+
+def test_bulk_export_import_round_trip():
+    """NDJSON exports filter and flatten, and re-import (gzipped too) with ids and timestamps kept"""
+    import gzip
+    from app.engine import bulk, persistence
+
+    review = {"reviewer_model": "a", "reviewed_model": "b", "accuracy_score": 8, "insight_score": 7,
+              "constraint_adherence": 9, "feedback": "Solid"}
+    for i, intent in enumerate(["coding", "coding", "writing"]):
+        persistence.save_conversation({
+            "raw_input": f"Question {i}",
+            "normalized": {"intent": intent, "domain": "software", "explicit_constraints": {},
+                           "inferred_constraints": {}, "normalized_prompt": f"Question {i}"},
+            "model_responses": [{"model_id": m, "response_text": f"Answer {i} from {m}", "token_count": 10} for m in "ab"],
+            "all_claims": [{"model_id": "a", "claims": [{"claim_id": "c1", "text": "Claim"}]}],
+            "peer_reviews": [review],
+        }, f"conv-{i}", timestamp=f"2025-01-0{i + 1}T00:00:00")
+
+    exported = b"".join(bulk.export_ndjson())
+    assert len(exported.splitlines()) == 3
+    assert len(list(bulk.export_ndjson(intent="coding", since="2025-01-02"))) == 1
+    responses = [json.loads(line) for line in bulk.export_ndjson("responses", model="b")]
+    assert sorted(r["conversation_id"] for r in responses) == ["conv-0", "conv-1", "conv-2"]
+    assert {r["model_id"] for r in responses} == {"b"} and set(responses[0]) == set(bulk.TABLES["responses"])
+    reviews = [json.loads(line) for line in bulk.export_ndjson("reviews", intent="writing")]
+    assert reviews == [{"conversation_id": "conv-2", "timestamp": "2025-01-03T00:00:00", "intent": "writing",
+                        "domain": "software", **review}]
+
+    for conversation_id in ("conv-0", "conv-1", "conv-2"):
+        persistence.delete_conversation(conversation_id)
+    # Two gzip members (as in retention archives) and a bad line, fed in awkward chunks
+    lines = exported.splitlines(keepends=True)
+    archive = gzip.compress(b"".join(lines[:2])) + gzip.compress(lines[2] + b"not json\n")
+    report = bulk.import_stream(archive[i:i + 7] for i in range(0, len(archive), 7))
+    assert (report["imported"], report["skipped"], report["failed"]) == (3, 0, 1)
+    assert persistence.load_conversation("conv-1")["timestamp"] == "2025-01-02T00:00:00"
+    assert sorted(b"".join(bulk.export_ndjson()).splitlines()) == sorted(exported.splitlines())
+
+    again = bulk.import_stream([exported])
+    assert (again["imported"], again["skipped"]) == (0, 3)
+
+def test_model_analytics_rollups_are_incremental(monkeypatch, tmp_path):
+    """Saves update per-model rollups; a re-save replaces its earlier contribution"""
+    from app.engine import persistence
+    from app.engine.analytics import model_analytics
+
+
+    def run(intent, b_text, latency_b=200.0):
+        return {
+            "raw_input": "Q",
+            "normalized": {"intent": intent, "domain": "software", "explicit_constraints": {},
+                           "inferred_constraints": {}, "normalized_prompt": "Q"},
+            "model_responses": [
+                {"model_id": "a", "response_text": "Answer one two", "token_count": 3, "latency_ms": 100.0},
+                {"model_id": "b", "response_text": b_text, "token_count": 2, "latency_ms": latency_b},
+            ],
+            "peer_reviews": [{"reviewer_model": "x", "reviewed_model": "a", "accuracy_score": 9, "insight_score": 6,
+                              "constraint_adherence": 9, "feedback": ""}],
+            "scored_clusters": [{"cluster_id": "c1", "canonical_claim": "", "supporting_models": ["a"],
+                                 "conflicting_models": ["b"], "confidence_score": 0.5, "reasons": []}],
+        }
+
+    persistence.save_conversation(run("coding", "Fine answer"), "c1", timestamp="2025-03-01T10:00:00")
+    persistence.save_conversation(run("writing", "Error (groq): timeout"), "c2", timestamp="2025-03-02T10:00:00")
+    # A resume saves c2 again; it must not be counted twice
+    persistence.save_conversation(run("writing", "Error (groq): timeout", latency_b=400.0), "c2", timestamp="2025-03-02T10:00:00")
+
+    models = {m["model_id"]: m for m in model_analytics.models()}
+    assert models["a"]["responses"] == 2 and models["a"]["avg_review_score"] == 8.0
+    assert models["a"]["avg_latency_ms"] == 100.0 and models["a"]["support_rate"] == 1.0
+    assert models["b"]["errors"] == 1 and models["b"]["error_rate"] == 0.5
+    assert models["b"]["avg_latency_ms"] == 300.0 and models["b"]["avg_tokens"] == 2.0
+    assert models["b"]["conflicting"] == 2 and models["b"]["reviews"] == 0
+
+    by_day = model_analytics.models(model="b", group_by="day")
+    assert [(r["day"], r["errors"]) for r in by_day] == [("2025-03-01", 0), ("2025-03-02", 1)]
+    assert [m["model_id"] for m in model_analytics.models(intent="coding", since="2025-03-01", until="2025-03-01")] == ["a", "b"]
+    assert model_analytics.scores(intent="writing")["b"]["error_rate"] == 1.0
+
+    # A fresh rollup database is backfilled from the stored conversations
+    model_analytics.close()
+    monkeypatch.setattr(model_analytics, "path", str(tmp_path / "rebuilt.sqlite"))
+    rebuilt = {m["model_id"]: m for m in model_analytics.models()}
+    assert rebuilt == models
+
+def test_batch_runner_streams_results_and_resumes(monkeypatch, tmp_path):
+    """Batch results are appended as they finish; a rerun skips answered prompts and retries failures"""
+    from app.engine import batch
+    from app.models import GraphState, FinalConsensus
+
+    calls = []
+
+    class FakeEngine:
+        async def run(self, raw_input, model_count=4, use_cache=True, profile=None):
+            calls.append((raw_input, model_count))
+            if raw_input == "boom" and len(calls) < 4:
+                raise RuntimeError("provider down")
+            return GraphState(raw_input=raw_input, conversation_id=f"id-{raw_input}", consensus=FinalConsensus(
+                final_answer=raw_input.upper(), confidence=0.8, uncertain_areas=[], reasoning_trace=[]
+            ))
+
+    monkeypatch.setattr(batch, "AntigravityEngine", FakeEngine)
+    prompts = ["first", "", '{"id": "custom", "prompt": "second", "model_count": 2}', "boom"]
+    output = str(tmp_path / "results.ndjson")
+
+    report = batch.run_batch(batch.read_prompts(prompts), output, {"model_count": 3}, concurrency=2)
+    assert (report["completed"], report["failed"], report["skipped"]) == (2, 1, 0)
+    results = {r["key"]: r for r in map(json.loads, open(output))}
+    assert results["1"]["final_answer"] == "FIRST" and results["custom"]["conversation_id"] == "id-second"
+    assert results["4"]["error"] == "provider down"
+    assert sorted(calls) == [("boom", 3), ("first", 3), ("second", 2)]
+
+    # An interrupted write leaves a torn line, which the resume cuts off
+    with open(output, "a") as f:
+        f.write('{"key": "1", "prom')
+    report = batch.run_batch(batch.read_prompts(prompts), output, {"fields": ["consensus.final_answer"]})
+    assert (report["completed"], report["failed"], report["skipped"]) == (1, 0, 2)
+    lines = [json.loads(line) for line in open(output)]
+    assert lines[-1] == {"key": "4", "prompt": "boom", "state": {"consensus": {"final_answer": "BOOM"}},
+                         "duration_ms": lines[-1]["duration_ms"]}
+    assert len(lines) == 4
+
+@pytest.mark.asyncio
+async def test_cpu_pool_offloads_large_stages():
+    """Large clustering jobs leave the event loop thread; small ones and offload=off stay inline"""
+    import threading
+    from app.config import settings
+    from app.engine import synthesis
+    from app.engine.metrics import metrics
+    from app.engine.offload import cpu_pool
+
+    threads = []
+    real = synthesis.cluster_claims
+    def spy(*args):
+        threads.append(threading.current_thread())
+        return real(*args)
+
+    original = settings.get_engine_settings()
+    try:
+        synthesis.cluster_claims = spy
+        settings.set_engine_settings(original.model_copy(update={"cpu_offload": "thread", "cpu_offload_min_items": 5}))
+        small = [ClaimsResponse(model_id="a", claims=[AtomicClaim(claim_id="1", text="Use react")])]
+        large = [ClaimsResponse(model_id=m, claims=[AtomicClaim(claim_id=str(i), text="Use docker") for i in range(5)]) for m in "ab"]
+        before = metrics.snapshot().get("cpu_pool", {}).get("submitted", 0)
+        assert len(await detect_agreement(small)) == 1
+        clusters = await detect_agreement(large)
+        assert clusters[0].canonical_claim == "Topic: Deployment"
+        assert threads[0] is threading.current_thread() and threads[1] is not threading.current_thread()
+        assert metrics.snapshot()["cpu_pool"]["submitted"] == before + 1
+
+        # A lagging event loop offloads even small jobs
+        cpu_pool.lag_ms = 500
+        await detect_agreement(small)
+        assert threads[2] is not threading.current_thread()
+
+        settings.set_engine_settings(original.model_copy(update={"cpu_offload": "off"}))
+        await detect_agreement(large)
+        assert threads[3] is threading.current_thread()
+    finally:
+        cpu_pool.lag_ms = 0.0
+        synthesis.cluster_claims = real
+        settings.set_engine_settings(original)
+        cpu_pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_cassette_records_and_replays_provider_exchanges(tmp_path):
+    """Recorded exchanges replay offline, with scaled timings and no credentials on disk"""
+    import asyncio
+    import time
+    from openai import APIConnectionError, AsyncOpenAI, DefaultAsyncHttpxClient
+    from app.config import settings
+    from app.engine import cassette
+    from app.engine.key_pool import KeyPool, sdk_httpx as httpx
+    from app.engine.providers import ProviderFactory
+
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        return httpx.Response(200, json={
+            "id": "c1", "object": "chat.completion", "created": 0, "model": "llama-3.1-8b-instant",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": f"echo {prompt}"}}],
+        })
+
+    path = str(tmp_path / "providers.ndjson")
+    recorder = cassette.RecordingTransport(httpx.MockTransport(handler), cassette.Cassette(path), "groq")
+    live = AsyncOpenAI(api_key="gsk_secret_key", base_url="https://api.groq.com/openai/v1",
+                       http_client=DefaultAsyncHttpxClient(transport=recorder))
+    for prompt in ("first", "second"):
+        await live.chat.completions.create(model="llama-3.1-8b-instant", messages=[{"role": "user", "content": prompt}])
+    with open(path) as f:
+        recorded = f.read()
+    assert recorded.count("\n") == 2 and "gsk_secret_key" not in recorded
+
+    original = settings.get_engine_settings()
+    try:
+        settings.set_engine_settings(original.model_copy(update={
+            "provider_transport": "replay", "provider_cassette": path, "replay_time_scale": 0.0
+        }))
+        cassette.reset_cassettes()
+        client = KeyPool().client("groq", ProviderFactory.get_adapter("groq"), ["gsk_placeholder"])
+
+        async def ask(prompt):
+            started = time.perf_counter()
+            response = await client.chat.completions.create(
+                model="llama-3.1-8b-instant", messages=[{"role": "user", "content": prompt}]
+            )
+            return response.choices[0].message.content, time.perf_counter() - started
+
+        # Exact matches first, then unused recordings of the same model in order
+        assert (await ask("second"))[0] == "echo second"
+        answer, elapsed = await ask("a prompt that was never recorded")
+        assert answer == "echo first" and elapsed < 0.05
+        with pytest.raises(APIConnectionError):
+            await client.with_options(max_retries=0).chat.completions.create(
+                model="llama-3.1-8b-instant", messages=[{"role": "user", "content": "third"}]
+            )
+
+        settings.set_engine_settings(original.model_copy(update={
+            "provider_transport": "replay", "provider_cassette": path, "replay_time_scale": 2.0
+        }))
+        cassette.reset_cassettes()
+        client = KeyPool().client("groq", ProviderFactory.get_adapter("groq"), ["gsk_placeholder"])
+        assert (await ask("first"))[1] >= 0.1
+    finally:
+        settings.set_engine_settings(original)
+        cassette.reset_cassettes()
+
+def test_cli_run_prints_only_json(capsys):
+    """Engine progress goes to stderr so `cli run` output can be piped into a JSON parser"""
+    from app import cli
+
+    assert cli.main(["run", "Explain Python generators", "--model-count", "1", "--fields", "consensus.final_answer"]) == 0
+    captured = capsys.readouterr()
+    assert list(json.loads(captured.out)) == ["consensus"]
+    assert "--- Layer 1: Normalization ---" in captured.err
@@ -4,9 +4,18 @@ import { X, Clock, MessageSquare } from 'lucide-react';
 
 const API_URL = "http://localhost:8000";
 
+// History kept between panel openings; only changes since `cursor` are fetched again
+const historyCache = { cursor: null, conversations: [] };
+
+const mergeChanges = (conversations, changes, deleted) => {
+    const dropped = new Set([...deleted, ...changes.map((c) => c.id)]);
+    return [...changes, ...conversations.filter((c) => !dropped.has(c.id))]
+        .sort((a, b) => (b.timestamp || '').localeCompare(a.timestamp || ''));
+};
+
 export default function HistoryPanel({ onClose, onSelect }) {
-    const [conversations, setConversations] = useState([]);
-    const [loading, setLoading] = useState(true);
+    const [conversations, setConversations] = useState(historyCache.conversations);
+    const [loading, setLoading] = useState(historyCache.cursor === null);
 
     useEffect(() => {
         fetchConversations();
@@ -14,8 +23,23 @@ export default function HistoryPanel({ onClose, onSelect }) {
 
     const fetchConversations = async () => {
         try {
-            const response = await axios.get(`${API_URL}/conversations`);
-            setConversations(response.data);
+            if (historyCache.cursor === null) {
+                const response = await axios.get(`${API_URL}/conversations`);
+                historyCache.conversations = response.data;
+                historyCache.cursor = (response.headers.etag || '').replace(/"/g, '') || null;
+            } else {
+                const response = await axios.get(`${API_URL}/conversations`, {
+                    params: { since: historyCache.cursor },
+                    headers: { 'If-None-Match': `"${historyCache.cursor}"` },
+                    validateStatus: (status) => status === 200 || status === 304
+                });
+                if (response.status === 200) {
+                    const { cursor, reset, changes, deleted } = response.data;
+                    historyCache.conversations = reset ? changes : mergeChanges(historyCache.conversations, changes, deleted);
+                    historyCache.cursor = cursor;
+                }
+            }
+            setConversations(historyCache.conversations);
         } catch (err) {
             console.error('Failed to fetch conversations:', err);
         } finally {